@@ -0,0 +1,82 @@
+"""
+Microbenchmark for the compiled AlertEngine.
+
+Generates synthetic rule sets of growing size and times the batch API against
+a naive per-rule substring loop over the same descriptions.
+
+    python benchmarks/bench_alert_engine.py
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.alert_engine import AlertEngine
+
+VOCABULARY = [f"term{i}" for i in range(5000)]
+FILLER = ("a person walks across the parking lot near a parked vehicle while "
+          "security personnel watch the perimeter fence under street lights").split()
+
+
+def make_rules(n_rules: int, rng: random.Random):
+    rules = []
+    for i in range(n_rules):
+        groups = [rng.sample(VOCABULARY, 3) for _ in range(rng.choice([1, 2]))]
+        rules.append({
+            "id": f"rule_{i}",
+            "severity": "MEDIUM",
+            "type": f"Rule {i}",
+            "message": f"Rule {i} triggered",
+            "keywords": groups
+        })
+    return rules
+
+
+def make_descriptions(n: int, rng: random.Random):
+    descriptions = []
+    for i in range(n):
+        words = rng.sample(FILLER, 15) + rng.sample(VOCABULARY, 2)
+        rng.shuffle(words)
+        descriptions.append((" ".join(words), f"frame_{i}"))
+    return descriptions
+
+
+def naive_check(rules, description):
+    desc_lower = description.lower()
+    return [r for r in rules if all(any(t in desc_lower for t in group) for group in r["keywords"])]
+
+
+def main(n_descriptions: int = 5000):
+    rng = random.Random(0)
+    descriptions = make_descriptions(n_descriptions, rng)
+    print(f"{'rules':>6} {'compile ms':>11} {'batch ms':>9} {'per-desc us':>12} {'naive ms':>9}")
+    for n_rules in (4, 100, 300, 1000):
+        rules = make_rules(n_rules, rng)
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump({"rules": rules}, f)
+            path = f.name
+        try:
+            start = time.perf_counter()
+            engine = AlertEngine(rules_path=path, max_alerts=100)
+            compile_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            engine.check_batch(descriptions)
+            batch_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            for description, _ in descriptions:
+                naive_check(rules, description)
+            naive_ms = (time.perf_counter() - start) * 1000
+        finally:
+            os.remove(path)
+
+        print(f"{n_rules:>6} {compile_ms:>11.1f} {batch_ms:>9.1f} "
+              f"{batch_ms * 1000 / n_descriptions:>12.1f} {naive_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,24 @@
 import os
 import logging
 import base64
-import time
 from io import BytesIO
 from PIL import Image
 from groq import Groq
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+from typing import Any, List, Dict, Union, Optional, Tuple
 from dotenv import load_dotenv
+from .context_builder import estimate_tokens
+from .rate_limiter import RateLimiter
+from .frame_analysis import FRAME_ANALYSIS_PROMPT, parse_frame_analysis
 load_dotenv()
 
 class AIHandler:
     """Handles interactions with Groq API for LLM and SentenceTransformers for embeddings."""
     
-    def __init__(self):
+    FALLBACK_TITLE = "Untitled Video"
+    QUERY_ERROR = "Error processing your query"
+    
+    def __init__(self, embedding_model: Optional[str] = None):
         # Initialize Groq client
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
@@ -25,22 +30,19 @@ class AIHandler:
         self.vision_model = os.getenv("GROQ_VISION_MODEL", "meta-llama/llama-4-scout-17b-16e-instruct")
         
         # Rate limiting: 30 RPM = 2 seconds per request minimum
-        self.min_request_interval = 2.1  # Slightly over 2 seconds to be safe
-        self.last_request_time = 0
+        self.rate_limiter = RateLimiter(min_interval=2.1)  # Slightly over 2 seconds to be safe
         
         # Load SentenceTransformer for embeddings (still using local model for speed)
-        logging.info("Loading SentenceTransformer for embeddings...")
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.set_embedding_model(embedding_model or os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"))
         logging.info("AI handler initialized with Groq API.")
         
-    def generate_image_description(self, image: Image.Image, filename: str) -> str:
-        """Generates a description for a single image using Groq Vision API."""
+    def analyze_image(self, image: Image.Image, filename: str) -> Dict[str, Any]:
+        """
+        Analyzes a single image with the Groq Vision API as structured JSON: returns the
+        validated {"description", "person_count", "vehicle_count", "activities", "suspicious", "flags"}.
+        """
         # Rate limiting: ensure we don't exceed 30 RPM
-        elapsed = time.time() - self.last_request_time
-        if elapsed < self.min_request_interval:
-            sleep_time = self.min_request_interval - elapsed
-            logging.info(f"Rate limiting: sleeping for {sleep_time:.2f}s")
-            time.sleep(sleep_time)
+        self.rate_limiter.acquire()
         
         try:
             # Convert PIL Image to base64
@@ -63,48 +65,48 @@ class AIHandler:
                             },
                             {
                                 "type": "text",
-                                "text": (
-                                    "Analyze this image and provide a structured report. "
-                                    "1. Count people. "
-                                    "2. Identify activities (e.g., criminal, working, idle). "
-                                    "3. Describe poses and interactions. "
-                                    "4. Describe the environment. "
-                                    "5. Highlight suspicious behavior. "
-                                    f"Frame name: {filename}"
-                                )
+                                "text": f"{FRAME_ANALYSIS_PROMPT} Frame name: {filename}"
                             }
                         ]
                     }
                 ],
-                max_tokens=128,
-                temperature=0.7
+                response_format={"type": "json_object"},
+                # The JSON keys need some room on top of the description itself
+                max_tokens=256,
+                temperature=0.2
             )
             
-            self.last_request_time = time.time()  # Update last request time
-            return response.choices[0].message.content.strip()
+            self.rate_limiter.mark()  # Update last request time
+            return parse_frame_analysis(response.choices[0].message.content)
             
         except Exception as e:
-            self.last_request_time = time.time()  # Update even on error
+            self.rate_limiter.mark()  # Update even on error
             logging.error(f"Error describing image {filename}: {e}")
-            return "Error generating description."
+            return parse_frame_analysis("Error generating description.")
 
-    def generate_smart_title(self, video_info: Dict[str, str]) -> str:
-        """Generates a smart title based on video descriptions."""
-        # Rate limiting before title generation
-        elapsed = time.time() - self.last_request_time
-        if elapsed < self.min_request_interval:
-            sleep_time = self.min_request_interval - elapsed
-            logging.info(f"Rate limiting: sleeping for {sleep_time:.2f}s")
-            time.sleep(sleep_time)
+    def generate_image_description(self, image: Image.Image, filename: str) -> str:
+        """Generates a description for a single image using Groq Vision API."""
+        return self.analyze_image(image, filename)["description"]
+
+    def generate_smart_title(self, video_info: Union[Dict[str, str], List[str]],
+                             priority: int = RateLimiter.HIGH, max_tokens: int = 750) -> str:
+        """
+        Generates a smart title based on video descriptions (or segment summaries).
+        Descriptions are sampled evenly across the video and kept whole within a token budget.
+        """
+        descriptions = list(video_info.values()) if isinstance(video_info, dict) else list(video_info)
         
-        # Aggregate descriptions (limit length to avoid context overflow)
-        combined_text = ""
-        # Take a sample of frames (e.g., every 5th frame) to get a better overview if there are many
-        descriptions = list(video_info.values())
-        sample_descriptions = descriptions[::5] if len(descriptions) > 20 else descriptions
+        # Sample evenly across the video: double the stride until the sample fits the budget
+        step = 1
+        while True:
+            sample_descriptions = descriptions[::step]
+            if step >= len(descriptions) or sum(estimate_tokens(d) + 1 for d in sample_descriptions) <= max_tokens:
+                break
+            step *= 2
+        combined_text = "\n".join(sample_descriptions)
         
-        for desc in sample_descriptions:
-            combined_text += desc + "\n"
+        # Rate limiting before title generation
+        self.rate_limiter.acquire(priority)
         
         try:
             # Use Groq LLM to generate a title
@@ -131,7 +133,7 @@ class AIHandler:
                             "- 'Unauthorized Vehicle Access During Night Hours'\n"
                             "- 'Physical Confrontation in Parking Lot Zone B'\n"
                             "- 'Suspicious Package Abandoned at Loading Dock'\n\n"
-                            f"Video Frame Descriptions:\n{combined_text[:3000]}\n\n"
+                            f"Video Frame Descriptions:\n{combined_text}\n\n"
                             "Generate ONLY the title, nothing else:"
                         )
                     }
@@ -140,35 +142,119 @@ class AIHandler:
                 temperature=0.7
             )
             
-            self.last_request_time = time.time()
+            self.rate_limiter.mark()
             return response.choices[0].message.content.strip()
             
         except Exception as e:
-            self.last_request_time = time.time()
+            self.rate_limiter.mark()
             logging.error(f"Error generating title: {e}")
-            return "Untitled Video"
+            return self.FALLBACK_TITLE
 
-    def answer_query(self, query: str, context_data: str) -> str:
-        """Answers a user query based on the provided context using Groq."""
+    def summarize_descriptions(self, descriptions: List[str], scope: str = "segment") -> str:
+        """
+        Summarizes time-stamped frame descriptions (scope='segment') or segment
+        summaries (scope='video') into one compact summary for aggregate questions.
+        """
+        self.rate_limiter.acquire()
+        
+        source = "frame descriptions of one segment" if scope == "segment" else "segment summaries of the whole video"
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a security video analyst. Write factual summaries of drone security footage."
+                    },
+                    {
+                        "role": "user",
+                        "content": (
+                            f"Summarize the following time-stamped {source}.\n"
+                            "State the number of distinct people and vehicles (avoid double counting across frames), "
+                            "the activities that take place, the environment, and any suspicious events with their times.\n\n"
+                            + "\n".join(descriptions)
+                        )
+                    }
+                ],
+                max_tokens=200,
+                temperature=0.3
+            )
+            
+            self.rate_limiter.mark()
+            return response.choices[0].message.content.strip()
+            
+        except Exception as e:
+            self.rate_limiter.mark()
+            logging.error(f"Error summarizing {scope}: {e}")
+            return ""
+
+    def summarize_conversation(self, previous_summary: str, messages: List[Dict[str, str]],
+                               priority: int = RateLimiter.LOW) -> str:
+        """
+        Folds older chat turns into the running conversation summary (incremental compaction:
+        only the new turns and the previous summary are sent). Returns "" on error.
+        """
+        self.rate_limiter.acquire(priority)
+        
+        turns = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You maintain a compact memory of a conversation about a security video."
+                    },
+                    {
+                        "role": "user",
+                        "content": (
+                            f"Current summary: {previous_summary or '(none)'}\n\n"
+                            f"New turns:\n{turns}\n\n"
+                            "Rewrite the summary to include the new turns. Keep the questions asked, the facts "
+                            "established (counts, times, people, vehicles, events) and open follow-ups. "
+                            "At most 120 words."
+                        )
+                    }
+                ],
+                max_tokens=200,
+                temperature=0.3
+            )
+            
+            self.rate_limiter.mark()
+            return response.choices[0].message.content.strip()
+            
+        except Exception as e:
+            self.rate_limiter.mark()
+            logging.error(f"Error summarizing conversation: {e}")
+            return ""
+
+    def answer_query(self, query: str, context_data: str, history: Optional[List[Dict[str, str]]] = None,
+                     conversation_summary: str = "") -> str:
+        """
+        Answers a user query based on the provided context using Groq.
+        The context is expected to be already token-budgeted by ContextBuilder.
+        `history` holds the recent turns ({"role", "content"}) and `conversation_summary`
+        the compacted earlier ones, so follow-up questions keep their meaning.
+        """
         # Rate limiting before query
-        elapsed = time.time() - self.last_request_time
-        if elapsed < self.min_request_interval:
-            sleep_time = self.min_request_interval - elapsed
-            logging.info(f"Rate limiting: sleeping for {sleep_time:.2f}s")
-            time.sleep(sleep_time)
+        self.rate_limiter.acquire()
         
+        system_prompt = "You are a helpful video analysis assistant. Answer questions based on the provided video data."
+        if conversation_summary:
+            system_prompt += f"\nEarlier in this conversation: {conversation_summary}"
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {
                         "role": "system",
-                        "content": "You are a helpful video analysis assistant. Answer questions based on the provided video data."
+                        "content": system_prompt
                     },
+                    *(history or []),
                     {
                         "role": "user",
                         "content": (
-                            f"Data: {context_data[:3000]}\n\n"
+                            f"Data: {context_data}\n\n"
                             f"Query: {query}"
                         )
                     }
@@ -177,14 +263,33 @@ class AIHandler:
                 temperature=0.7
             )
             
-            self.last_request_time = time.time()
+            self.rate_limiter.mark()
             return response.choices[0].message.content.strip()
             
         except Exception as e:
-            self.last_request_time = time.time()
+            self.rate_limiter.mark()
             logging.error(f"Error answering query: {e}")
-            return f"Error processing your query: {str(e)}"
+            return f"{self.QUERY_ERROR}: {str(e)}"
+
+    def set_embedding_model(self, name: str, model: Optional[SentenceTransformer] = None):
+        """Switches the text embedding model (it must match the active vector collection)."""
+        if model is None:
+            logging.info(f"Loading SentenceTransformer {name} for embeddings...")
+            model = SentenceTransformer(name)
+        self.embedding_model = model
+        self.embedding_model_name = name
+        # Read as one reference by embed_tagged, so a concurrent switch cannot mislabel vectors
+        self._embedder = (name, model)
 
     def get_embedding(self, text: str) -> List[float]:
         """Generates a vector embedding for the given text."""
         return self.embedding_model.encode(text).tolist()
+
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generates vector embeddings for several texts in one batched forward pass."""
+        return self.embedding_model.encode(texts).tolist()
+
+    def embed_tagged(self, texts: List[str]) -> Tuple[List[List[float]], str]:
+        """Embeddings of `texts` and the name of the model that produced them."""
+        name, model = self._embedder
+        return model.encode(texts).tolist(), name
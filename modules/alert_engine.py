@@ -1,56 +1,219 @@
+import os
+import re
+import json
+import bisect
 import logging
-from typing import Dict, Any, Optional
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+from .semantic_rules import SemanticRuleMatcher
+from .telemetry import in_geofence
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "alert_rules.json")
+
+# Joins descriptions in batch mode; never part of a keyword and always a word boundary
+_BATCH_SEPARATOR = "\x00"
+
+
+def _normalize_term(term: str) -> str:
+    return " ".join(term.lower().split())
+
 
 class AlertEngine:
-    """Evaluates security rules based on AI analysis."""
-    def __init__(self):
-        self.alerts = []
-        
-    def check_rules(self, description: str, frame_name: str) -> Optional[Dict[str, Any]]:
-        """Checks predefined rules and returns an alert if triggered."""
-        desc_lower = description.lower()
-        
-        alert = None
-        
-        # Rule 1: Person in Restricted Zone
-        if "person" in desc_lower and "restricted" in desc_lower:
-            alert = {
-                "severity": "HIGH",
-                "type": "Security Breach",
-                "message": "Person detected in restricted area",
-                "frame": frame_name
-            }
-            
-        # Rule 2: Suspicious Activity Detection
-        elif "suspicious" in desc_lower or "suspicious behavior" in desc_lower:
-            alert = {
-                "severity": "MEDIUM",
-                "type": "Suspicious Activity",
-                "message": "Suspicious activity detected",
-                "frame": frame_name
-            }
-                
-        # Rule 3: Weapon detection (keyword based)
-        elif "weapon" in desc_lower or "gun" in desc_lower or "armed" in desc_lower:
-            alert = {
-                "severity": "CRITICAL",
-                "type": "Weapon Detected",
-                "message": "Potential weapon detected",
-                "frame": frame_name
-            }
-        
-        # Rule 4: Unauthorized Access
-        elif "trespassing" in desc_lower or "unauthorized" in desc_lower or "intrusion" in desc_lower:
-            alert = {
-                "severity": "HIGH",
-                "type": "Unauthorized Access",
-                "message": "Unauthorized access detected",
-                "frame": frame_name
-            }
-            
-        if alert:
-            self.alerts.append(alert)
-            logging.warning(f"ALERT TRIGGERED: {alert['message']}")
-            
-            return alert
-        return None
+    """
+    Evaluates security rules based on AI analysis.
+    Rules are loaded from a JSON config and compiled into a single word-boundary regex,
+    so every description is scanned once no matter how many rules exist.
+    Semantic rules (example phrases) are matched against description embeddings when
+    an `embed_fn` is given to embed the examples.
+    Any rule may add telemetry conditions ("geofence": [min_lat, min_lon, max_lat, max_lon],
+    "min_altitude", "max_altitude"); such rules only fire on frames whose telemetry satisfies them.
+    """
+    def __init__(self, rules_path: Optional[str] = None, max_alerts: Optional[int] = None,
+                 embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None):
+        self.rules_path = rules_path or os.getenv("ALERT_RULES_PATH", DEFAULT_RULES_PATH)
+        with open(self.rules_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+
+        self.rules: List[Dict[str, Any]] = config["rules"]
+        # Seconds within which repeated alerts of a rule are merged into one incident
+        default_window = config.get("default_debounce_seconds", 10.0)
+        self.debounce_windows = {
+            rule["id"]: rule.get("debounce_seconds", default_window)
+            for rule in self.rules + config.get("semantic_rules", [])
+        }
+        self.default_debounce_window = default_window
+        # Bounded buffer of the most recent alerts
+        self.alerts = deque(maxlen=max_alerts or config.get("max_alerts", 1000))
+        self._compile()
+
+        self.semantic_matcher = None
+        if embed_fn is not None and config.get("semantic_rules"):
+            self.semantic_matcher = SemanticRuleMatcher(config["semantic_rules"], embed_fn)
+
+    def _compile(self):
+        """Builds the multi-pattern matcher and the term -> (rule, keyword group) table."""
+        term_groups: Dict[str, set] = {}
+        self._required_masks = []
+        for rule_idx, rule in enumerate(self.rules):
+            groups = rule["keywords"]
+            self._required_masks.append((1 << len(groups)) - 1)
+            for group_idx, group in enumerate(groups):
+                for term in group:
+                    term_groups.setdefault(_normalize_term(term), set()).add((rule_idx, 1 << group_idx))
+
+        # The regex returns the longest alternative only ("suspicious behavior" hides
+        # "suspicious"), so each term also credits the shorter terms it contains.
+        terms = sorted(term_groups, key=len, reverse=True)
+        self._term_hits: Dict[str, List[Tuple[int, int]]] = {}
+        for term in terms:
+            hits = set(term_groups[term])
+            words = term.split()
+            # Contained terms are contiguous word runs of this one (dictionary lookups, not a scan)
+            for length in range(1, len(words)):
+                for start in range(len(words) - length + 1):
+                    hits |= term_groups.get(" ".join(words[start:start + length]), set())
+            self._term_hits[term] = sorted(hits)
+
+        alternatives = [r"\s+".join(re.escape(word) for word in term.split()) for term in terms]
+        self._pattern = re.compile(r"\b(?:" + "|".join(alternatives) + r")\b", re.IGNORECASE) if terms else None
+
+    def _record(self, rule: Dict[str, Any], frame_name: str, score: Optional[float] = None) -> Dict[str, Any]:
+        alert = {
+            "rule_id": rule["id"],
+            "severity": rule["severity"],
+            "type": rule["type"],
+            "message": rule["message"],
+            "frame": frame_name
+        }
+        if score is not None:
+            alert["score"] = round(score, 3)
+        self.alerts.append(alert)
+        logging.warning(f"ALERT TRIGGERED: {alert['message']}")
+        return alert
+
+    @staticmethod
+    def _telemetry_allows(rule: Dict[str, Any], telemetry: Optional[Dict[str, float]]) -> bool:
+        if "geofence" in rule and not in_geofence(telemetry, rule["geofence"]):
+            return False
+        altitude = telemetry.get("altitude") if telemetry else None
+        if "min_altitude" in rule and (altitude is None or altitude < rule["min_altitude"]):
+            return False
+        if "max_altitude" in rule and (altitude is None or altitude > rule["max_altitude"]):
+            return False
+        return True
+
+    def _evaluate(self, matched_terms: set, frame_name: str,
+                  semantic_hits: Optional[List[Tuple[Dict[str, Any], float]]] = None,
+                  telemetry: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+        masks: Dict[int, int] = {}
+        for term in matched_terms:
+            for rule_idx, group_bit in self._term_hits[term]:
+                masks[rule_idx] = masks.get(rule_idx, 0) | group_bit
+
+        triggered = [
+            self._record(self.rules[rule_idx], frame_name)
+            for rule_idx in sorted(masks)
+            if masks[rule_idx] == self._required_masks[rule_idx]
+            and self._telemetry_allows(self.rules[rule_idx], telemetry)
+        ]
+
+        # A semantic hit only adds an alert when no keyword rule already raised that type
+        seen_types = {alert["type"] for alert in triggered}
+        for rule, score in semantic_hits or []:
+            if rule["type"] not in seen_types and self._telemetry_allows(rule, telemetry):
+                seen_types.add(rule["type"])
+                triggered.append(self._record(rule, frame_name, score))
+        return triggered
+
+    def check_rules(self, description: str, frame_name: str,
+                    embedding: Optional[List[float]] = None,
+                    telemetry: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+        """
+        Checks all rules against one description and returns every triggered alert.
+        Semantic rules are evaluated when the description's embedding is provided,
+        telemetry conditions against the frame's telemetry.
+        """
+        semantic_hits = None
+        if embedding is not None and self.semantic_matcher is not None:
+            semantic_hits = self.semantic_matcher.match(embedding)
+
+        matched = set()
+        if self._pattern is not None:
+            matched = {_normalize_term(m.group(0)) for m in self._pattern.finditer(description)}
+        if not matched and not semantic_hits:
+            return []
+        return self._evaluate(matched, frame_name, semantic_hits, telemetry)
+
+    def check_batch(self, items: List[Tuple[str, str]], embeddings=None,
+                    telemetry: Optional[List[Optional[Dict[str, float]]]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Checks many (description, frame_name) pairs in one regex pass over their concatenation
+        and, when embeddings are given, one matrix product for the semantic rules.
+        Returns the triggered alerts of each item, in input order.
+        """
+        semantic_hits = [None] * len(items)
+        if embeddings is not None and self.semantic_matcher is not None and items:
+            semantic_hits = self.semantic_matcher.match_batch(embeddings)
+
+        matched: Dict[int, set] = {}
+        if self._pattern is not None and items:
+            starts = []
+            offset = 0
+            for description, _ in items:
+                starts.append(offset)
+                offset += len(description) + len(_BATCH_SEPARATOR)
+            text = _BATCH_SEPARATOR.join(description for description, _ in items)
+
+            for m in self._pattern.finditer(text):
+                item_idx = bisect.bisect_right(starts, m.start()) - 1
+                matched.setdefault(item_idx, set()).add(_normalize_term(m.group(0)))
+
+        telemetry = telemetry or [None] * len(items)
+        return [
+            self._evaluate(matched.get(idx, set()), frame_name, semantic_hits[idx], telemetry[idx])
+            if idx in matched or semantic_hits[idx] else []
+            for idx, (_, frame_name) in enumerate(items)
+        ]
+
+
+class AlertDebouncer:
+    """
+    Merges consecutive alerts of the same rule within one video into time-span incidents.
+    An alert extends the rule's open incident when it arrives within the rule's debounce
+    window of the incident's last occurrence; otherwise a new incident is persisted.
+    Without a `sqlite_handler` incidents are only collected (ids are None).
+    """
+    def __init__(self, sqlite_handler, video_uuid: str, alert_engine: AlertEngine):
+        self.sqlite_handler = sqlite_handler
+        self.video_uuid = video_uuid
+        self.alert_engine = alert_engine
+        self.incidents: List[Dict[str, Any]] = []
+        self._open: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, alert: Dict[str, Any], timestamp: float) -> Dict[str, Any]:
+        """Records an alert raised at `timestamp` and returns the incident it belongs to."""
+        rule_id = alert["rule_id"]
+        window = self.alert_engine.debounce_windows.get(rule_id, self.alert_engine.default_debounce_window)
+        incident = self._open.get(rule_id)
+
+        if incident is not None and timestamp - incident["end_time"] <= window:
+            incident["end_time"] = timestamp
+            incident["last_frame"] = alert["frame"]
+            incident["frame_count"] += 1
+            if self.sqlite_handler is not None:
+                self.sqlite_handler.extend_alert(incident["id"], timestamp, alert["frame"])
+            return incident
+
+        incident = dict(alert)
+        incident.update({
+            "id": self.sqlite_handler.add_alert(self.video_uuid, alert, timestamp) if self.sqlite_handler else None,
+            "start_time": timestamp,
+            "end_time": timestamp,
+            "first_frame": alert["frame"],
+            "last_frame": alert["frame"],
+            "frame_count": 1
+        })
+        self._open[rule_id] = incident
+        self.incidents.append(incident)
+        return incident
@@ -0,0 +1,76 @@
+import os
+import time
+from typing import BinaryIO, List, Optional, Dict, Any
+
+import requests
+
+
+class ApiClient:
+    """
+    Client for the HTTP service (modules.api_service), used by the Streamlit app when
+    VIDEO_API_URL is set. One keep-alive session is reused for every call; with
+    `timeout=None` the session's own timeout applies (e.g. a Starlette TestClient).
+    """
+
+    def __init__(self, base_url: Optional[str] = None, timeout: Optional[float] = 120.0, session=None):
+        self.base_url = (base_url or os.getenv("VIDEO_API_URL", "http://localhost:8080")).rstrip("/")
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        if self.timeout is not None:
+            kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        if 400 <= response.status_code < 500:
+            raise ValueError(response.json().get("detail", response.text))
+        response.raise_for_status()
+        return response.json()
+
+    def submit_video(self, video: BinaryIO, filename: str, telemetry: Optional[BinaryIO] = None,
+                     telemetry_filename: str = "telemetry.csv", telemetry_offset: float = 0.0,
+                     telemetry_time_unit: str = "seconds", profile: bool = False) -> Dict[str, Any]:
+        """Uploads a video for ingestion; returns {"job_id", "size", "sha256", "duplicate_of"}."""
+        files = {"video": (filename, video)}
+        if telemetry is not None:
+            files["telemetry"] = (telemetry_filename, telemetry)
+        data = {"telemetry_offset": str(telemetry_offset), "telemetry_time_unit": telemetry_time_unit,
+                "profile": str(profile).lower()}
+        return self._request("POST", "/videos", files=files, data=data)
+
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def wait_for_job(self, job_id: str, timeout: Optional[float] = None, poll_interval: float = 2.0) -> Dict[str, Any]:
+        """Polls a job until it is complete or failed (or `timeout` seconds pass)."""
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            job = self.get_job(job_id)
+            if job["status"] in ("complete", "failed") or (deadline and time.time() >= deadline):
+                return job
+            time.sleep(poll_interval)
+
+    def start_session(self, video_uuid: str) -> str:
+        return self._request("POST", f"/videos/{video_uuid}/sessions")["session_id"]
+
+    def query_video(self, video_uuid: str, query_text: str, session_id: Optional[str] = None,
+                    geofence: Optional[List[float]] = None, min_altitude: Optional[float] = None,
+                    max_altitude: Optional[float] = None, profile: bool = False) -> Dict[str, Any]:
+        """Same as VideoAnalysisEngine.query_video(..., return_sources=True): {"answer", "sources"}."""
+        return self._request("POST", f"/videos/{video_uuid}/query", json={
+            "query": query_text, "session_id": session_id, "geofence": geofence,
+            "min_altitude": min_altitude, "max_altitude": max_altitude, "profile": profile
+        })
+
+    def similar_frames(self, frame_id: int, n_results: int = 10, include_same_video: bool = False,
+                       min_similarity: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Same as VideoAnalysisEngine.find_similar_frames, without thumbnails."""
+        params = {"n_results": n_results, "include_same_video": str(include_same_video).lower()}
+        if min_similarity is not None:
+            params["min_similarity"] = min_similarity
+        return self._request("GET", f"/frames/{frame_id}/similar", params=params)["frames"]
+
+    def detect_changes(self, video_uuid: str, match_threshold: float = 0.80,
+                       change_threshold: float = 0.92) -> Dict[str, Any]:
+        """Same as VideoAnalysisEngine.detect_changes."""
+        return self._request("GET", f"/videos/{video_uuid}/changes",
+                             params={"match_threshold": match_threshold, "change_threshold": change_threshold})
@@ -0,0 +1,185 @@
+import os
+import uuid
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from pydantic import BaseModel
+
+from .sqlite_handler import SQLiteHandler
+from .telemetry import TelemetryTrack
+from .upload_spool import spool_upload
+
+
+class QueryRequest(BaseModel):
+    query: str
+    session_id: Optional[str] = None
+    geofence: Optional[List[float]] = None
+    min_altitude: Optional[float] = None
+    max_altitude: Optional[float] = None
+    profile: bool = False
+
+
+def create_app(engine_factory=None, sqlite_handler: Optional[SQLiteHandler] = None,
+               role: Optional[str] = None, ingest_workers: Optional[int] = None,
+               query_workers: Optional[int] = None, spool_dir: str = "temp_uploads") -> FastAPI:
+    """
+    Builds the HTTP service in front of VideoAnalysisEngine.
+
+    Ingestion is asynchronous: POST /videos spools the upload, queues a job on the
+    ingestion pool (INGEST_WORKERS threads) and returns its id; GET /jobs/{id} reports
+    progress. Queries run on a separate pool (QUERY_WORKERS threads) so they are never
+    stuck behind a long ingestion. SERVICE_ROLE ('all', 'ingest' or 'query') selects the
+    routes, so ingestion and query nodes can be scaled separately over a shared database.
+    The engine (and its models) is created once per process, on first use.
+    """
+    role = (role or os.getenv("SERVICE_ROLE", "all")).lower()
+    if role not in ("all", "ingest", "query"):
+        raise ValueError(f"Unknown SERVICE_ROLE: {role}")
+    sqlite_handler = sqlite_handler or SQLiteHandler()
+    ingest_pool = ThreadPoolExecutor(max_workers=ingest_workers or int(os.getenv("INGEST_WORKERS", 1)),
+                                     thread_name_prefix="ingest")
+    query_pool = ThreadPoolExecutor(max_workers=query_workers or int(os.getenv("QUERY_WORKERS", 8)),
+                                    thread_name_prefix="query")
+
+    engine_state: Dict[str, Any] = {}
+    engine_lock = threading.Lock()
+
+    def get_engine():
+        # Pool threads may race on the first request; the models must be loaded only once
+        with engine_lock:
+            if "engine" not in engine_state:
+                factory = engine_factory
+                if factory is None:
+                    from .video_analysis_engine import VideoAnalysisEngine
+                    factory = VideoAnalysisEngine
+                engine_state["engine"] = factory()
+            return engine_state["engine"]
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        # Queued ingestion jobs are cancelled: each is marked failed and its spooled upload
+        # removed (see on_job_done); the running ones finish before the process exits
+        ingest_pool.shutdown(wait=False, cancel_futures=True)
+        query_pool.shutdown(wait=False, cancel_futures=True)
+
+    app = FastAPI(title="Drone Security Agent API", lifespan=lifespan)
+
+    async def run_in(pool: Optional[ThreadPoolExecutor], fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(pool, lambda: fn(*args, **kwargs))
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "role": role}
+
+    # Plain def: FastAPI runs it on its threadpool, off the event loop
+    @app.get("/jobs/{job_id}")
+    def get_job(job_id: str):
+        job = sqlite_handler.get_job(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job")
+        return job
+
+    if role in ("all", "ingest"):
+        def remove_spooled(*paths: Optional[str]):
+            for path in paths:
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+        def on_job_done(job_id: str, video_path: str, telemetry_path: Optional[str], future):
+            # Jobs still queued at shutdown are cancelled by the pool and never run
+            if future.cancelled():
+                sqlite_handler.update_job(job_id, "failed", error="Service stopped before the job started")
+                remove_spooled(video_path, telemetry_path)
+
+        def run_ingestion(job_id: str, video_path: str, telemetry_path: Optional[str],
+                          telemetry_offset: float, telemetry_time_unit: str, filename: str, sha256: str,
+                          profile: bool):
+            sqlite_handler.update_job(job_id, "running")
+            try:
+                result = get_engine().process_video(video_path, telemetry_path=telemetry_path,
+                                                    telemetry_offset=telemetry_offset,
+                                                    telemetry_time_unit=telemetry_time_unit,
+                                                    video_filename=filename, sha256=sha256,
+                                                    profile=profile or None)
+                if not result:
+                    raise ValueError("Video could not be processed")
+                sqlite_handler.update_job(job_id, "complete", video_uuid=result["video_uuid"])
+            except Exception as e:
+                logging.error(f"Ingestion job {job_id} failed: {e}")
+                sqlite_handler.update_job(job_id, "failed", error=str(e))
+            finally:
+                remove_spooled(video_path, telemetry_path)
+
+        @app.post("/videos", status_code=202)
+        async def submit_video(video: UploadFile = File(...), telemetry: Optional[UploadFile] = File(None),
+                               telemetry_offset: float = Form(0.0), telemetry_time_unit: str = Form("seconds"),
+                               profile: bool = Form(False)):
+            if telemetry_time_unit not in TelemetryTrack.TIME_UNITS:
+                raise HTTPException(status_code=400, detail=f"Unknown telemetry time unit {telemetry_time_unit!r}")
+            # Spooling is blocking file I/O: keep it off the event loop
+            try:
+                spooled = await run_in(None, spool_upload, video.file, video.filename or "upload",
+                                       spool_dir, video.size)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            telemetry_path = None
+            if telemetry is not None:
+                try:
+                    telemetry_path = (await run_in(None, spool_upload, telemetry.file, telemetry.filename or "telemetry",
+                                                   spool_dir, telemetry.size))["path"]
+                except ValueError as e:
+                    os.remove(spooled["path"])
+                    raise HTTPException(status_code=400, detail=str(e))
+
+            job_id = str(uuid.uuid4())
+            duplicate = await run_in(None, sqlite_handler.find_video_by_hash, spooled["sha256"])
+            await run_in(None, sqlite_handler.add_job, job_id, "process_video", video.filename)
+            future = ingest_pool.submit(run_ingestion, job_id, spooled["path"], telemetry_path, telemetry_offset,
+                                        telemetry_time_unit, video.filename, spooled["sha256"], profile)
+            future.add_done_callback(lambda f: on_job_done(job_id, spooled["path"], telemetry_path, f))
+            return {"job_id": job_id, "size": spooled["size"], "sha256": spooled["sha256"],
+                    "duplicate_of": duplicate["uuid"] if duplicate else None}
+
+    if role in ("all", "query"):
+        @app.post("/videos/{video_uuid}/sessions")
+        async def start_session(video_uuid: str):
+            session_id = await run_in(query_pool, lambda: get_engine().conversation_memory.start_session(video_uuid))
+            return {"session_id": session_id}
+
+        @app.post("/videos/{video_uuid}/query")
+        async def query_video(video_uuid: str, request: QueryRequest):
+            if not await run_in(None, sqlite_handler.get_videos_by_uuids, [video_uuid]):
+                raise HTTPException(status_code=404, detail="Unknown video")
+            return await run_in(query_pool, lambda: get_engine().query_video(
+                video_uuid, request.query, geofence=request.geofence, min_altitude=request.min_altitude,
+                max_altitude=request.max_altitude, session_id=request.session_id, return_sources=True,
+                profile=request.profile or None
+            ))
+
+        @app.get("/frames/{frame_id}/similar")
+        async def similar_frames(frame_id: int, n_results: int = 10, include_same_video: bool = False,
+                                 min_similarity: Optional[float] = None):
+            try:
+                hits = await run_in(query_pool, lambda: get_engine().find_similar_frames(
+                    frame_id, n_results=n_results, include_same_video=include_same_video, min_similarity=min_similarity
+                ))
+            except ValueError as e:
+                raise HTTPException(status_code=404, detail=str(e))
+            # Thumbnails are binary; clients fetch images separately
+            return {"frames": [{key: value for key, value in hit.items() if key != "thumbnail"} for hit in hits]}
+
+        @app.get("/videos/{video_uuid}/changes")
+        async def detect_changes(video_uuid: str, match_threshold: float = 0.80, change_threshold: float = 0.92):
+            if not await run_in(None, sqlite_handler.get_videos_by_uuids, [video_uuid]):
+                raise HTTPException(status_code=404, detail="Unknown video")
+            return await run_in(query_pool, lambda: get_engine().detect_changes(
+                video_uuid, match_threshold=match_threshold, change_threshold=change_threshold
+            ))
+
+    return app
@@ -0,0 +1,128 @@
+import re
+import math
+import logging
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_TIMESTAMP_PREFIX = re.compile(r"^\[(\d+(?:\.\d+)?)s\]:\s*")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximates the LLM token count of a text without loading a tokenizer.
+    Punctuation counts as one token, words as one token per ~4 characters,
+    which tracks BPE tokenizers closely enough for budgeting.
+    """
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _TOKEN_PATTERN.findall(text))
+
+
+class ContextBuilder:
+    """Builds a token-budgeted, de-duplicated, time-ordered context from retrieved frames."""
+
+    def __init__(self, max_tokens: int = 900, min_results: int = 3, max_results: int = 20,
+                 duplicate_threshold: float = 0.8, gap_ratio: float = 0.4,
+                 token_counter: Optional[Callable[[str], int]] = None):
+        self.max_tokens = max_tokens
+        self.min_results = min_results
+        self.max_results = max_results
+        self.duplicate_threshold = duplicate_threshold
+        self.gap_ratio = gap_ratio
+        self.count_tokens = token_counter or estimate_tokens
+
+    def select_n_results(self, distances: List[float]) -> int:
+        """
+        Chooses how many candidates to keep from how spread out their distances are.
+        A clear jump in distance cuts the list there; a flat list keeps everything
+        and leaves the token budget to decide.
+        """
+        n = len(distances)
+        if n <= self.min_results:
+            return n
+
+        spread = distances[-1] - distances[0]
+        if spread <= 1e-9:
+            return n
+
+        best_gap, cut = 0.0, n
+        for i in range(self.min_results, n):
+            gap = distances[i] - distances[i - 1]
+            if gap > best_gap:
+                best_gap, cut = gap, i
+
+        return cut if best_gap >= self.gap_ratio * spread else n
+
+    @staticmethod
+    def _split_timestamp(document: str, metadata: Optional[Dict[str, Any]]) -> Tuple[float, str]:
+        """Returns (timestamp, description without the "[12.3s]:" prefix)."""
+        match = _TIMESTAMP_PREFIX.match(document)
+        body = document[match.end():] if match else document
+        if metadata and metadata.get("timestamp") is not None:
+            return float(metadata["timestamp"]), body
+        return (float(match.group(1)) if match else 0.0), body
+
+    def _is_duplicate(self, words: set, kept: List[set]) -> bool:
+        for other in kept:
+            union = len(words | other)
+            if union and len(words & other) / union >= self.duplicate_threshold:
+                return True
+        return False
+
+    def build(self, documents: List[str], metadatas: Optional[List[Dict[str, Any]]] = None,
+              distances: Optional[List[float]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Builds the context string from candidates sorted by relevance.
+        Returns the context and the selected entries (timestamp, document, metadata).
+        """
+        metadatas = metadatas or [{} for _ in documents]
+        n = self.select_n_results(distances) if distances else len(documents)
+
+        selected = []
+        kept_words: List[set] = []
+        used_tokens = 0
+        for document, metadata in zip(documents[:n], metadatas[:n]):
+            timestamp, body = self._split_timestamp(document, metadata)
+            words = set(re.findall(r"\w+", body.lower()))
+            if self._is_duplicate(words, kept_words):
+                continue
+
+            line = f"[{timestamp:.1f}s]: {body}"
+            # +1 for the separating newline
+            tokens = self.count_tokens(line) + 1
+            if used_tokens + tokens > self.max_tokens:
+                # A less relevant but shorter frame may still fit
+                continue
+
+            used_tokens += tokens
+            kept_words.append(words)
+            selected.append({"timestamp": timestamp, "document": line, "metadata": metadata})
+
+        selected.sort(key=lambda entry: entry["timestamp"])
+        logging.info(f"Context: {len(selected)}/{n} frames, ~{used_tokens} tokens (budget {self.max_tokens})")
+        return "\n".join(entry["document"] for entry in selected), selected
+
+    def build_summary_context(self, video_summary: Dict[str, Any],
+                              segment_results: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Context for whole-video questions: the video summary followed by the retrieved segment
+        summaries (query_summaries results) in time order, within the token budget. Returns
+        the context and the time ranges it was built from.
+        """
+        lines = [f"Whole video summary: {video_summary['summary']}"]
+        sources = []
+        used_tokens = self.count_tokens(lines[0])
+
+        if segment_results['documents']:
+            segments = sorted(zip(segment_results['documents'][0], segment_results['metadatas'][0]),
+                              key=lambda item: item[1]["start_time"])
+            for doc, meta in segments:
+                line = f"Segment [{meta['start_time']:.1f}s-{meta['end_time']:.1f}s]: {doc}"
+                tokens = self.count_tokens(line) + 1
+                if used_tokens + tokens > self.max_tokens:
+                    continue
+                used_tokens += tokens
+                lines.append(line)
+                sources.append({"type": "segment", "start_time": meta["start_time"], "end_time": meta["end_time"]})
+        if not sources:
+            sources.append({"type": "video", "start_time": video_summary["start_time"],
+                            "end_time": video_summary["end_time"]})
+        return "\n".join(lines), sources
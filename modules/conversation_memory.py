@@ -0,0 +1,88 @@
+import uuid
+import logging
+import threading
+from typing import Dict, List, Tuple, Optional, Callable
+
+from .context_builder import estimate_tokens
+
+class ConversationMemory:
+    """
+    Persisted chat history for follow-up questions.
+    Each answer sees the compacted summary of older turns plus the uncompacted recent turns.
+    Once more than `recent_messages + compact_batch` messages are uncompacted, the oldest
+    `compact_batch` are folded into the summary with one small Groq call, so the prompt
+    stays bounded however long the conversation gets.
+    """
+
+    def __init__(self, sqlite_handler, ai_handler, recent_messages: int = 6, compact_batch: int = 6,
+                 max_history_tokens: int = 600, token_counter: Optional[Callable[[str], int]] = None):
+        self.sqlite_handler = sqlite_handler
+        self.ai_handler = ai_handler
+        self.recent_messages = recent_messages
+        self.compact_batch = compact_batch
+        self.max_history_tokens = max_history_tokens
+        self.count_tokens = token_counter or estimate_tokens
+        self._lock = threading.Lock()
+
+    def start_session(self, video_uuid: str) -> str:
+        session_id = str(uuid.uuid4())
+        self.sqlite_handler.create_chat_session(session_id, video_uuid)
+        return session_id
+
+    def context(self, session_id: str) -> Tuple[List[Dict[str, str]], str]:
+        """
+        Returns (recent turns as chat messages, summary of the compacted turns).
+        Turns are only ever dropped by being folded into the summary: when the uncompacted
+        turns outgrow the window or the token budget (background compaction lagging or
+        failing), the oldest are compacted now, and if that fails they are all returned.
+        """
+        while True:
+            session = self.sqlite_handler.get_chat_session(session_id)
+            if session is None:
+                return [], ""
+            summarized_until = session["summarized_until"] or 0
+            pending = self.sqlite_handler.count_chat_messages(session_id, after_id=summarized_until)
+            messages = self.sqlite_handler.get_chat_messages_range(session_id, summarized_until, pending)
+            tokens = sum(self.count_tokens(message["content"]) + 4 for message in messages)
+            if len(messages) <= self.recent_messages + self.compact_batch and tokens <= self.max_history_tokens:
+                break
+            if not self.compact(session_id, force=True):
+                logging.warning(f"Chat session {session_id} could not be compacted; "
+                                f"keeping all {len(messages)} uncompacted messages")
+                break
+
+        history = [{"role": message["role"], "content": message["content"]} for message in messages]
+        return history, session["summary"] or ""
+
+    def record(self, session_id: str, question: str, answer: str, failed: bool = False):
+        """Stores a question and its answer; a failed answer (error text) is not kept as a turn."""
+        if failed:
+            return
+        self.sqlite_handler.add_chat_message(session_id, "user", question)
+        self.sqlite_handler.add_chat_message(session_id, "assistant", answer)
+
+    def compact(self, session_id: str, force: bool = False) -> bool:
+        """
+        Folds the oldest uncompacted turns into the summary when enough have accumulated
+        (with `force`, whenever there are any).
+        """
+        with self._lock:
+            session = self.sqlite_handler.get_chat_session(session_id)
+            if session is None:
+                return False
+            summarized_until = session["summarized_until"] or 0
+            pending = self.sqlite_handler.count_chat_messages(session_id, after_id=summarized_until)
+            if pending == 0 or (not force and pending <= self.recent_messages + self.compact_batch):
+                return False
+
+            batch = self.sqlite_handler.get_chat_messages_range(session_id, summarized_until, self.compact_batch)
+            summary = self.ai_handler.summarize_conversation(session["summary"] or "", batch)
+            if not summary:
+                return False
+            self.sqlite_handler.update_chat_summary(session_id, summary, batch[-1]["id"])
+            logging.info(f"Compacted {len(batch)} messages of chat session {session_id}")
+            return True
+
+    def compact_async(self, session_id: str):
+        """Runs `compact` on a background thread so answers are not delayed by it."""
+        threading.Thread(target=self.compact, args=(session_id,), daemon=True).start()
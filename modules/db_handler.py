@@ -1,44 +1,165 @@
 import chromadb
 import logging
-from typing import List
+from typing import List, Optional, Dict, Any
 
-class DBHandler:
-    """Handles ChromaDB operations."""
+from .vector_store import VectorStore, frame_metadata
+
+class DBHandler(VectorStore):
+    """Chroma vector store backend (HTTP server, or a local PersistentClient when none is reachable)."""
     
     def __init__(self, host: str, port: int, collection_name: str = "Video_Embeddings"):
         try:
             # Try connecting to HTTP client first as per original code
             self.client = chromadb.HttpClient(host=host, port=port)
-        except:
-            logging.warning("Could not connect to ChromaDB HTTP server. Falling back to local PersistentClient.")
+        except Exception as e:
+            logging.warning(f"Could not connect to ChromaDB HTTP server ({e}). Falling back to local PersistentClient.")
             self.client = chromadb.PersistentClient(path="./chroma_db")
             
         self.collection = self.client.get_or_create_collection(name=collection_name)
+        # Segment/video summaries live apart so frame queries never mix them in
+        self.summary_collection = self.client.get_or_create_collection(name=f"{collection_name}_Summaries")
 
     def add_entry(self, video_uuid: str, video_filename: str, frame_name: str, 
-                 smart_name: str, description: str, embedding: List[float], file_path: str = ""):
-        
+                 smart_name: str, description: str, embedding: List[float], file_path: str = "",
+                 timestamp: float = 0.0, created_at: Optional[float] = None,
+                 telemetry: Optional[Dict[str, float]] = None):
+        metadata = frame_metadata(video_uuid, video_filename, frame_name, smart_name, file_path,
+                                  timestamp, created_at, telemetry)
         self.collection.add(
             ids=[f"{video_uuid}_{frame_name}"],
             embeddings=[embedding],
             documents=[description],
+            metadatas=[metadata]
+        )
+
+    @staticmethod
+    def _build_where(conditions: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    @staticmethod
+    def _telemetry_conditions(geofence: Optional[List[float]] = None, min_altitude: Optional[float] = None,
+                              max_altitude: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Metadata filters for a geofence [min_lat, min_lon, max_lat, max_lon] and an altitude range."""
+        conditions: List[Dict[str, Any]] = []
+        if geofence:
+            min_lat, min_lon, max_lat, max_lon = geofence
+            conditions += [
+                {"latitude": {"$gte": float(min_lat)}}, {"latitude": {"$lte": float(max_lat)}},
+                {"longitude": {"$gte": float(min_lon)}}, {"longitude": {"$lte": float(max_lon)}}
+            ]
+        if min_altitude is not None:
+            conditions.append({"altitude": {"$gte": float(min_altitude)}})
+        if max_altitude is not None:
+            conditions.append({"altitude": {"$lte": float(max_altitude)}})
+        return conditions
+
+    def query(self, query_embedding: List[float], video_uuid: str, n_results: int = 5,
+              geofence: Optional[List[float]] = None, min_altitude: Optional[float] = None,
+              max_altitude: Optional[float] = None):
+        conditions = [{"video_uuid": video_uuid}] + self._telemetry_conditions(geofence, min_altitude, max_altitude)
+        return self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            where=self._build_where(conditions),
+            include=["documents", "metadatas", "distances"]
+        )
+        
+    def query_many(self, query_embeddings: List[List[float]], video_uuid: str, n_results: int = 5,
+                   geofence: Optional[List[float]] = None, min_altitude: Optional[float] = None,
+                   max_altitude: Optional[float] = None):
+        """Several queries against one video in a single Chroma call."""
+        conditions = [{"video_uuid": video_uuid}] + self._telemetry_conditions(geofence, min_altitude, max_altitude)
+        return self.collection.query(
+            query_embeddings=[list(embedding) for embedding in query_embeddings],
+            n_results=n_results,
+            where=self._build_where(conditions),
+            include=["documents", "metadatas", "distances"]
+        )
+        
+    def search_library(self, query_embedding: List[float], n_results: int = 100,
+                       created_after: Optional[float] = None, created_before: Optional[float] = None,
+                       geofence: Optional[List[float]] = None, min_altitude: Optional[float] = None,
+                       max_altitude: Optional[float] = None):
+        """
+        Queries across all videos in one vector index lookup, optionally filtered by upload
+        date, geofence and altitude.
+        """
+        conditions: List[Dict[str, Any]] = []
+        if created_after is not None:
+            conditions.append({"created_at": {"$gte": float(created_after)}})
+        if created_before is not None:
+            conditions.append({"created_at": {"$lte": float(created_before)}})
+        conditions += self._telemetry_conditions(geofence, min_altitude, max_altitude)
+
+        return self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            where=self._build_where(conditions),
+            include=["documents", "metadatas", "distances"]
+        )
+
+    def add_summary_entry(self, video_uuid: str, summary_id: int, level: str,
+                          start_time: float, end_time: float, summary: str, embedding: List[float]):
+        self.summary_collection.add(
+            ids=[f"{video_uuid}_summary_{summary_id}"],
+            embeddings=[embedding],
+            documents=[summary],
             metadatas=[{
                 "video_uuid": video_uuid,
-                "video_file_name": video_filename,
-                "frame_name": frame_name,
-                "filename_plus_uuid": f"{video_filename}_{video_uuid}",
-                "smart_name": smart_name,
-                "file_path": file_path
+                "level": level,
+                "start_time": float(start_time),
+                "end_time": float(end_time)
             }]
         )
 
-    def query(self, query_embedding: List[float], video_uuid: str, n_results: int = 5):
-        return self.collection.query(
+    def query_summaries(self, query_embedding: List[float], video_uuid: str, level: str = "segment",
+                        n_results: int = 3):
+        return self.summary_collection.query(
             query_embeddings=[query_embedding],
             n_results=n_results,
-            where={"video_uuid": video_uuid},
-            include=["documents", "metadatas"]
+            where={"$and": [{"video_uuid": video_uuid}, {"level": level}]},
+            include=["documents", "metadatas", "distances"]
         )
-        
+
+    def get_entries(self, video_uuid: str, summaries: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Retrieves the stored embeddings, documents and metadata of a video, keyed by Chroma id
+        (frame entries, or summary entries with `summaries=True`).
+        """
+        collection = self.summary_collection if summaries else self.collection
+        result = collection.get(where={"video_uuid": video_uuid}, include=["embeddings", "documents", "metadatas"])
+        return {
+            entry_id: {"embedding": embedding, "document": document, "metadata": metadata}
+            for entry_id, embedding, document, metadata in zip(
+                result["ids"], result["embeddings"], result["documents"], result["metadatas"]
+            )
+        }
+
+    def add_entries(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]],
+                    summaries: bool = False, batch_size: int = 1000):
+        """Bulk-adds precomputed entries (no embedding model involved), in batches."""
+        collection = self.summary_collection if summaries else self.collection
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            collection.add(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                documents=documents[start:end],
+                metadatas=metadatas[start:end]
+            )
+
+    def delete_entries(self, video_uuid: str, frame_names: List[str]):
+        """Deletes individual frame entries of a video."""
+        if frame_names:
+            self.collection.delete(ids=[f"{video_uuid}_{frame_name}" for frame_name in frame_names])
+
+    def delete_summary_entries(self, video_uuid: str, summary_ids: List[int]):
+        """Deletes individual summary entries of a video."""
+        if summary_ids:
+            self.summary_collection.delete(ids=[f"{video_uuid}_summary_{summary_id}" for summary_id in summary_ids])
+
     def delete_video(self, video_uuid: str):
         self.collection.delete(where={'video_uuid': video_uuid})
+        self.summary_collection.delete(where={'video_uuid': video_uuid})
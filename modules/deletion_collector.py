@@ -0,0 +1,87 @@
+import time
+import logging
+import threading
+from typing import Optional
+
+from .sqlite_handler import SQLiteHandler
+from .embedding_archive import EmbeddingArchive
+from .frame_index import FrameIndex
+
+class DeletionCollector:
+    """
+    Purges tombstoned videos in a background thread.
+    Frames are removed in batches (Chroma ids first, then the SQLite rows, so an interrupted
+    purge simply resumes), followed by the summaries, alerts, chat history and the video row.
+    Each pass ends with an incremental vacuum so the freed frame BLOB pages leave the disk.
+    """
+
+    def __init__(self, sqlite_handler: SQLiteHandler, db_handler, embedding_archive: Optional[EmbeddingArchive] = None,
+                 batch_size: int = 500, interval: float = 30.0, frame_index: Optional[FrameIndex] = None):
+        self.sqlite_handler = sqlite_handler
+        self.db_handler = db_handler
+        self.embedding_archive = embedding_archive
+        self.frame_index = frame_index
+        self.batch_size = batch_size
+        self.interval = interval
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        # Videos tombstoned before a restart are picked up on the first pass
+        self._thread = threading.Thread(target=self._run, name="deletion-collector", daemon=True)
+        self._thread.start()
+
+    def delete(self, video_uuid: str):
+        """Tombstones a video (hidden immediately) and schedules its purge."""
+        self.sqlite_handler.tombstone_video(video_uuid)
+        self._idle.clear()
+        self._wake.set()
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """Blocks until every tombstoned video is purged. Returns False on timeout."""
+        return self._idle.wait(timeout)
+
+    def purge(self, video_uuid: str) -> int:
+        """Removes all data of one video; returns the number of frames deleted."""
+        frames = 0
+        while True:
+            frame_ids = self.sqlite_handler.get_frame_ids(video_uuid, limit=self.batch_size)
+            if not frame_ids:
+                break
+            self.db_handler.delete_entries(video_uuid, [str(frame_id) for frame_id in frame_ids])
+            self.sqlite_handler.delete_frames(frame_ids)
+            frames += len(frame_ids)
+
+        self.db_handler.delete_summary_entries(video_uuid, self.sqlite_handler.get_summary_ids(video_uuid))
+        if self.embedding_archive is not None:
+            self.embedding_archive.delete(video_uuid)
+        if self.frame_index is not None:
+            self.frame_index.delete_video(video_uuid)
+        self.sqlite_handler.delete_video(video_uuid)
+        return frames
+
+    def collect(self) -> int:
+        """Purges every tombstoned video, then vacuums. Returns the number of videos purged."""
+        purged = 0
+        for video_uuid in self.sqlite_handler.get_deleted_video_uuids():
+            start = time.time()
+            try:
+                frames = self.purge(video_uuid)
+            except Exception as e:
+                logging.error(f"Error purging video {video_uuid}: {e}")
+                continue
+            purged += 1
+            logging.info(f"Purged video {video_uuid} ({frames} frames) in {time.time() - start:.2f}s")
+        if purged:
+            pages = self.sqlite_handler.incremental_vacuum()
+            logging.info(f"Vacuum released {pages} free pages")
+        return purged
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                self.collect()
+            except Exception as e:
+                logging.error(f"Deletion collector error: {e}")
+            if not self._wake.is_set():
+                self._idle.set()
+            self._wake.wait(self.interval)
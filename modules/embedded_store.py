@@ -0,0 +1,447 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import numpy as np
+from typing import List, Optional, Dict, Any, Tuple
+
+from .vector_store import VectorStore, frame_metadata
+
+try:
+    import hnswlib
+except ImportError:  # Optional: library-wide search falls back to an exact scan
+    hnswlib = None
+
+
+class _Entries:
+    """
+    The frame or summary entries of one video: a contiguous float32 matrix memory-mapped
+    from `<name>.f32`, with ids, documents and metadata from `<name>.jsonl` (one line per row).
+    `signature` identifies the file state they were read from, so other processes' writes
+    can be noticed.
+    """
+
+    def __init__(self, directory: str, name: str):
+        self.vectors_path = os.path.join(directory, f"{name}.f32")
+        self.rows_path = os.path.join(directory, f"{name}.jsonl")
+        # Taken before reading: a write landing meanwhile changes it and is picked up next time
+        self.signature = _Entries.signature_of(directory, name)
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        dim = None
+        if os.path.exists(self.rows_path):
+            with open(self.rows_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # A row still being appended
+                    row = json.loads(line)
+                    self.ids.append(row["id"])
+                    self.documents.append(row["document"])
+                    self.metadatas.append(row["metadata"])
+                    dim = row.get("dim", dim)
+
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        if self.ids and os.path.exists(self.vectors_path):
+            size = os.path.getsize(self.vectors_path)
+            # Rows written before the dimension was recorded: the file holds exactly their vectors
+            dim = dim or size // (4 * len(self.ids))
+            # A row is written after its vector, so a torn append leaves at most unlisted vector bytes
+            count = min(len(self.ids), size // (4 * dim)) if dim else 0
+            del self.ids[count:], self.documents[count:], self.metadatas[count:]
+            if count:
+                self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(count, dim))
+        else:
+            self.ids, self.documents, self.metadatas = [], [], []
+        self.rows = {entry_id: i for i, entry_id in enumerate(self.ids)}
+        self.sq_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def signature_of(directory: str, name: str) -> Optional[Tuple[int, int, int]]:
+        rows_path = os.path.join(directory, f"{name}.jsonl")
+        vectors_path = os.path.join(directory, f"{name}.f32")
+        try:
+            rows = os.stat(rows_path)
+            vectors = os.stat(vectors_path)
+        except FileNotFoundError:
+            return None
+        return rows.st_mtime_ns, rows.st_size, vectors.st_size
+
+    def column(self, key: str) -> np.ndarray:
+        """A numeric metadata field as a float64 array (NaN where missing)."""
+        if key not in self._columns:
+            self._columns[key] = np.array(
+                [m.get(key, np.nan) if isinstance(m.get(key), (int, float)) else np.nan for m in self.metadatas],
+                dtype=np.float64
+            )
+        return self._columns[key]
+
+    def distances(self, query: np.ndarray) -> np.ndarray:
+        """Squared L2 distances of every row to `query` (same metric as Chroma's default)."""
+        return self.sq_norms - 2.0 * (self.vectors @ query) + float(query @ query)
+
+    @staticmethod
+    def append(directory: str, name: str, ids: List[str], vectors: np.ndarray,
+               documents: List[str], metadatas: List[Dict[str, Any]]):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{name}.f32"), "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(os.path.join(directory, f"{name}.jsonl"), "a", encoding="utf-8") as f:
+            dim = int(vectors.shape[1]) if vectors.ndim == 2 else None
+            for entry_id, document, metadata in zip(ids, documents, metadatas):
+                f.write(json.dumps({"id": entry_id, "document": document, "metadata": metadata, "dim": dim}) + "\n")
+
+    def rewrite(self, keep: np.ndarray) -> "_Entries":
+        """
+        Rewrites the files with only the rows in the boolean mask `keep` and returns the new
+        entries. This object is left untouched: concurrent readers holding it keep querying
+        the old rows (their memory map outlives the replaced file).
+        """
+        directory, name = os.path.split(self.vectors_path)
+        name = name[:-len(".f32")]
+        rows = np.flatnonzero(keep)
+        if not rows.size:
+            for path in (self.vectors_path, self.rows_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return _Entries(directory, name)
+        # Written beside the live files, then moved over them
+        tmp_name = f"{name}.rewrite"
+        for ext in (".f32", ".jsonl"):
+            if os.path.exists(os.path.join(directory, tmp_name + ext)):
+                os.remove(os.path.join(directory, tmp_name + ext))
+        _Entries.append(directory, tmp_name, [self.ids[i] for i in rows], np.array(self.vectors[rows]),
+                        [self.documents[i] for i in rows], [self.metadatas[i] for i in rows])
+        os.replace(os.path.join(directory, f"{tmp_name}.f32"), self.vectors_path)
+        os.replace(os.path.join(directory, f"{tmp_name}.jsonl"), self.rows_path)
+        return _Entries(directory, name)
+
+
+def _matches(metadata: Dict[str, Any], where: Dict[str, Tuple[Optional[float], Optional[float]]]) -> bool:
+    for key, (low, high) in where.items():
+        value = metadata.get(key)
+        if value is None or (low is not None and value < low) or (high is not None and value > high):
+            return False
+    return True
+
+
+class EmbeddedVectorStore(VectorStore):
+    """
+    Serverless vector store. Each video's embeddings are a contiguous float32 matrix on disk,
+    memory-mapped on first use, and per-video queries are an exact numpy top-k
+    (one matrix-vector product plus argpartition). Library-wide search uses an HNSW index
+    over every frame when `hnswlib` is installed (the `ann` extra), built lazily and updated
+    incrementally; otherwise, or with `use_ann=False`, it scans the per-video matrices exactly.
+    Cached entries are checked against their files on every use, so writes made by other
+    processes (a separate ingest node) are seen by the next query; videos added or removed
+    elsewhere reach the ANN index within `refresh_interval` seconds.
+    """
+
+    def __init__(self, root: str = "vector_store", ann_ef: int = 64, use_ann: Optional[bool] = None,
+                 refresh_interval: float = 5.0):
+        self.root = root
+        self.ann_ef = ann_ef
+        self.refresh_interval = refresh_interval
+        if use_ann and hnswlib is None:
+            raise ValueError("use_ann requires hnswlib (pip install hnswlib)")
+        self.use_ann = hnswlib is not None if use_ann is None else use_ann
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.RLock()
+        self._cache: Dict[Tuple[str, str], _Entries] = {}
+        # Library ANN index: label -> (video_uuid, entry id); built on first library search
+        self._ann = None
+        self._ann_labels: List[Tuple[str, str]] = []
+        self._ann_by_id: Dict[str, int] = {}
+        self._ann_refreshed_at = 0.0
+
+    def _directory(self, video_uuid: str) -> str:
+        return os.path.join(self.root, video_uuid)
+
+    def _entries(self, video_uuid: str, name: str = "frames") -> _Entries:
+        with self._lock:
+            cached = self._cache.get((video_uuid, name))
+            if cached is not None and cached.signature == _Entries.signature_of(self._directory(video_uuid), name):
+                return cached
+            # First use, or the files changed (possibly written by another process)
+            entries = self._cache[(video_uuid, name)] = _Entries(self._directory(video_uuid), name)
+            if name == "frames" and self._ann is not None:
+                self._ann_sync(video_uuid, cached, entries)
+            return entries
+
+    def _video_uuids(self) -> List[str]:
+        return [d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d))]
+
+    @staticmethod
+    def _result(entries_and_rows: List[Tuple[_Entries, int, float]]) -> Dict[str, Any]:
+        return {
+            "ids": [[entries.ids[row] for entries, row, _ in entries_and_rows]],
+            "documents": [[entries.documents[row] for entries, row, _ in entries_and_rows]],
+            "metadatas": [[entries.metadatas[row] for entries, row, _ in entries_and_rows]],
+            "distances": [[float(distance) for _, _, distance in entries_and_rows]]
+        }
+
+    @staticmethod
+    def _telemetry_where(geofence: Optional[List[float]], min_altitude: Optional[float],
+                         max_altitude: Optional[float]) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+        where: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+        if geofence:
+            min_lat, min_lon, max_lat, max_lon = geofence
+            where["latitude"] = (min_lat, max_lat)
+            where["longitude"] = (min_lon, max_lon)
+        if min_altitude is not None or max_altitude is not None:
+            where["altitude"] = (min_altitude, max_altitude)
+        return where
+
+    @staticmethod
+    def _mask(entries: _Entries, where: Dict[str, Tuple[Optional[float], Optional[float]]],
+              mask: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        if where:
+            mask = np.ones(len(entries), dtype=bool) if mask is None else mask
+            for key, (low, high) in where.items():
+                column = entries.column(key)
+                # NaN (missing) never satisfies a range
+                mask &= ~np.isnan(column)
+                if low is not None:
+                    mask &= column >= low
+                if high is not None:
+                    mask &= column <= high
+        return mask
+
+    @classmethod
+    def _top_k(cls, entries: _Entries, query: Optional[np.ndarray], n_results: int,
+               where: Dict[str, Tuple[Optional[float], Optional[float]]], mask: Optional[np.ndarray] = None,
+               distances: Optional[np.ndarray] = None):
+        if not len(entries):
+            return []
+        if distances is None:
+            distances = entries.distances(query)
+        mask = cls._mask(entries, where, mask)
+        candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(entries))
+        if not candidates.size:
+            return []
+        k = min(n_results, candidates.size)
+        subset = distances[candidates]
+        best = np.argpartition(subset, k - 1)[:k] if k < subset.size else np.arange(subset.size)
+        best = best[np.argsort(subset[best], kind="stable")]
+        return [(entries, int(candidates[i]), subset[i]) for i in best]
+
+    # Writes
+
+    def add_entry(self, video_uuid: str, video_filename: str, frame_name: str,
+                  smart_name: str, description: str, embedding: List[float], file_path: str = "",
+                  timestamp: float = 0.0, created_at: Optional[float] = None,
+                  telemetry: Optional[Dict[str, float]] = None):
+        metadata = frame_metadata(video_uuid, video_filename, frame_name, smart_name, file_path,
+                                  timestamp, created_at, telemetry)
+        self.add_entries([f"{video_uuid}_{frame_name}"], [embedding], [description], [metadata])
+
+    def add_summary_entry(self, video_uuid: str, summary_id: int, level: str,
+                          start_time: float, end_time: float, summary: str, embedding: List[float]):
+        self.add_entries(
+            [f"{video_uuid}_summary_{summary_id}"], [embedding], [summary],
+            [{"video_uuid": video_uuid, "level": level, "start_time": float(start_time), "end_time": float(end_time)}],
+            summaries=True
+        )
+
+    def add_entries(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]],
+                    summaries: bool = False, batch_size: int = 1000):
+        name = "summaries" if summaries else "frames"
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        by_video: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            by_video.setdefault(metadata["video_uuid"], []).append(i)
+        with self._lock:
+            for video_uuid, rows in by_video.items():
+                _Entries.append(self._directory(video_uuid), name, [ids[i] for i in rows], vectors[rows],
+                                [documents[i] for i in rows], [metadatas[i] for i in rows])
+                self._cache.pop((video_uuid, name), None)
+                if not summaries and self._ann is not None:
+                    self._ann_add(video_uuid, [ids[i] for i in rows], vectors[rows])
+
+    def _delete_ids(self, video_uuid: str, name: str, ids: List[str]):
+        with self._lock:
+            entries = self._entries(video_uuid, name)
+            doomed = set(ids)
+            keep = np.array([entry_id not in doomed for entry_id in entries.ids], dtype=bool)
+            if keep.all():
+                return
+            # Swapped in whole: queries already holding the old entries are unaffected
+            self._cache[(video_uuid, name)] = entries.rewrite(keep)
+            if name == "frames":
+                self._ann_delete([entry_id for entry_id in entries.ids if entry_id in doomed])
+
+    def delete_entries(self, video_uuid: str, frame_names: List[str]):
+        if frame_names:
+            self._delete_ids(video_uuid, "frames", [f"{video_uuid}_{frame_name}" for frame_name in frame_names])
+
+    def delete_summary_entries(self, video_uuid: str, summary_ids: List[int]):
+        if summary_ids:
+            self._delete_ids(video_uuid, "summaries", [f"{video_uuid}_summary_{summary_id}" for summary_id in summary_ids])
+
+    def delete_video(self, video_uuid: str):
+        with self._lock:
+            entries = self._entries(video_uuid)
+            self._ann_delete(list(entries.ids))
+            for name in ("frames", "summaries"):
+                self._cache.pop((video_uuid, name), None)
+            del entries
+            shutil.rmtree(self._directory(video_uuid), ignore_errors=True)
+
+    # Reads
+
+    def query(self, query_embedding: List[float], video_uuid: str, n_results: int = 5,
+              geofence: Optional[List[float]] = None, min_altitude: Optional[float] = None,
+              max_altitude: Optional[float] = None):
+        query = np.asarray(query_embedding, dtype=np.float32)
+        where = self._telemetry_where(geofence, min_altitude, max_altitude)
+        return self._result(self._top_k(self._entries(video_uuid), query, n_results, where))
+
+    def query_many(self, query_embeddings: List[List[float]], video_uuid: str, n_results: int = 5,
+                   geofence: Optional[List[float]] = None, min_altitude: Optional[float] = None,
+                   max_altitude: Optional[float] = None):
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        entries = self._entries(video_uuid)
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if not len(entries):
+            for key in results:
+                results[key] = [[] for _ in range(len(queries))]
+            return results
+        # One matrix product for every query, one filter mask shared by all of them
+        matrix = entries.sq_norms[:, None] - 2.0 * (entries.vectors @ queries.T) + (queries * queries).sum(axis=1)[None, :]
+        mask = self._mask(entries, self._telemetry_where(geofence, min_altitude, max_altitude))
+        for i in range(len(queries)):
+            result = self._result(self._top_k(entries, None, n_results, {}, mask=None if mask is None else mask.copy(),
+                                              distances=matrix[:, i]))
+            for key in results:
+                results[key].append(result[key][0])
+        return results
+
+    def query_summaries(self, query_embedding: List[float], video_uuid: str, level: str = "segment",
+                        n_results: int = 3):
+        entries = self._entries(video_uuid, "summaries")
+        mask = np.array([m.get("level") == level for m in entries.metadatas], dtype=bool)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        return self._result(self._top_k(entries, query, n_results, {}, mask=mask))
+
+    def get_entries(self, video_uuid: str, summaries: bool = False) -> Dict[str, Dict[str, Any]]:
+        entries = self._entries(video_uuid, "summaries" if summaries else "frames")
+        return {
+            entry_id: {"embedding": np.array(entries.vectors[i]), "document": entries.documents[i],
+                       "metadata": entries.metadatas[i]}
+            for i, entry_id in enumerate(entries.ids)
+        }
+
+    def search_library(self, query_embedding: List[float], n_results: int = 100,
+                       created_after: Optional[float] = None, created_before: Optional[float] = None,
+                       geofence: Optional[List[float]] = None, min_altitude: Optional[float] = None,
+                       max_altitude: Optional[float] = None):
+        query = np.asarray(query_embedding, dtype=np.float32)
+        where = self._telemetry_where(geofence, min_altitude, max_altitude)
+        if created_after is not None or created_before is not None:
+            where["created_at"] = (created_after, created_before)
+
+        with self._lock:
+            if self.use_ann:
+                return self._result(self._ann_search(query, n_results, where))
+            # Exact fallback: per-video top-k, merged
+            hits = []
+            for video_uuid in self._video_uuids():
+                hits += self._top_k(self._entries(video_uuid), query, n_results, where)
+            hits.sort(key=lambda hit: hit[2])
+            return self._result(hits[:n_results])
+
+    # Library ANN index (hnswlib)
+
+    def _ann_build(self):
+        vectors, ids, owners = [], [], []
+        for video_uuid in self._video_uuids():
+            entries = self._entries(video_uuid)
+            if len(entries):
+                vectors.append(np.asarray(entries.vectors))
+                ids += entries.ids
+                owners += [video_uuid] * len(entries)
+        dim = vectors[0].shape[1] if vectors else 0
+        self._ann = hnswlib.Index(space="l2", dim=dim) if dim else None
+        self._ann_labels, self._ann_by_id = [], {}
+        if self._ann is None:
+            return
+        self._ann.init_index(max_elements=max(1024, 2 * len(ids)), ef_construction=200, M=16)
+        self._ann.set_ef(self.ann_ef)
+        start = time.time()
+        self._ann_add_labels(owners, ids, np.vstack(vectors))
+        self._ann_refreshed_at = time.time()
+        logging.info(f"Built library ANN index over {len(ids)} frames in {time.time() - start:.2f}s")
+
+    def _ann_add_labels(self, owners: List[str], ids: List[str], vectors: np.ndarray):
+        first = len(self._ann_labels)
+        needed = first + len(ids)
+        if needed > self._ann.get_max_elements():
+            self._ann.resize_index(2 * needed)
+        self._ann.add_items(vectors, np.arange(first, needed))
+        for label, (owner, entry_id) in enumerate(zip(owners, ids), start=first):
+            self._ann_labels.append((owner, entry_id))
+            self._ann_by_id[entry_id] = label
+
+    def _ann_add(self, video_uuid: str, ids: List[str], vectors: np.ndarray):
+        if self._ann.dim != vectors.shape[1]:
+            self._ann = None  # Rebuilt on the next search
+            return
+        self._ann_add_labels([video_uuid] * len(ids), ids, vectors)
+
+    def _ann_sync(self, video_uuid: str, previous: Optional[_Entries], entries: _Entries):
+        """Brings the ANN index in line with a video's reloaded entries."""
+        if previous is not None:
+            current = set(entries.ids)
+            self._ann_delete([entry_id for entry_id in previous.ids if entry_id not in current])
+        added = [row for row, entry_id in enumerate(entries.ids) if entry_id not in self._ann_by_id]
+        if added:
+            self._ann_add(video_uuid, [entries.ids[row] for row in added], np.asarray(entries.vectors[added]))
+
+    def _ann_refresh(self):
+        """Loads videos written or removed by other processes since the last look."""
+        on_disk = set(self._video_uuids())
+        for video_uuid, name in list(self._cache):
+            if name == "frames" and video_uuid not in on_disk:
+                self._entries(video_uuid)
+        for video_uuid in on_disk:
+            self._entries(video_uuid)
+        self._ann_refreshed_at = time.time()
+
+    def _ann_delete(self, ids: List[str]):
+        if self._ann is None:
+            return
+        for entry_id in ids:
+            label = self._ann_by_id.pop(entry_id, None)
+            if label is not None:
+                self._ann.mark_deleted(label)
+
+    def _ann_search(self, query: np.ndarray, n_results: int,
+                    where: Dict[str, Tuple[Optional[float], Optional[float]]]):
+        if self._ann is None:
+            self._ann_build()
+        elif time.time() - self._ann_refreshed_at >= self.refresh_interval:
+            self._ann_refresh()
+        if self._ann is None or not self._ann_by_id:
+            return []
+        live = len(self._ann_by_id)
+        # Filters are applied to the candidates; widen the candidate set until enough pass
+        k = min(live, n_results if not where else n_results * 4)
+        while True:
+            self._ann.set_ef(max(self.ann_ef, k))
+            labels, distances = self._ann.knn_query(query, k=k)
+            hits = []
+            for label, distance in zip(labels[0], distances[0]):
+                video_uuid, entry_id = self._ann_labels[label]
+                entries = self._entries(video_uuid)
+                row = entries.rows.get(entry_id)
+                if row is not None and _matches(entries.metadatas[row], where):
+                    hits.append((entries, row, distance))
+            if len(hits) >= n_results or k >= live:
+                return hits[:n_results]
+            k = min(live, k * 4)
@@ -0,0 +1,110 @@
+import os
+import logging
+import numpy as np
+from typing import List, Optional, Tuple
+
+DEFAULT_ARCHIVE_DIR = "embeddings"
+
+
+class EmbeddingArchiveWriter:
+    """
+    Appends the DINO embedding of every sampled frame to a raw float16 file while a video
+    is ingested. Timestamps are kept in memory and written next to it on `close`.
+    """
+
+    def __init__(self, embeddings_path: str, timestamps_path: str):
+        self.embeddings_path = embeddings_path
+        self.timestamps_path = timestamps_path
+        self.dim: Optional[int] = None
+        self.timestamps: List[float] = []
+        self._file = open(embeddings_path + ".part", "wb")
+
+    def append(self, embeddings, timestamps: List[float]):
+        vectors = np.asarray(embeddings, dtype=np.float16)
+        if vectors.ndim != 2 or vectors.shape[0] != len(timestamps):
+            raise ValueError("Expected one embedding row per timestamp")
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension changed from {self.dim} to {vectors.shape[1]}")
+        self._file.write(np.ascontiguousarray(vectors).tobytes())
+        self.timestamps.extend(float(t) for t in timestamps)
+
+    def abort(self):
+        """Discards a partial archive (failed ingestion)."""
+        if self._file.closed:
+            return
+        self._file.close()
+        os.remove(self.embeddings_path + ".part")
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        if not self.timestamps:
+            os.remove(self.embeddings_path + ".part")
+            return
+        # The timestamps file is written last, so a readable archive is always complete
+        os.replace(self.embeddings_path + ".part", self.embeddings_path)
+        np.save(self.timestamps_path, np.asarray(self.timestamps, dtype=np.float64))
+        logging.info(f"Archived {len(self.timestamps)} DINO embeddings ({self.dim}-d float16) to {self.embeddings_path}")
+
+
+class EmbeddingArchive:
+    """
+    Per-video archive of the DINO embeddings of all sampled frames:
+    `<uuid>.f16` holds the (frames, dim) float16 matrix and `<uuid>_timestamps.npy` the
+    frame timestamps. Reads are memory-mapped, so keyframe selection can be rerun
+    without decoding or embedding the video again.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.getenv("EMBEDDING_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _paths(self, video_uuid: str) -> Tuple[str, str]:
+        return (os.path.join(self.root, f"{video_uuid}.f16"),
+                os.path.join(self.root, f"{video_uuid}_timestamps.npy"))
+
+    def writer(self, video_uuid: str) -> EmbeddingArchiveWriter:
+        return EmbeddingArchiveWriter(*self._paths(video_uuid))
+
+    def exists(self, video_uuid: str) -> bool:
+        return all(os.path.exists(path) for path in self._paths(video_uuid))
+
+    def load(self, video_uuid: str) -> Optional[Tuple[np.ndarray, np.memmap]]:
+        """Returns (timestamps, memory-mapped float16 embeddings), or None if not archived."""
+        if not self.exists(video_uuid):
+            return None
+        embeddings_path, timestamps_path = self._paths(video_uuid)
+        timestamps = np.load(timestamps_path)
+        if not timestamps.size:
+            return None
+        dim = os.path.getsize(embeddings_path) // (timestamps.size * np.dtype(np.float16).itemsize)
+        embeddings = np.memmap(embeddings_path, dtype=np.float16, mode="r", shape=(timestamps.size, dim))
+        return timestamps, embeddings
+
+    def delete(self, video_uuid: str):
+        for path in self._paths(video_uuid):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def select_keyframes(embeddings, threshold: float = 0.90, chunk_size: int = 4096) -> List[int]:
+    """
+    Replays the ingestion keyframe rule over archived embeddings: a frame becomes a keyframe
+    when its cosine similarity to the current keyframe is below `threshold`.
+    Returns the selected row indices. Rows are normalized chunk by chunk, so memory stays
+    bounded for long videos.
+    """
+    selected: List[int] = []
+    base = None
+    for start in range(0, len(embeddings), chunk_size):
+        chunk = np.asarray(embeddings[start:start + chunk_size], dtype=np.float32)
+        chunk /= np.linalg.norm(chunk, axis=1, keepdims=True) + 1e-6
+        for offset, vector in enumerate(chunk):
+            if base is not None and float(vector @ base) >= threshold:
+                continue
+            base = vector
+            selected.append(start + offset)
+    return selected
@@ -0,0 +1,86 @@
+import re
+import json
+from typing import Any, Dict, List, Optional
+
+# Counts above this are treated as a misread rather than stored
+MAX_COUNT = 1000
+MAX_LABELS = 10
+MAX_LABEL_LENGTH = 40
+
+FRAME_ANALYSIS_PROMPT = (
+    "Analyze this drone surveillance image and reply with a single JSON object only, with keys: "
+    '"description" (2-3 sentences on people, poses, interactions and the environment), '
+    '"person_count" (integer number of people visible), '
+    '"vehicle_count" (integer number of vehicles visible), '
+    '"activities" (list of short activity labels, e.g. "walking", "working", "idle"), '
+    '"suspicious" (true or false), '
+    '"suspicion_flags" (list of short labels for suspicious behavior, e.g. "loitering", "trespassing"; empty if none).'
+)
+
+
+def _count(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not re.fullmatch(r"\d+(\.0+)?", value):
+            return None
+        value = float(value)
+    if isinstance(value, (int, float)) and float(value).is_integer() and 0 <= value <= MAX_COUNT:
+        return int(value)
+    return None
+
+
+def _labels(value: Any) -> List[str]:
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list):
+        return []
+    labels = []
+    for item in value:
+        if not isinstance(item, str):
+            continue
+        label = re.sub(r"\s+", " ", item).strip().lower()[:MAX_LABEL_LENGTH]
+        if label and label not in labels:
+            labels.append(label)
+    return labels[:MAX_LABELS]
+
+
+def _flag(value: Any) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "yes", "false", "no"):
+        return value.strip().lower() in ("true", "yes")
+    return None
+
+
+def parse_frame_analysis(text: str) -> Dict[str, Any]:
+    """
+    Validates the vision model's JSON reply into {"description", "person_count",
+    "vehicle_count", "activities", "suspicious", "flags"}. Fields that are missing or
+    malformed come back as None (counts, suspicious) or [] (labels); a reply that is not
+    JSON at all is kept whole as the description, so ingestion never loses the text.
+    """
+    analysis = {"description": (text or "").strip(), "person_count": None, "vehicle_count": None,
+                "activities": [], "suspicious": None, "flags": []}
+    # Models sometimes wrap the object in a code fence or a sentence
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    if not match:
+        return analysis
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return analysis
+    if not isinstance(data, dict):
+        return analysis
+
+    if isinstance(data.get("description"), str) and data["description"].strip():
+        analysis["description"] = data["description"].strip()
+    analysis["person_count"] = _count(data.get("person_count"))
+    analysis["vehicle_count"] = _count(data.get("vehicle_count"))
+    analysis["activities"] = _labels(data.get("activities"))
+    analysis["flags"] = _labels(data.get("suspicion_flags"))
+    analysis["suspicious"] = _flag(data.get("suspicious"))
+    if analysis["suspicious"] is None and analysis["flags"]:
+        analysis["suspicious"] = True
+    return analysis
@@ -0,0 +1,384 @@
+import os
+import json
+import time
+import logging
+import threading
+import numpy as np
+from typing import Callable, Dict, Any, List, Optional, Sequence, Tuple
+
+try:
+    import hnswlib
+except ImportError:  # Optional: queries fall back to an exact scan
+    hnswlib = None
+
+DEFAULT_INDEX_DIR = "frame_index"
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors.reshape(-1, vectors.shape[-1])
+    return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-6)
+
+
+class FrameIndex:
+    """
+    Library-wide index of keyframe DINO embeddings, for "every time we passed this spot"
+    and change detection between passes. Each video's normalized vectors are appended at
+    ingest to `<uuid>.f16` (raw float16) with `<uuid>.jsonl` rows ({"frame_id", "timestamp"});
+    the in-memory index over all videos (HNSW with inner product when `hnswlib` is
+    installed, an exact matrix product otherwise, or with `use_ann=False`) is loaded lazily
+    and follows the files, so videos ingested by other processes show up within
+    `refresh_interval` seconds. Labels of removed keyframes are compacted away once they
+    outnumber the live ones. Similarities are cosine similarities.
+    """
+
+    # Dead labels below this are left in place; compaction rebuilds the in-memory index
+    COMPACT_MIN_DEAD = 1024
+
+    def __init__(self, root: Optional[str] = None, ann_ef: int = 64, refresh_interval: float = 5.0,
+                 use_ann: Optional[bool] = None):
+        self.root = root or os.getenv("FRAME_INDEX_DIR", DEFAULT_INDEX_DIR)
+        self.ann_ef = ann_ef
+        self.refresh_interval = refresh_interval
+        if use_ann and hnswlib is None:
+            raise ValueError("use_ann requires hnswlib (pip install hnswlib)")
+        self.use_ann = hnswlib is not None if use_ann is None else use_ann
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.RLock()
+        self._ann = None
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        # label -> (video_uuid, frame_id, timestamp); dead labels are None
+        self._labels: List[Optional[Tuple[str, int, float]]] = []
+        self._by_frame: Dict[int, int] = {}
+        # video_uuid -> (rows file mtime_ns and size, labels of its rows in file order)
+        self._videos: Dict[str, Tuple[Tuple[int, int], List[int]]] = {}
+        self._refreshed_at = 0.0
+
+    def _paths(self, video_uuid: str) -> Tuple[str, str]:
+        return os.path.join(self.root, f"{video_uuid}.f16"), os.path.join(self.root, f"{video_uuid}.jsonl")
+
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, int]]:
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self, video_uuid: str) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        vectors_path, rows_path = self._paths(video_uuid)
+        if not os.path.exists(rows_path):
+            return [], np.zeros((0, 0), dtype=np.float32)
+        with open(rows_path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        if not rows or not os.path.exists(vectors_path):
+            return [], np.zeros((0, 0), dtype=np.float32)
+        dim = rows[0]["dim"]
+        vectors = np.fromfile(vectors_path, dtype=np.float16)
+        # A row is written after its vector, so a torn append leaves at most an unlisted vector
+        count = min(len(rows), vectors.size // dim)
+        return rows[:count], vectors[:count * dim].reshape(count, dim).astype(np.float32)
+
+    # Writes
+
+    def add(self, video_uuid: str, frame_ids: Sequence[int], timestamps: Sequence[float], vectors):
+        """Appends keyframes (SQLite frame IDs, timestamps, DINO embeddings) of a video."""
+        if not len(frame_ids):
+            return
+        vectors = _normalize(vectors)
+        if vectors.shape[0] != len(frame_ids) or len(timestamps) != len(frame_ids):
+            raise ValueError("Expected one embedding and timestamp per frame")
+        vectors_path, rows_path = self._paths(video_uuid)
+        rows = [{"frame_id": int(frame_id), "timestamp": float(timestamp), "dim": int(vectors.shape[1])}
+                for frame_id, timestamp in zip(frame_ids, timestamps)]
+        text = "".join(json.dumps(row) + "\n" for row in rows).encode("utf-8")
+        with self._lock:
+            before = self._signature(rows_path)
+            with open(vectors_path, "ab") as f:
+                f.write(vectors.astype(np.float16).tobytes())
+            with open(rows_path, "ab") as f:
+                f.write(text)
+            if not self._refreshed_at:
+                # Not loaded yet: the first query reads the files
+                return
+            known = self._videos.get(video_uuid)
+            after = self._signature(rows_path)
+            in_step = before == (known[0] if known else None)
+            if in_step and after[1] == (before[1] if before else 0) + len(text):
+                # Only our rows were appended since the last look: index them without re-reading the files
+                labels = known[1] if known else []
+                self._videos[video_uuid] = (after, labels + self._add_labels(video_uuid, rows, vectors))
+            else:
+                self._sync_video(video_uuid)
+
+    def delete_frames(self, video_uuid: str, frame_ids: Sequence[int]):
+        """Removes single keyframes (re-keyframing); the video's files are rewritten without them."""
+        removed = {int(frame_id) for frame_id in frame_ids}
+        if not removed:
+            return
+        vectors_path, rows_path = self._paths(video_uuid)
+        with self._lock:
+            rows, vectors = self._read(video_uuid)
+            keep = [i for i, row in enumerate(rows) if row["frame_id"] not in removed]
+            if len(keep) == len(rows):
+                return
+            if not keep:
+                self.delete_video(video_uuid)
+                return
+            vectors[keep].astype(np.float16).tofile(vectors_path + ".tmp")
+            with open(rows_path + ".tmp", "w", encoding="utf-8") as f:
+                for i in keep:
+                    f.write(json.dumps(rows[i]) + "\n")
+            os.replace(vectors_path + ".tmp", vectors_path)
+            os.replace(rows_path + ".tmp", rows_path)
+            self._sync_video(video_uuid)
+
+    def delete_video(self, video_uuid: str):
+        with self._lock:
+            for path in self._paths(video_uuid):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._drop_video(video_uuid)
+
+    def indexed(self, video_uuid: str) -> bool:
+        return os.path.exists(self._paths(video_uuid)[1])
+
+    # In-memory index
+
+    def _drop_video(self, video_uuid: str):
+        _, labels = self._videos.pop(video_uuid, (None, []))
+        for label in labels:
+            entry = self._labels[label]
+            if entry is not None:
+                self._by_frame.pop(entry[1], None)
+                self._labels[label] = None
+                self._alive[label] = False
+                if self._ann is not None:
+                    self._ann.mark_deleted(label)
+        dead = len(self._labels) - len(self._by_frame)
+        if dead >= max(self.COMPACT_MIN_DEAD, len(self._by_frame)):
+            self._compact()
+
+    def _compact(self):
+        """Rebuilds the in-memory index over the live labels only, renumbering them."""
+        live = [label for label, entry in enumerate(self._labels) if entry is not None]
+        renumbered = {label: i for i, label in enumerate(live)}
+        vectors = self._vectors[live].copy() if live else np.zeros((0, 0), dtype=np.float32)
+        self._labels = [self._labels[label] for label in live]
+        self._vectors = vectors
+        self._alive = np.ones(len(live), dtype=bool)
+        self._by_frame = {entry[1]: i for i, entry in enumerate(self._labels)}
+        self._videos = {video_uuid: (signature, [renumbered[label] for label in labels if label in renumbered])
+                        for video_uuid, (signature, labels) in self._videos.items()}
+        self._ann = None
+        if self.use_ann and live:
+            self._ann = hnswlib.Index(space="ip", dim=vectors.shape[1])
+            self._ann.init_index(max_elements=max(1024, 2 * len(live)), ef_construction=200, M=16)
+            self._ann.add_items(vectors, np.arange(len(live)))
+
+    def _add_labels(self, video_uuid: str, rows: List[Dict[str, Any]], vectors: np.ndarray) -> List[int]:
+        if not rows:
+            return []
+        if self._vectors.shape[1] not in (0, vectors.shape[1]):
+            logging.warning(f"Frame index: skipping {video_uuid}, embedding dimension {vectors.shape[1]} "
+                            f"differs from {self._vectors.shape[1]}")
+            return []
+        first = len(self._labels)
+        needed = first + len(rows)
+        if needed > self._vectors.shape[0]:
+            grown = np.zeros((max(1024, 2 * needed), vectors.shape[1]), dtype=np.float32)
+            if first:
+                grown[:first] = self._vectors[:first]
+            self._vectors = grown
+            self._alive = np.concatenate([self._alive[:first], np.zeros(grown.shape[0] - first, dtype=bool)])
+        self._vectors[first:needed] = vectors
+        self._alive[first:needed] = True
+        if self.use_ann:
+            if self._ann is None:
+                self._ann = hnswlib.Index(space="ip", dim=vectors.shape[1])
+                self._ann.init_index(max_elements=self._vectors.shape[0], ef_construction=200, M=16)
+            elif needed > self._ann.get_max_elements():
+                self._ann.resize_index(self._vectors.shape[0])
+            self._ann.add_items(vectors, np.arange(first, needed))
+        for row in rows:
+            self._by_frame[row["frame_id"]] = len(self._labels)
+            self._labels.append((video_uuid, row["frame_id"], row["timestamp"]))
+        return list(range(first, needed))
+
+    def _sync_video(self, video_uuid: str):
+        rows_path = self._paths(video_uuid)[1]
+        if not os.path.exists(rows_path):
+            self._drop_video(video_uuid)
+            return
+        signature = self._signature(rows_path)
+        known = self._videos.get(video_uuid)
+        if known is not None and known[0] == signature:
+            return
+        rows, vectors = self._read(video_uuid)
+        labels = known[1] if known else []
+        indexed = [self._labels[label][1] if self._labels[label] else None for label in labels]
+        if indexed == [row["frame_id"] for row in rows[:len(labels)]]:
+            # Appended since the last look: index only the new rows
+            labels = labels + self._add_labels(video_uuid, rows[len(labels):], vectors[len(labels):])
+        else:
+            self._drop_video(video_uuid)
+            labels = self._add_labels(video_uuid, rows, vectors)
+        self._videos[video_uuid] = (signature, labels)
+
+    def _refresh(self, force: bool = False):
+        if not force and time.time() - self._refreshed_at < self.refresh_interval:
+            return
+        start = time.time()
+        on_disk = {name[:-len(".jsonl")] for name in os.listdir(self.root) if name.endswith(".jsonl")}
+        for video_uuid in set(self._videos) - on_disk:
+            self._drop_video(video_uuid)
+        for video_uuid in sorted(on_disk):
+            self._sync_video(video_uuid)
+        self._refreshed_at = time.time()
+        if time.time() - start > 0.5:
+            logging.info(f"Refreshed frame index ({len(self._by_frame)} keyframes) in {time.time() - start:.2f}s")
+
+    # Queries
+
+    def _search(self, query: np.ndarray, n_results: int,
+                accept: Optional[Callable[[Tuple[str, int, float]], bool]] = None) -> List[Tuple[int, float]]:
+        """(label, similarity) of the nearest live keyframes that pass `accept`, best first."""
+        live = len(self._by_frame)
+        if not live or n_results <= 0:
+            return []
+        # Filters are applied to the candidates; widen the candidate set until enough pass
+        k = min(live, n_results if accept is None else n_results * 4)
+        if self._ann is None:
+            # Dead labels keep their rows; push them below every live score
+            scores = np.where(self._alive[:len(self._labels)], self._vectors[:len(self._labels)] @ query, -np.inf)
+            while True:
+                top = np.argpartition(-scores, k - 1)[:k] if k < scores.size else np.arange(scores.size)
+                top = top[np.argsort(-scores[top])]
+                hits = [(int(label), float(scores[label])) for label in top
+                        if self._labels[label] is not None and (accept is None or accept(self._labels[label]))]
+                if len(hits) >= n_results or k >= live:
+                    return hits[:n_results]
+                k = min(live, k * 4)
+        while True:
+            self._ann.set_ef(max(self.ann_ef, k))
+            labels, distances = self._ann.knn_query(query, k=k)
+            hits = []
+            for label, distance in zip(labels[0], distances[0]):
+                entry = self._labels[label]
+                if entry is not None and (accept is None or accept(entry)):
+                    # hnswlib "ip" distance is 1 - inner product
+                    hits.append((int(label), 1.0 - float(distance)))
+            if len(hits) >= n_results or k >= live:
+                return hits[:n_results]
+            k = min(live, k * 4)
+
+    def _hit(self, label: int, similarity: float) -> Dict[str, Any]:
+        video_uuid, frame_id, timestamp = self._labels[label]
+        return {"video_uuid": video_uuid, "frame_id": frame_id, "timestamp": timestamp, "similarity": similarity}
+
+    def query(self, vector, n_results: int = 10, exclude_videos: Optional[Sequence[str]] = None,
+              videos: Optional[Sequence[str]] = None, min_similarity: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Keyframes most similar to a DINO embedding across the library, best first:
+        [{"video_uuid", "frame_id", "timestamp", "similarity"}], optionally restricted to
+        (`videos`) or excluding (`exclude_videos`) some videos.
+        """
+        query = _normalize(vector)[0]
+        allowed = set(videos) if videos is not None else None
+        excluded = set(exclude_videos or [])
+        accept = None
+        if allowed is not None or excluded:
+            accept = lambda entry: entry[0] not in excluded and (allowed is None or entry[0] in allowed)
+        with self._lock:
+            self._refresh()
+            hits = [self._hit(label, similarity) for label, similarity in self._search(query, n_results, accept)]
+        if min_similarity is not None:
+            hits = [hit for hit in hits if hit["similarity"] >= min_similarity]
+        return hits
+
+    def query_frame(self, frame_id: int, n_results: int = 10, include_same_video: bool = False,
+                    min_similarity: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Keyframes most similar to an indexed keyframe (itself excluded). Raises ValueError if it is not indexed."""
+        with self._lock:
+            self._refresh()
+            label = self._by_frame.get(int(frame_id))
+            if label is None:
+                self._refresh(force=True)
+                label = self._by_frame.get(int(frame_id))
+            if label is None:
+                raise ValueError(f"Frame {frame_id} is not in the frame index")
+            video_uuid = self._labels[label][0]
+            vector = self._vectors[label].copy()
+        hits = self.query(vector, n_results=n_results + 1, min_similarity=min_similarity,
+                          exclude_videos=None if include_same_video else [video_uuid])
+        return [hit for hit in hits if hit["frame_id"] != int(frame_id)][:n_results]
+
+    def change_report(self, video_uuid: str, earlier_videos: Sequence[str], match_threshold: float = 0.80,
+                      change_threshold: float = 0.92, votes_per_frame: int = 10) -> Dict[str, Any]:
+        """
+        Compares a video against its nearest earlier pass. The reference is the earlier video
+        (from `earlier_videos`, newest first: ties go to the most recent) whose keyframes best
+        match the most of this video's keyframes. Each keyframe is then paired with its most
+        similar reference keyframe: "unchanged" at or above `change_threshold`, "changed" (same
+        place, different content) down to `match_threshold`, "unmatched" below (not covered).
+        """
+        rows, vectors = self._read(video_uuid)
+        report: Dict[str, Any] = {"video_uuid": video_uuid, "reference_uuid": None, "keyframes": len(rows),
+                                  "matched": 0, "changed": 0, "unmatched": len(rows), "frames": []}
+        candidates = [uuid for uuid in earlier_videos if uuid != video_uuid]
+        if not rows or not candidates:
+            return report
+
+        rank = {uuid: i for i, uuid in enumerate(candidates)}
+        votes: Dict[str, int] = {}
+        with self._lock:
+            self._refresh()
+            for vector in vectors:
+                best: Dict[str, float] = {}
+                for label, similarity in self._search(vector, votes_per_frame, lambda entry: entry[0] in rank):
+                    owner = self._labels[label][0]
+                    best[owner] = max(best.get(owner, -1.0), similarity)
+                for owner, similarity in best.items():
+                    if similarity >= match_threshold:
+                        votes[owner] = votes.get(owner, 0) + 1
+        if not votes:
+            return report
+        reference = min(votes, key=lambda uuid: (-votes[uuid], rank[uuid]))
+
+        reference_rows, reference_vectors = self._read(reference)
+        similarities = vectors @ reference_vectors.T
+        best_rows = similarities.argmax(axis=1)
+        frames = []
+        for i, row in enumerate(rows):
+            similarity = float(similarities[i, best_rows[i]])
+            status = "unchanged" if similarity >= change_threshold else "changed" if similarity >= match_threshold else "unmatched"
+            match = reference_rows[best_rows[i]]
+            frames.append({"frame_id": row["frame_id"], "timestamp": row["timestamp"],
+                           "reference_frame_id": match["frame_id"], "reference_timestamp": match["timestamp"],
+                           "similarity": similarity, "status": status})
+        report.update({
+            "reference_uuid": reference,
+            "matched": sum(frame["status"] != "unmatched" for frame in frames),
+            "changed": sum(frame["status"] == "changed" for frame in frames),
+            "unmatched": sum(frame["status"] == "unmatched" for frame in frames),
+            "frames": frames
+        })
+        return report
+
+
+def index_from_archive(frame_index: FrameIndex, video_uuid: str, frames: List[Tuple[int, float]],
+                       archived: Tuple[np.ndarray, np.ndarray]) -> int:
+    """
+    Indexes a video's keyframes ((frame_id, timestamp) pairs) from its archived DINO embeddings
+    of all sampled frames, matching each keyframe to the archived row at its timestamp.
+    Returns the number of keyframes indexed.
+    """
+    timestamps, embeddings = archived
+    # Sampled timestamps are frame_index / fps, so millisecond rounding identifies a frame
+    rows = {round(float(t), 3): i for i, t in enumerate(timestamps)}
+    matched = [(frame_id, timestamp, rows[round(timestamp, 3)]) for frame_id, timestamp in frames
+               if round(timestamp, 3) in rows]
+    if matched:
+        frame_index.add(video_uuid, [m[0] for m in matched], [m[1] for m in matched],
+                        np.asarray(embeddings[[m[2] for m in matched]], dtype=np.float32))
+    return len(matched)
@@ -0,0 +1,196 @@
+import io
+import logging
+from typing import Dict, Any, List, Tuple, Optional
+
+from PIL import Image
+
+from .alert_engine import AlertDebouncer
+from .title_worker import TitleWorker
+from .telemetry import TelemetryTrack
+from .video_processor import MotionFilter, make_thumbnail
+from .embedding_archive import EmbeddingArchiveWriter
+
+class IngestionSession:
+    """
+    Per-video ingestion state: DINO keyframe selection, frame analysis and storage,
+    alert incidents and the segment summaries. Frames can be fed in batches from a
+    file, a parallel decoder or a live stream; `finish` builds the final summaries.
+    With `build_summaries=False` (re-keyframing) only the keyframes themselves are
+    analyzed: no segment summaries, video summary or title refinement; with
+    `check_alerts=False` alert rules are left to the caller.
+    """
+
+    def __init__(self, engine, video_uuid: str, video_filename: str, created_at: float,
+                 telemetry: Optional[TelemetryTrack] = None, motion_filter: Optional[MotionFilter] = None,
+                 archive_writer: Optional[EmbeddingArchiveWriter] = None, build_summaries: bool = True,
+                 check_alerts: bool = True):
+        self.engine = engine
+        self.video_uuid = video_uuid
+        self.video_filename = video_filename
+        self.created_at = created_at
+        self.telemetry = telemetry
+        self.motion_filter = motion_filter
+        # Keeps every sampled frame's DINO embedding so keyframes can be reselected later
+        self.archive_writer = archive_writer
+        self.build_summaries = build_summaries
+        self.check_alerts = check_alerts
+
+        self.current_base_emb = None
+        self.current_base_time = 0.0
+        self.frame_count = 0
+        self.descriptions: Dict[str, str] = {}
+        # Persists alerts as incidents, merging repeats of a rule across nearby keyframes
+        self.alert_debouncer = AlertDebouncer(engine.sqlite_handler, video_uuid, engine.alert_engine)
+
+        # Keyframe descriptions of the segment being accumulated: (timestamp, enriched_desc)
+        self.segment_buffer: List[Tuple[float, str]] = []
+        self.segment_summaries: List[Tuple[float, float, str]] = []
+
+    def flush_segment(self):
+        if not self.segment_buffer:
+            return
+        start_time, end_time = self.segment_buffer[0][0], self.segment_buffer[-1][0]
+        summary = self.engine.ai_handler.summarize_descriptions([d for _, d in self.segment_buffer], scope="segment")
+        self.segment_buffer.clear()
+        if summary:
+            self.engine.store_summary(self.video_uuid, "segment", start_time, end_time, summary)
+            self.segment_summaries.append((start_time, end_time, summary))
+            # Refine the title with everything seen so far
+            self.engine.title_worker.submit(self.video_uuid, [s for _, _, s in self.segment_summaries])
+
+    def process_batch(self, batch: List[Tuple[Image.Image, float]]):
+        """Embeds a batch of (image, timestamp) frames with DINO and analyzes the new keyframes."""
+        engine = self.engine
+        if self.motion_filter is not None:
+            # Static frames never reach DINO
+            batch = [f for f in batch if self.motion_filter.accept(f[0], f[1])]
+            if not batch:
+                return
+        images = [f[0] for f in batch]
+        timestamps = [f[1] for f in batch]
+
+        # Batch DINO Embeddings
+        embeddings = engine.dino_handler.get_embeddings_batch(images)
+        if embeddings is None:
+            return
+        if self.archive_writer is not None:
+            self.archive_writer.append(embeddings.detach().float().cpu().numpy(), timestamps)
+
+        for i, emb in enumerate(embeddings):
+            timestamp = timestamps[i]
+            pil_image = images[i]
+
+            # Similarity Check (Sequential logic preserved)
+            if self.current_base_emb is not None:
+                similarity = engine.dino_handler.compute_similarity(self.current_base_emb, emb)
+                if similarity >= engine.keyframe_threshold:
+                    self.frame_count += 1
+                    continue # Skip redundant frame
+
+            # New Keyframe Selected
+            logging.info(f"Selected keyframe at {timestamp:.2f}s")
+            self.current_base_emb = emb
+            self.current_base_time = timestamp
+            self.analyze_keyframe(pil_image, timestamp, dino_embedding=emb.detach().float().cpu().numpy())
+            self.frame_count += 1
+
+    def analyze_keyframe(self, pil_image: Image.Image, timestamp: float, dino_embedding=None):
+        """
+        Describes a keyframe with Groq, stores it in SQLite and Chroma and checks the alert rules.
+        Its DINO embedding, when given, goes into the library-wide frame index.
+        """
+        engine = self.engine
+        frame_name = f"frame_{timestamp:.2f}"
+        # Telemetry interpolated at the keyframe timestamp (binary search in the sorted track)
+        frame_telemetry = self.telemetry.at(timestamp) if self.telemetry is not None else None
+
+        # AI Analysis
+        analysis = engine.ai_handler.analyze_image(pil_image, frame_name)
+        desc = analysis["description"]
+        self.descriptions[frame_name] = desc
+        if self.build_summaries and len(self.descriptions) == engine.title_initial_frames:
+            engine.title_worker.submit(self.video_uuid, list(self.descriptions.values()))
+
+        # Save Frame to SQLite (BLOB)
+        img_byte_arr = io.BytesIO()
+        pil_image.save(img_byte_arr, format='JPEG')
+        img_bytes = img_byte_arr.getvalue()
+
+        frame_id = engine.sqlite_handler.add_frame(self.video_uuid, timestamp, desc, img_bytes,
+                                                   telemetry=frame_telemetry, thumbnail=make_thumbnail(pil_image),
+                                                   analysis=analysis)
+        if dino_embedding is not None:
+            engine.frame_index.add(self.video_uuid, [frame_id], [timestamp], dino_embedding)
+
+        # Store in ChromaDB
+        enriched_desc = f"[{timestamp:.1f}s]: {desc}"
+        embeddings, model = engine.ai_handler.embed_tagged([enriched_desc])
+        embedding = embeddings[0]
+
+        # Alert Check (every triggered rule is reported); semantic rules reuse the Chroma embedding
+        if self.check_alerts:
+            for alert in engine.alert_engine.check_rules(desc, frame_name, embedding=embedding,
+                                                         telemetry=frame_telemetry):
+                self.alert_debouncer.add(alert, timestamp)
+
+        # Tagged with its model: after a collection switch the frame is re-embedded instead of mixed in
+        engine.write_embedded(enriched_desc, lambda embedding, model: engine.db_handler.add_entry(
+            video_uuid=self.video_uuid,
+            video_filename=self.video_filename,
+            frame_name=str(frame_id),
+            smart_name="Processing...",
+            description=enriched_desc,
+            embedding=embedding,
+            file_path="",
+            timestamp=timestamp,
+            created_at=self.created_at,
+            telemetry=frame_telemetry,
+            model=model
+        ), embedded=(embedding, model))
+
+        if not self.build_summaries:
+            return frame_id
+        self.segment_buffer.append((timestamp, enriched_desc))
+        if len(self.segment_buffer) >= engine.summary_segment_size:
+            self.flush_segment()
+        return frame_id
+
+    def finish(self) -> Dict[str, Any]:
+        """Builds the summary hierarchy, queues the final title and returns the ingestion result."""
+        engine = self.engine
+
+        if self.archive_writer is not None:
+            self.archive_writer.close()
+        if self.motion_filter is not None:
+            logging.info(f"Motion filter passed {self.motion_filter.kept} of {self.motion_filter.seen} sampled frames to DINO")
+
+        # Build the summary hierarchy (segments -> whole video)
+        self.flush_segment()
+        if len(self.segment_summaries) == 1:
+            # A single segment already summarizes the whole video
+            start_time, end_time, summary = self.segment_summaries[0]
+            engine.store_summary(self.video_uuid, "video", start_time, end_time, summary)
+        elif self.segment_summaries:
+            video_summary = engine.ai_handler.summarize_descriptions(
+                [f"[{start:.1f}s-{end:.1f}s]: {summary}" for start, end, summary in self.segment_summaries],
+                scope="video"
+            )
+            if video_summary:
+                engine.store_summary(self.video_uuid, "video", self.segment_summaries[0][0],
+                                     self.segment_summaries[-1][1], video_summary)
+
+        # Final title refinement runs in the background; ingestion completes now
+        if self.segment_summaries:
+            engine.title_worker.submit(self.video_uuid, [summary for _, _, summary in self.segment_summaries])
+        elif len(self.descriptions) < engine.title_initial_frames:
+            # Short videos never reached the initial title threshold
+            engine.title_worker.submit(self.video_uuid, list(self.descriptions.values()))
+        video = engine.sqlite_handler.get_videos_by_uuids([self.video_uuid]).get(self.video_uuid)
+        smart_title = video["smart_title"] if video else TitleWorker.PLACEHOLDER_TITLE
+
+        logging.info(f"Processing complete. {len(self.alert_debouncer.incidents)} alert incidents generated.")
+        return {
+            "video_uuid": self.video_uuid,
+            "smart_title": smart_title,
+            "alerts": self.alert_debouncer.incidents
+        }
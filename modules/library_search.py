@@ -0,0 +1,70 @@
+import logging
+from typing import Callable, Dict, Any, List, Optional, Set
+
+from .vector_store import VectorStore
+
+
+def _group_hits(results: Dict[str, Any], hits_per_video: int) -> List[Dict[str, Any]]:
+    groups: Dict[str, Dict[str, Any]] = {}
+    if not results.get('documents'):
+        return []
+    for doc, meta, dist in zip(results['documents'][0], results['metadatas'][0], results['distances'][0]):
+        video_uuid = meta.get("video_uuid")
+        group = groups.get(video_uuid)
+        if group is None:
+            # Hits arrive sorted by distance, so the first one is the video's best
+            group = groups[video_uuid] = {
+                "video_uuid": video_uuid,
+                "video_file_name": meta.get("video_file_name", ""),
+                "best_distance": dist,
+                "hits": []
+            }
+        if len(group["hits"]) < hits_per_video:
+            group["hits"].append({
+                "frame_id": meta.get("frame_name"),
+                "timestamp": meta.get("timestamp"),
+                "description": doc,
+                "distance": dist
+            })
+    return list(groups.values())
+
+
+def search_library_page(store: VectorStore, query_embedding: List[float], page: int = 0, page_size: int = 5,
+                        hits_per_video: int = 3, live: Optional[Callable[[List[str]], Set[str]]] = None,
+                        batch_size: int = 200, max_hits: int = 10000, **filters) -> Dict[str, Any]:
+    """
+    One page of library search results grouped per video, ordered by each video's best hit.
+    The vector store is asked for `batch_size` hits first and for four times as many each
+    round until the page (plus one more video, for `has_more`) is filled or the index has no
+    more matches. `total_videos` counts the videos seen so far and is the library-wide total
+    only when `total_is_exact` (the index ran out of matches); otherwise it is a lower bound
+    and must not be shown as a total. `truncated` additionally says that `max_hits` stopped
+    the scan before the page could be filled. `live` is given the video uuids of the hits
+    and returns those to keep (deleted videos wait in the index to be purged).
+    """
+    start = page * page_size
+    n_results = min(batch_size, max_hits)
+    while True:
+        results = store.search_library(query_embedding, n_results=n_results, **filters)
+        returned = len(results['ids'][0]) if results.get('ids') else 0
+        exhausted = returned < n_results
+        ordered = _group_hits(results, hits_per_video)
+        if live is not None:
+            keep = live([group["video_uuid"] for group in ordered])
+            ordered = [group for group in ordered if group["video_uuid"] in keep]
+        if len(ordered) > start + page_size or exhausted or n_results >= max_hits:
+            break
+        n_results = min(max_hits, n_results * 4)
+
+    truncated = not exhausted and len(ordered) <= start + page_size
+    if truncated:
+        logging.warning(f"Library search stopped at {max_hits} hits; later pages are incomplete")
+    return {
+        "results": ordered[start:start + page_size],
+        "total_videos": len(ordered),
+        "total_is_exact": exhausted,
+        "page": page,
+        "page_size": page_size,
+        "has_more": start + page_size < len(ordered),
+        "truncated": truncated
+    }
@@ -0,0 +1,169 @@
+import os
+import io
+import json
+import time
+import uuid
+import hashlib
+import pstats
+import cProfile
+import logging
+import functools
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+# Every profiled call is recorded when set; otherwise only calls made with profile=True
+PROFILE_ALL = os.getenv("PROFILING", "0") == "1"
+
+# Work done for the profiled call of this thread on other threads, by stage
+_context = threading.local()
+
+
+def record_offloaded(stage: str, seconds: float, waited: float = 0.0, batch: int = 1):
+    """
+    Credits work done on another thread (e.g. a batch dispatcher) to the profiled call of
+    the calling thread, which cProfile cannot see. No-op when the thread is not profiled.
+    """
+    offloaded = getattr(_context, "offloaded", None)
+    if offloaded is None:
+        return
+    entry = offloaded.setdefault(stage, {"calls": 0, "seconds": 0.0, "waited": 0.0, "batch_requests": 0})
+    entry["calls"] += 1
+    entry["seconds"] += seconds
+    entry["waited"] += waited
+    entry["batch_requests"] += batch
+
+
+def _detail(value: Any) -> Any:
+    """A call argument as stored in the profile metadata; text is reduced unless PROFILE_ARGS=1."""
+    if not isinstance(value, str) or os.getenv("PROFILE_ARGS", "0") == "1":
+        return value
+    # Questions and paths stay out of the profile files; equal texts still get equal entries
+    return f"<{len(value)} chars, sha256 {hashlib.sha256(value.encode('utf-8')).hexdigest()[:12]}>"
+
+
+def _function_name(func: Tuple[str, int, str]) -> str:
+    filename, line, name = func
+    if filename == "~":
+        # Built-ins: "<built-in method time.sleep>"
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+class ProfileStore:
+    """
+    Saved cProfile runs under PROFILE_DIR (default "profiles"): `<request_id>.prof`
+    (pstats format, readable by snakeviz and friends) plus `<request_id>.json` metadata.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.getenv("PROFILE_DIR", "profiles")
+
+    def save(self, profile: cProfile.Profile, kind: str, seconds: float, details: Dict[str, Any]) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        request_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        profile.dump_stats(os.path.join(self.root, f"{request_id}.prof"))
+        with open(os.path.join(self.root, f"{request_id}.json"), "w", encoding="utf-8") as f:
+            json.dump({"request_id": request_id, "kind": kind, "seconds": seconds,
+                       "created_at": time.time(), "details": details}, f)
+        return request_id
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Metadata of the saved profiles, newest first."""
+        if not os.path.isdir(self.root):
+            return []
+        profiles = []
+        for name in os.listdir(self.root):
+            if name.endswith(".json"):
+                with open(os.path.join(self.root, name), "r", encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+        profiles.sort(key=lambda p: p["created_at"], reverse=True)
+        return profiles[:limit]
+
+    def path(self, request_id: str) -> str:
+        return os.path.join(self.root, f"{request_id}.prof")
+
+    def _stats(self, request_id: str) -> pstats.Stats:
+        return pstats.Stats(self.path(request_id), stream=io.StringIO())
+
+    def hotspots(self, request_id: str, limit: int = 25, sort: str = "tottime") -> List[Dict[str, Any]]:
+        """Top functions by self time ('tottime') or inclusive time ('cumtime')."""
+        rows = []
+        for func, (primitive_calls, calls, tottime, cumtime, _) in self._stats(request_id).stats.items():
+            rows.append({"function": _function_name(func), "calls": calls, "primitive_calls": primitive_calls,
+                         "tottime": tottime, "cumtime": cumtime})
+        rows.sort(key=lambda row: row[sort], reverse=True)
+        return rows[:limit]
+
+    def folded(self, request_id: str, max_depth: int = 64) -> str:
+        """
+        Folded stacks ("root;child;leaf <microseconds>" per line) for flamegraph.pl or
+        speedscope. cProfile keeps caller/callee edges, not full stacks, so each edge's
+        time is split over the paths reaching its caller in proportion to their share.
+        """
+        stats = self._stats(request_id).stats
+        children: Dict[tuple, List[Tuple[tuple, float]]] = {}
+        for func, (_, _, _, _, callers) in stats.items():
+            for caller, edge in callers.items():
+                children.setdefault(caller, []).append((func, edge[3]))
+        roots = [func for func, value in stats.items() if not value[4]]
+
+        lines: Dict[str, float] = {}
+
+        def visit(func: tuple, path: List[str], on_path: set, share: float):
+            tottime = stats[func][2]
+            path = path + [_function_name(func)]
+            key = ";".join(path)
+            lines[key] = lines.get(key, 0.0) + tottime * share
+            if len(path) >= max_depth:
+                return
+            for child, edge_time in children.get(func, []):
+                child_total = stats[child][3]
+                if child in on_path or child_total <= 0 or edge_time <= 0:
+                    continue
+                visit(child, path, on_path | {child}, edge_time * share / child_total)
+
+        for root in roots:
+            visit(root, [], {root}, 1.0)
+        return "\n".join(f"{stack} {int(value * 1e6)}" for stack, value in lines.items() if value * 1e6 >= 1) + "\n"
+
+
+def profiled(kind: str):
+    """
+    Records a cProfile run of the decorated call when PROFILING=1 or when it is called
+    with profile=True. Otherwise the call goes straight through (one flag check).
+    Only the calling thread is profiled: decoder processes and background workers are not.
+    Numeric arguments are kept in the metadata; text arguments (questions, paths) only as
+    their length and a hash, unless PROFILE_ARGS=1. Work reported via `record_offloaded`
+    is added to the metadata under "offloaded".
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, profile: Optional[bool] = None, **kwargs):
+            if not (profile or (profile is None and PROFILE_ALL)):
+                return fn(*args, **kwargs)
+
+            profiler = cProfile.Profile()
+            start = time.time()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already active on this interpreter
+                logging.warning(f"Profiling of {kind} skipped: a profiler is already running")
+                return fn(*args, **kwargs)
+            _context.offloaded = {}
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+                seconds = time.time() - start
+                offloaded, _context.offloaded = _context.offloaded, None
+                details = {key: _detail(value) for key, value in kwargs.items()
+                           if isinstance(value, (str, int, float, bool))}
+                details.update({f"arg{i}": _detail(value) for i, value in enumerate(args[1:])
+                                if isinstance(value, (str, int, float))})
+                if offloaded:
+                    details["offloaded"] = offloaded
+                request_id = ProfileStore().save(profiler, kind, seconds, details)
+                logging.info(f"Profiled {kind} in {seconds:.2f}s: {request_id}")
+        return wrapper
+    return decorate
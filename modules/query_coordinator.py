@@ -0,0 +1,131 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from .vector_store import VectorStore
+from .profiler import record_offloaded
+
+_RESULT_KEYS = ("ids", "documents", "metadatas", "distances")
+
+
+class QueryCoordinator:
+    """
+    Micro-batches the query path of concurrent chat sessions. Callers block on `embed`
+    and `query` as before, but their requests are collected for up to QUERY_BATCH_WINDOW_MS
+    (default 5 ms, or until `max_batch` are waiting) and served together: all texts of a
+    batch in one encode call, and the lookups against the same video and telemetry filters
+    in one `query_many` call. A window of 0 disables batching (direct calls). The batch
+    time is credited to each waiting caller's profile (see `record_offloaded`), since the
+    work runs on the dispatcher thread.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]], vector_store: VectorStore,
+                 window_ms: Optional[float] = None, max_batch: int = 32):
+        self.embed_fn = embed_fn
+        self.vector_store = vector_store
+        self.window = (float(os.getenv("QUERY_BATCH_WINDOW_MS", 5)) if window_ms is None else window_ms) / 1000.0
+        self.max_batch = max_batch
+        self.stats = {"batches": 0, "requests": 0}
+        self._pending: List[Tuple[str, Any, Future]] = []
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        if self.window > 0:
+            self._thread = threading.Thread(target=self._run, name="query-coordinator", daemon=True)
+            self._thread.start()
+
+    def _submit(self, kind: str, payload: Any) -> Any:
+        future: Future = Future()
+        submitted = time.monotonic()
+        with self._condition:
+            self._pending.append((kind, payload, future))
+            self._condition.notify_all()
+        result, seconds, batch = future.result()
+        # The time until the batch started is spent waiting for the window and earlier batches
+        record_offloaded(f"query_coordinator.{kind}", seconds,
+                         waited=time.monotonic() - submitted - seconds, batch=batch)
+        return result
+
+    def embed(self, text: str) -> List[float]:
+        """Embedding of one query text, encoded together with the other waiting texts."""
+        if self._thread is None:
+            return self.embed_fn([text])[0]
+        return self._submit("embed", text)
+
+    def query(self, query_embedding: List[float], video_uuid: str, n_results: int = 5,
+              geofence: Optional[List[float]] = None, min_altitude: Optional[float] = None,
+              max_altitude: Optional[float] = None) -> Dict[str, Any]:
+        """Same result as `vector_store.query`, looked up together with the other waiting queries."""
+        filters = {"geofence": geofence, "min_altitude": min_altitude, "max_altitude": max_altitude}
+        if self._thread is None:
+            return self.vector_store.query(query_embedding, video_uuid, n_results=n_results, **filters)
+        return self._submit("query", (list(query_embedding), video_uuid, n_results, filters))
+
+    def _next_batch(self) -> List[Tuple[str, Any, Future]]:
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending)
+            # Give concurrent callers the window to join, unless the batch is already full
+            deadline = time.monotonic() + self.window
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            return batch
+
+    def _run_embeds(self, requests: List[Tuple[str, Any, Future]]):
+        start = time.monotonic()
+        try:
+            embeddings = self.embed_fn([text for _, text, _ in requests])
+        except Exception as e:
+            for _, _, future in requests:
+                future.set_exception(e)
+            return
+        seconds = time.monotonic() - start
+        for (_, _, future), embedding in zip(requests, embeddings):
+            future.set_result((list(embedding), seconds, len(requests)))
+
+    def _run_queries(self, requests: List[Tuple[str, Any, Future]]):
+        groups: Dict[tuple, List[Tuple[Any, Future]]] = {}
+        for _, payload, future in requests:
+            _, video_uuid, _, filters = payload
+            key = (video_uuid, tuple(filters["geofence"] or ()), filters["min_altitude"], filters["max_altitude"])
+            groups.setdefault(key, []).append((payload, future))
+
+        for group in groups.values():
+            _, video_uuid, _, filters = group[0][0]
+            # One lookup at the largest requested depth; each caller gets its own top n back
+            n_results = max(payload[2] for payload, _ in group)
+            start = time.monotonic()
+            try:
+                results = self.vector_store.query_many([payload[0] for payload, _ in group], video_uuid,
+                                                       n_results=n_results, **filters)
+            except Exception as e:
+                for _, future in group:
+                    future.set_exception(e)
+                continue
+            seconds = time.monotonic() - start
+            for i, (payload, future) in enumerate(group):
+                future.set_result(({key: [results[key][i][:payload[2]]] for key in _RESULT_KEYS},
+                                   seconds, len(group)))
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            self.stats["batches"] += 1
+            self.stats["requests"] += len(batch)
+            try:
+                embeds = [request for request in batch if request[0] == "embed"]
+                if embeds:
+                    self._run_embeds(embeds)
+                queries = [request for request in batch if request[0] == "query"]
+                if queries:
+                    self._run_queries(queries)
+            except Exception as e:
+                logging.error(f"Query batch failed: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
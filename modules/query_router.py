@@ -0,0 +1,91 @@
+import re
+from typing import Dict, Optional
+
+class QueryRouter:
+    """Routes user queries to the retrieval path best suited to answer them."""
+
+    # Questions about the video as a whole are answered from precomputed summaries
+    GLOBAL_PATTERNS = [
+        r"\bhow many\b",
+        r"\bwhat (activities|events|happens|happened|is happening)\b",
+        r"\bsummar(y|ize|ise)\b",
+        r"\b(overview|overall|in general)\b",
+        r"\b(entire|whole|full) (video|footage|clip)\b",
+        r"\bthroughout\b",
+        r"\bdescribe the (video|footage|environment|setting|scene)\b",
+        r"\bis there any\b",
+    ]
+
+    # Subjects with their own column in the structured frame analysis. Only generic words:
+    # "the truck" or "the woman" name one object, which the counts cannot single out
+    SUBJECT_WORDS = {
+        "person": r"(?:a |any |some )?(?:people|persons?|humans?|individuals?|pedestrians?|anyone|someone|anybody|somebody)",
+        "vehicle": r"(?:a |any |some )?vehicles?",
+        "suspicious": r"(?:any |some )?suspicious (?:activity|behaviou?r)|anything suspicious|something suspicious",
+    }
+    # Nouns of specific people and objects; a question about them goes to retrieval
+    OBJECT_WORDS = r"the|this|that|men|man|women|woman|boys?|girls?|child|children|cars?|trucks?|vans?|bus|buses|" \
+                   r"motorcycles?|motorbikes?|bikes?|bicycles?|boats?|drones?|dogs?"
+    # A plain aggregate is the whole question: qualifiers ("wearing helmets", "are red") fall through
+    PLACE = r"(?: (?:in|of) (?:the|this) (?:video|footage|clip|scene|recording))?"
+    COUNT_PATTERN = r"how many (?P<subject>{people}|{vehicles}|(?:suspicious|flagged) (?:frames|keyframes|moments))" \
+                    r"(?: (?:are|were)(?: (?:there|visible|seen|present|detected|shown))?| (?:appear|appeared|can be seen))?" \
+                    + PLACE
+    MAX_PATTERN = r"(?:what (?:is|was) )?the (?:max|maximum|most|peak|largest|highest|biggest) (?:number|count) of " \
+                  r"(?P<subject>{people}|{vehicles})(?: (?:visible|seen|present|detected))?" \
+                  r"(?: at once| at the same time| in (?:a|one|any|a single) (?:frame|keyframe))?" + PLACE
+    FIRST_PATTERNS = [
+        r"(?:when|at what (?:time|point|timestamp)) (?:did|does|do|was|were|is|are) (?P<subject>[\w -]+?) first "
+        r"(?:appear|show up|get seen|seen|visible|arrive|enter|occur|happen)" + PLACE,
+        r"(?:when|what) (?:is|was) the first (?:appearance|sighting|occurrence) of (?P<subject>[\w -]+?)" + PLACE,
+    ]
+
+    def __init__(self):
+        self._global_regex = re.compile("|".join(self.GLOBAL_PATTERNS), re.IGNORECASE)
+        self._subject_regexes = {
+            subject: re.compile(rf"(?:{words})", re.IGNORECASE) for subject, words in self.SUBJECT_WORDS.items()
+        }
+        self._object_regex = re.compile(rf"\b(?:{self.OBJECT_WORDS})\b", re.IGNORECASE)
+        subjects = {"people": f"(?:{self.SUBJECT_WORDS['person']})", "vehicles": f"(?:{self.SUBJECT_WORDS['vehicle']})"}
+        self._count_regex = re.compile(self.COUNT_PATTERN.format(**subjects), re.IGNORECASE)
+        self._max_regex = re.compile(self.MAX_PATTERN.format(**subjects), re.IGNORECASE)
+        self._first_regexes = [re.compile(pattern, re.IGNORECASE) for pattern in self.FIRST_PATTERNS]
+
+    def route(self, query: str) -> str:
+        """Returns 'global' for whole-video questions and 'frames' for everything else."""
+        return "global" if self._global_regex.search(query) else "frames"
+
+    def _subject(self, text: str) -> Optional[str]:
+        for subject, regex in self._subject_regexes.items():
+            if regex.fullmatch(text):
+                return subject
+        return None
+
+    def aggregate(self, query: str) -> Optional[Dict[str, str]]:
+        """
+        Recognizes questions answerable from the structured frame analysis in SQL:
+        {"op": "count" | "max" | "first", "subject": "person" | "vehicle" | "suspicious" | <label>},
+        or None. Only a whole question that is a plain aggregate matches; one with any other
+        qualifier, or about a specific person or object, is left to retrieval. 'first'
+        subjects outside the known ones are looked up as activity labels.
+        """
+        # Case, spacing and the closing punctuation do not change the question
+        text = re.sub(r"\s+", " ", query).strip().rstrip("?.! ").lower()
+        for regex in self._first_regexes:
+            match = regex.fullmatch(text)
+            if match:
+                subject = match.group("subject").strip()
+                known = self._subject(subject)
+                if known is not None:
+                    return {"op": "first", "subject": known}
+                if self._object_regex.search(subject) or len(subject.split()) > 3:
+                    return None
+                return {"op": "first", "subject": subject}
+        for op, regex in (("count", self._count_regex), ("max", self._max_regex)):
+            match = regex.fullmatch(text)
+            if match:
+                subject = match.group("subject")
+                if subject.startswith(("suspicious", "flagged")):
+                    return {"op": op, "subject": "suspicious"}
+                return {"op": op, "subject": self._subject(subject)}
+        return None
@@ -0,0 +1,44 @@
+import time
+import logging
+import threading
+
+
+class RateLimiter:
+    """
+    Spaces Groq requests at least `min_interval` seconds apart across threads.
+    When several callers are waiting, higher-priority ones (lower number) go first,
+    so background work such as title refinement never delays ingestion or chat.
+    """
+    HIGH = 0
+    LOW = 1
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self.last_request_time = 0.0
+        self._condition = threading.Condition()
+        self._waiting = {self.HIGH: 0, self.LOW: 0}
+
+    def acquire(self, priority: int = HIGH):
+        """Blocks until this caller may send a request."""
+        with self._condition:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    higher_waiting = any(count for p, count in self._waiting.items() if p < priority)
+                    wait = self.last_request_time + self.min_interval - time.time()
+                    if not higher_waiting and wait <= 0:
+                        # Reserve the slot so concurrent callers keep spacing
+                        self.last_request_time = time.time()
+                        return
+                    if wait > 0:
+                        logging.info(f"Rate limiting: sleeping for {wait:.2f}s")
+                    self._condition.wait(timeout=wait if wait > 0 else 0.1)
+            finally:
+                self._waiting[priority] -= 1
+                self._condition.notify_all()
+
+    def mark(self):
+        """Records the completion time of a request (the interval counts from here)."""
+        with self._condition:
+            self.last_request_time = time.time()
+            self._condition.notify_all()
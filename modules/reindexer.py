@@ -0,0 +1,149 @@
+import time
+import calendar
+import logging
+import threading
+import numpy as np
+from typing import Callable, Dict, Any, List, Optional
+
+from .sqlite_handler import SQLiteHandler
+from .vector_store import VectorStore, frame_metadata
+
+
+def _epoch(created_at: Optional[str]) -> float:
+    # SQLite CURRENT_TIMESTAMP is UTC; library date filters use the epoch in the vector store
+    if not created_at:
+        return time.time()
+    return float(calendar.timegm(time.strptime(created_at, "%Y-%m-%d %H:%M:%S")))
+
+
+class Reindexer:
+    """
+    Re-embeds the stored keyframe descriptions and summaries from SQLite into a new
+    vector collection, in large batches, without any Groq call. Rows are copied in ID
+    order and the registry records the last copied ID after every batch, so an
+    interrupted run resumes where it stopped; running it again after a switch picks up
+    rows ingested into the previous collection in the meantime.
+    """
+
+    def __init__(self, sqlite_handler: SQLiteHandler, embed_fn: Callable[[List[str]], Any],
+                 target_store: VectorStore, collection: str, batch_size: int = 512):
+        self.sqlite_handler = sqlite_handler
+        self.embed_fn = embed_fn
+        self.target_store = target_store
+        self.collection = collection
+        self.batch_size = batch_size
+        self.progress = {"frames": 0, "summaries": 0}
+        self._thread: Optional[threading.Thread] = None
+        self.report: Optional[Dict[str, Any]] = None
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.embed_fn(texts), dtype=np.float32).reshape(len(texts), -1)
+
+    def _copy_frames(self, after_id: int, stop_event: Optional[threading.Event]) -> float:
+        embed_seconds = 0.0
+        first_batch = True
+        while not (stop_event and stop_event.is_set()):
+            rows = self.sqlite_handler.get_frames_after(after_id, limit=self.batch_size)
+            if not rows:
+                break
+            if first_batch:
+                # The batch after the watermark may have been written before an interruption
+                for video_uuid in {row["video_uuid"] for row in rows}:
+                    self.target_store.delete_entries(
+                        video_uuid, [str(row["id"]) for row in rows if row["video_uuid"] == video_uuid]
+                    )
+                first_batch = False
+            documents = [f"[{row['timestamp']:.1f}s]: {row['description']}" for row in rows]
+            start = time.time()
+            embeddings = self._embed(documents)
+            embed_seconds += time.time() - start
+            metadatas = [
+                frame_metadata(row["video_uuid"], row["filename"], str(row["id"]), row["smart_title"],
+                               timestamp=row["timestamp"], created_at=_epoch(row["created_at"]),
+                               telemetry={key: row[key] for key in ("latitude", "longitude", "altitude", "heading")})
+                for row in rows
+            ]
+            self.target_store.add_entries([f"{row['video_uuid']}_{row['id']}" for row in rows], embeddings,
+                                          documents, metadatas, batch_size=self.batch_size)
+            after_id = rows[-1]["id"]
+            self.sqlite_handler.update_collection_progress(self.collection, last_frame_id=after_id)
+            self.progress["frames"] += len(rows)
+        return embed_seconds
+
+    def _copy_summaries(self, after_id: int, stop_event: Optional[threading.Event]) -> float:
+        embed_seconds = 0.0
+        first_batch = True
+        while not (stop_event and stop_event.is_set()):
+            rows = self.sqlite_handler.get_summaries_after(after_id, limit=self.batch_size)
+            if not rows:
+                break
+            if first_batch:
+                for video_uuid in {row["video_uuid"] for row in rows}:
+                    self.target_store.delete_summary_entries(
+                        video_uuid, [row["id"] for row in rows if row["video_uuid"] == video_uuid]
+                    )
+                first_batch = False
+            start = time.time()
+            embeddings = self._embed([row["summary"] for row in rows])
+            embed_seconds += time.time() - start
+            self.target_store.add_entries(
+                [f"{row['video_uuid']}_summary_{row['id']}" for row in rows], embeddings,
+                [row["summary"] for row in rows],
+                [{"video_uuid": row["video_uuid"], "level": row["level"], "start_time": float(row["start_time"]),
+                  "end_time": float(row["end_time"])} for row in rows],
+                summaries=True, batch_size=self.batch_size
+            )
+            after_id = rows[-1]["id"]
+            self.sqlite_handler.update_collection_progress(self.collection, last_summary_id=after_id)
+            self.progress["summaries"] += len(rows)
+        return embed_seconds
+
+    def run(self, stop_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """Copies everything past the recorded watermarks; returns a throughput report."""
+        collection = self.sqlite_handler.get_collection(self.collection)
+        if collection is None:
+            raise ValueError(f"Unknown collection {self.collection}")
+        start = time.time()
+        frames_before, summaries_before = self.progress["frames"], self.progress["summaries"]
+        embed_seconds = self._copy_frames(collection["last_frame_id"] or 0, stop_event)
+        embed_seconds += self._copy_summaries(collection["last_summary_id"] or 0, stop_event)
+
+        seconds = time.time() - start
+        entries = (self.progress["frames"] - frames_before) + (self.progress["summaries"] - summaries_before)
+        report = {
+            "collection": self.collection,
+            "frames": self.progress["frames"] - frames_before,
+            "summaries": self.progress["summaries"] - summaries_before,
+            "seconds": seconds,
+            "embed_seconds": embed_seconds,
+            "entries_per_second": entries / seconds if seconds > 0 else 0.0,
+            "complete": not (stop_event and stop_event.is_set())
+        }
+        logging.info(f"Reindexed {entries} entries into {self.collection} in {seconds:.1f}s "
+                     f"({report['entries_per_second']:.0f}/s, {embed_seconds:.1f}s embedding)")
+        return report
+
+    def start(self, on_done: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+              stop_event: Optional[threading.Event] = None) -> threading.Thread:
+        """
+        Runs `run` on a background thread; `on_done(report)` may post-process the report
+        (the switch-over) before it is published in `report`. `progress` is live meanwhile.
+        """
+        def work():
+            try:
+                report = self.run(stop_event)
+                if on_done is not None:
+                    report = on_done(report)
+                self.report = report
+            except Exception as e:
+                logging.error(f"Reindex of {self.collection} failed: {e}")
+                self.report = {"collection": self.collection, "error": str(e), "complete": False}
+
+        self._thread = threading.Thread(target=work, name="reindexer", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.report
@@ -0,0 +1,43 @@
+import logging
+import numpy as np
+from typing import Dict, Any, List, Callable, Tuple
+
+class SemanticRuleMatcher:
+    """
+    Matches descriptions against embedding-based alert rules.
+    Each rule's example phrases are embedded once and averaged into one unit vector,
+    so all rules are scored with a single product against the precomputed rule matrix.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]], embed_fn: Callable[[List[str]], List[List[float]]]):
+        self.rules = rules
+        rows = []
+        for rule in rules:
+            examples = np.asarray(embed_fn(rule["examples"]), dtype=np.float32)
+            examples /= np.linalg.norm(examples, axis=1, keepdims=True) + 1e-12
+            centroid = examples.mean(axis=0)
+            rows.append(centroid / (np.linalg.norm(centroid) + 1e-12))
+
+        self.matrix = np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+        self.thresholds = np.array([rule.get("threshold", 0.5) for rule in rules], dtype=np.float32)
+        logging.info(f"Compiled {len(rules)} semantic alert rules")
+
+    def score(self, embeddings) -> np.ndarray:
+        """Returns an (N, rules) cosine similarity matrix for N description embeddings."""
+        vectors = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        vectors = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+        return vectors @ self.matrix.T
+
+    def match_batch(self, embeddings) -> List[List[Tuple[Dict[str, Any], float]]]:
+        """Returns the (rule, score) pairs above each rule's threshold, per description."""
+        if not self.rules:
+            return [[] for _ in range(len(embeddings))]
+        scores = self.score(embeddings)
+        hits = scores >= self.thresholds
+        return [
+            [(self.rules[j], float(scores[i, j])) for j in np.flatnonzero(hits[i])]
+            for i in range(scores.shape[0])
+        ]
+
+    def match(self, embedding) -> List[Tuple[Dict[str, Any], float]]:
+        return self.match_batch([embedding])[0]
@@ -1,20 +1,36 @@
 import sqlite3
 import logging
 import io
-from typing import List, Dict, Any, Optional
+import re
+import time
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Iterable
 from datetime import datetime
 
+# Library reads cached per database file and shared by every handler in the process,
+# so a write through any handler invalidates what the sidebar sees
+_library_cache: Dict[str, Dict[Any, Tuple[float, Any]]] = {}
+_library_cache_lock = threading.Lock()
+
+
 class SQLiteHandler:
     """Handles SQLite operations for video metadata and frame storage."""
     
+    # Seconds a cached library page/count stays valid (bounds staleness from other processes)
+    LIBRARY_CACHE_TTL = 5.0
+
     def __init__(self, db_path: str = "videos.db"):
         self.db_path = db_path
+        self.has_fts = False
         self._init_db()
 
     def _init_db(self):
         """Initialize the database tables."""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
+        # Freed pages (deleted frame BLOBs) are returned to the OS by incremental vacuum.
+        # This takes effect on new databases; existing ones need `enable_incremental_vacuum` once.
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
         
         # Videos table
         cursor.execute('''
@@ -26,6 +42,16 @@ class SQLiteHandler:
             )
         ''')
         
+        # Columns added after the first release are migrated in place
+        self._ensure_column(cursor, "videos", "status", "TEXT DEFAULT 'complete'")
+        # Set when a video is deleted; the rows are purged later by the DeletionCollector
+        self._ensure_column(cursor, "videos", "deleted_at", "TIMESTAMP")
+        # Content hash of the uploaded file, to recognize re-uploads of analyzed footage
+        self._ensure_column(cursor, "videos", "sha256", "TEXT")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_sha256 ON videos (sha256)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_created ON videos (created_at)")
+        self.has_fts = self._init_title_search(cursor)
+        
         # Frames table (stores image data as BLOB)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS frames (
@@ -37,44 +63,635 @@ class SQLiteHandler:
                 FOREIGN KEY (video_uuid) REFERENCES videos (uuid) ON DELETE CASCADE
             )
         ''')
+        # Telemetry fused per keyframe (NULL when the video has no telemetry)
+        for column in ("latitude", "longitude", "altitude", "heading"):
+            self._ensure_column(cursor, "frames", column, "REAL")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_frames_geo ON frames (latitude, longitude)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_frames_altitude ON frames (altitude)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_frames_video ON frames (video_uuid, timestamp)")
+        # Structured vision analysis (NULL for frames described before it, or when the reply was malformed)
+        self._ensure_column(cursor, "frames", "person_count", "INTEGER")
+        self._ensure_column(cursor, "frames", "vehicle_count", "INTEGER")
+        self._ensure_column(cursor, "frames", "suspicious", "INTEGER")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_frames_people ON frames (video_uuid, person_count)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_frames_vehicles ON frames (video_uuid, vehicle_count)")
+        # Activity ('activity') and suspicion ('flag') labels of each analyzed keyframe
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS frame_labels (
+                frame_id INTEGER,
+                video_uuid TEXT,
+                kind TEXT,
+                label TEXT,
+                timestamp REAL
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_frame_labels_video ON frame_labels (video_uuid, label, timestamp)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_frame_labels_frame ON frame_labels (frame_id)")
+        # Small JPEG previews for the timeline gallery, kept apart from frames so a gallery
+        # page never walks the overflow pages of the full-size image BLOBs
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS frame_thumbnails (
+                frame_id INTEGER PRIMARY KEY,
+                thumbnail BLOB
+            )
+        ''')
+        
+        # Summaries table (segment and whole-video summaries built at ingestion)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS summaries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                video_uuid TEXT,
+                level TEXT,
+                start_time REAL,
+                end_time REAL,
+                summary TEXT,
+                FOREIGN KEY (video_uuid) REFERENCES videos (uuid) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_summaries_video_level ON summaries (video_uuid, level, start_time)"
+        )
+        
+        # Alerts table (one row per incident: consecutive alerts of a rule merged into a time span)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                video_uuid TEXT,
+                rule_id TEXT,
+                type TEXT,
+                severity TEXT,
+                message TEXT,
+                start_time REAL,
+                end_time REAL,
+                frame_count INTEGER DEFAULT 1,
+                first_frame TEXT,
+                last_frame TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (video_uuid) REFERENCES videos (uuid) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_alerts_video_time ON alerts (video_uuid, start_time)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_alerts_severity_created ON alerts (severity, created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_alerts_created ON alerts (created_at)")
+        
+        # Chat history: one session per conversation about a video, with its compacted summary
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                id TEXT PRIMARY KEY,
+                video_uuid TEXT,
+                summary TEXT DEFAULT '',
+                summarized_until INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (video_uuid) REFERENCES videos (uuid) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_video ON chat_sessions (video_uuid, created_at)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                role TEXT,
+                content TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (session_id) REFERENCES chat_sessions (id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_session ON chat_messages (session_id, id)")
+        
+        # Registry of vector collections: one is active, a reindex builds the next one
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS vector_collections (
+                name TEXT PRIMARY KEY,
+                model TEXT,
+                status TEXT DEFAULT 'building',
+                last_frame_id INTEGER DEFAULT 0,
+                last_summary_id INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                activated_at TIMESTAMP
+            )
+        ''')
+        
+        # Ingestion jobs submitted to the API service (shared by every service node)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT,
+                filename TEXT,
+                status TEXT DEFAULT 'queued',
+                video_uuid TEXT,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
         
         conn.commit()
         conn.close()
 
-    def add_video(self, uuid: str, filename: str, smart_title: str):
-        """Adds a new video entry."""
+    @staticmethod
+    def _init_title_search(cursor) -> bool:
+        """
+        Creates the FTS5 index over video titles, kept in sync with triggers.
+        Returns False (titles are then searched with LIKE) when SQLite lacks FTS5.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'videos_fts'")
+        exists = cursor.fetchone() is not None
+        try:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5("
+                "smart_title, content='videos', content_rowid='rowid')"
+            )
+        except sqlite3.OperationalError as e:
+            logging.warning(f"FTS5 unavailable, video titles are searched with LIKE: {e}")
+            return False
+        cursor.executescript('''
+            CREATE TRIGGER IF NOT EXISTS videos_fts_insert AFTER INSERT ON videos BEGIN
+                INSERT INTO videos_fts (rowid, smart_title) VALUES (new.rowid, new.smart_title);
+            END;
+            CREATE TRIGGER IF NOT EXISTS videos_fts_delete AFTER DELETE ON videos BEGIN
+                INSERT INTO videos_fts (videos_fts, rowid, smart_title) VALUES ('delete', old.rowid, old.smart_title);
+            END;
+            CREATE TRIGGER IF NOT EXISTS videos_fts_update AFTER UPDATE OF smart_title ON videos BEGIN
+                INSERT INTO videos_fts (videos_fts, rowid, smart_title) VALUES ('delete', old.rowid, old.smart_title);
+                INSERT INTO videos_fts (rowid, smart_title) VALUES (new.rowid, new.smart_title);
+            END;
+        ''')
+        if not exists:
+            # Index the videos stored before the search index existed
+            cursor.execute("INSERT INTO videos_fts (videos_fts) VALUES ('rebuild')")
+        return True
+
+    @staticmethod
+    def _ensure_column(cursor, table: str, column: str, declaration: str):
+        """Adds a column to an existing table if it is missing."""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def add_video(self, uuid: str, filename: str, smart_title: str, status: str = "processing",
+                  sha256: Optional[str] = None):
+        """Adds a new video entry ('processing' while a file is ingested, 'live' for streams)."""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute(
-            "INSERT INTO videos (uuid, filename, smart_title) VALUES (?, ?, ?)",
-            (uuid, filename, smart_title)
+            "INSERT INTO videos (uuid, filename, smart_title, status, sha256) VALUES (?, ?, ?, ?, ?)",
+            (uuid, filename, smart_title, status, sha256)
         )
         conn.commit()
         conn.close()
+        self.invalidate_library_cache()
+
+    def set_video_status(self, uuid: str, status: str):
+        """Updates the ingestion status of a video."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("UPDATE videos SET status = ? WHERE uuid = ?", (status, uuid))
+        conn.commit()
+        conn.close()
+        self.invalidate_library_cache()
+
+    def update_video_title(self, uuid: str, smart_title: str):
+        """Updates the smart title of a video."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("UPDATE videos SET smart_title = ? WHERE uuid = ?", (smart_title, uuid))
+        conn.commit()
+        conn.close()
+        self.invalidate_library_cache()
+
+    @staticmethod
+    def _insert_analysis(cursor, frame_id: int, video_uuid: str, timestamp: float, analysis: Optional[Dict[str, Any]]):
+        if not analysis:
+            return
+        suspicious = analysis.get("suspicious")
+        cursor.execute(
+            "UPDATE frames SET person_count = ?, vehicle_count = ?, suspicious = ? WHERE id = ?",
+            (analysis.get("person_count"), analysis.get("vehicle_count"),
+             None if suspicious is None else int(suspicious), frame_id)
+        )
+        cursor.executemany(
+            "INSERT INTO frame_labels (frame_id, video_uuid, kind, label, timestamp) VALUES (?, ?, ?, ?, ?)",
+            [(frame_id, video_uuid, "activity", label, timestamp) for label in analysis.get("activities") or []]
+            + [(frame_id, video_uuid, "flag", label, timestamp) for label in analysis.get("flags") or []]
+        )
 
-    def add_frame(self, video_uuid: str, timestamp: float, description: str, image_data: bytes) -> int:
-        """Adds a frame and returns its ID."""
+    def add_frame(self, video_uuid: str, timestamp: float, description: str, image_data: bytes,
+                  telemetry: Optional[Dict[str, float]] = None, thumbnail: Optional[bytes] = None,
+                  analysis: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Adds a frame (with its interpolated telemetry, thumbnail and structured analysis
+        from `parse_frame_analysis`, if any) and returns its ID.
+        """
+        telemetry = telemetry or {}
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute(
-            "INSERT INTO frames (video_uuid, timestamp, description, image_data) VALUES (?, ?, ?, ?)",
-            (video_uuid, timestamp, description, image_data)
+            "INSERT INTO frames (video_uuid, timestamp, description, image_data, latitude, longitude, altitude, heading) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (video_uuid, timestamp, description, image_data, telemetry.get("latitude"),
+             telemetry.get("longitude"), telemetry.get("altitude"), telemetry.get("heading"))
         )
         frame_id = cursor.lastrowid
+        if thumbnail is not None:
+            cursor.execute("INSERT INTO frame_thumbnails (frame_id, thumbnail) VALUES (?, ?)", (frame_id, thumbnail))
+        self._insert_analysis(cursor, frame_id, video_uuid, timestamp, analysis)
         conn.commit()
         conn.close()
         return frame_id
 
+    def add_summary(self, video_uuid: str, level: str, start_time: float, end_time: float, summary: str) -> int:
+        """Adds a segment ('segment') or whole-video ('video') summary and returns its ID."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO summaries (video_uuid, level, start_time, end_time, summary) VALUES (?, ?, ?, ?, ?)",
+            (video_uuid, level, start_time, end_time, summary)
+        )
+        summary_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return summary_id
+
+    def get_summaries(self, video_uuid: str, level: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Retrieves summaries of a video in time order, optionally for one level only."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        if level:
+            cursor.execute(
+                "SELECT * FROM summaries WHERE video_uuid = ? AND level = ? ORDER BY start_time",
+                (video_uuid, level)
+            )
+        else:
+            cursor.execute("SELECT * FROM summaries WHERE video_uuid = ? ORDER BY start_time", (video_uuid,))
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def add_alert(self, video_uuid: str, alert: Dict[str, Any], timestamp: float) -> int:
+        """Opens a new alert incident at `timestamp` and returns its ID."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO alerts (video_uuid, rule_id, type, severity, message, start_time, end_time, first_frame, last_frame) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (video_uuid, alert["rule_id"], alert["type"], alert["severity"], alert["message"],
+             timestamp, timestamp, alert["frame"], alert["frame"])
+        )
+        alert_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return alert_id
+
+    def extend_alert(self, alert_id: int, end_time: float, last_frame: str):
+        """Extends an open alert incident to `end_time`."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE alerts SET end_time = ?, last_frame = ?, frame_count = frame_count + 1 WHERE id = ?",
+            (end_time, last_frame, alert_id)
+        )
+        conn.commit()
+        conn.close()
+
+    def replace_alerts(self, video_uuid: str, incidents: List[Dict[str, Any]]):
+        """Replaces every alert incident of a video with the given ones, in one transaction."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM alerts WHERE video_uuid = ?", (video_uuid,))
+            cursor.executemany(
+                "INSERT INTO alerts (video_uuid, rule_id, type, severity, message, start_time, end_time, "
+                "frame_count, first_frame, last_frame) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(video_uuid, incident["rule_id"], incident["type"], incident["severity"], incident["message"],
+                  incident["start_time"], incident["end_time"], incident["frame_count"],
+                  incident["first_frame"], incident["last_frame"]) for incident in incidents]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_alerts(self, video_uuid: Optional[str] = None, severity: Optional[str] = None,
+                   limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Retrieves alert incidents (newest first) with their video title, using the alert indexes."""
+        conditions, params = ["v.deleted_at IS NULL"], []
+        if video_uuid:
+            conditions.append("a.video_uuid = ?")
+            params.append(video_uuid)
+        if severity:
+            conditions.append("a.severity = ?")
+            params.append(severity)
+        where = f"WHERE {' AND '.join(conditions)}"
+        
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT a.*, v.smart_title FROM alerts a LEFT JOIN videos v ON v.uuid = a.video_uuid "
+            f"{where} ORDER BY a.created_at DESC, a.id DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def count_alerts(self, video_uuid: Optional[str] = None, severity: Optional[str] = None) -> int:
+        """Counts alert incidents matching the filters."""
+        conditions, params = ["v.deleted_at IS NULL"], []
+        if video_uuid:
+            conditions.append("a.video_uuid = ?")
+            params.append(video_uuid)
+        if severity:
+            conditions.append("a.severity = ?")
+            params.append(severity)
+        where = f"WHERE {' AND '.join(conditions)}"
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM alerts a LEFT JOIN videos v ON v.uuid = a.video_uuid {where}", params)
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+
+    def _cached(self, key: Any, loader):
+        now = time.monotonic()
+        with _library_cache_lock:
+            entry = _library_cache.get(self.db_path, {}).get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        value = loader()
+        with _library_cache_lock:
+            _library_cache.setdefault(self.db_path, {})[key] = (now + self.LIBRARY_CACHE_TTL, value)
+        return value
+
+    def invalidate_library_cache(self):
+        """Drops the cached library pages and counts (called by every write to videos)."""
+        with _library_cache_lock:
+            _library_cache.pop(self.db_path, None)
+
+    def _title_filter(self, search: Optional[str]) -> Tuple[str, List[Any]]:
+        """
+        SQL condition on live (not deleted) videos, aliased v, matching every word of
+        `search` as a title prefix.
+        """
+        words = (search or "").split()
+        if not words:
+            return "v.deleted_at IS NULL", []
+        if self.has_fts:
+            match = " AND ".join('"' + word.replace('"', '""') + '"*' for word in words)
+            return "v.deleted_at IS NULL AND v.rowid IN (SELECT rowid FROM videos_fts WHERE videos_fts MATCH ?)", [match]
+        escaped = [word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") for word in words]
+        return (" AND ".join(["v.deleted_at IS NULL"] + ["v.smart_title LIKE ? ESCAPE '\\'" for _ in words]),
+                [f"%{word}%" for word in escaped])
+
+    def count_videos(self, search: Optional[str] = None) -> int:
+        """Counts the videos whose title matches `search` (all videos when empty)."""
+        def load():
+            condition, params = self._title_filter(search)
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM videos v WHERE {condition}", params)
+            count = cursor.fetchone()[0]
+            conn.close()
+            return count
+        return self._cached(("count", search or ""), load)
+
+    def get_videos_page(self, search: Optional[str] = None, limit: int = 25, offset: int = 0) -> List[Dict[str, Any]]:
+        """Retrieves one page of videos (newest first) whose title matches `search`."""
+        def load():
+            condition, params = self._title_filter(search)
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT v.uuid, v.filename, v.smart_title, v.created_at, v.status FROM videos v "
+                f"WHERE {condition} "
+                f"ORDER BY v.created_at DESC, v.rowid DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            )
+            rows = cursor.fetchall()
+            conn.close()
+            return [dict(row) for row in rows]
+        return self._cached(("page", search or "", limit, offset), load)
+
     def get_videos(self) -> List[Dict[str, Any]]:
         """Retrieves all videos."""
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM videos ORDER BY created_at DESC")
+        cursor.execute("SELECT * FROM videos WHERE deleted_at IS NULL ORDER BY created_at DESC")
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def find_video_by_hash(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Retrieves a live video whose uploaded file had this SHA-256, if any."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM videos WHERE sha256 = ? AND deleted_at IS NULL LIMIT 1", (sha256,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def get_videos_by_uuids(self, uuids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Retrieves live (not deleted) video rows for the given UUIDs, keyed by UUID."""
+        if not uuids:
+            return {}
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        placeholders = ",".join("?" * len(uuids))
+        cursor.execute(f"SELECT * FROM videos WHERE uuid IN ({placeholders}) AND deleted_at IS NULL", list(uuids))
+        rows = cursor.fetchall()
+        conn.close()
+        return {row["uuid"]: dict(row) for row in rows}
+
+    def get_frames_by_location(self, geofence: Optional[List[float]] = None,
+                               min_altitude: Optional[float] = None, max_altitude: Optional[float] = None,
+                               video_uuid: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Retrieves frames inside a geofence [min_lat, min_lon, max_lat, max_lon] and/or altitude
+        range, using the telemetry indexes. Image data is not loaded. Frames of tombstoned
+        videos are left out.
+        """
+        conditions, params = ["v.deleted_at IS NULL"], []
+        if geofence:
+            min_lat, min_lon, max_lat, max_lon = geofence
+            conditions.append("f.latitude BETWEEN ? AND ? AND f.longitude BETWEEN ? AND ?")
+            params += [min_lat, max_lat, min_lon, max_lon]
+        if min_altitude is not None:
+            conditions.append("f.altitude >= ?")
+            params.append(min_altitude)
+        if max_altitude is not None:
+            conditions.append("f.altitude <= ?")
+            params.append(max_altitude)
+        if video_uuid:
+            conditions.append("f.video_uuid = ?")
+            params.append(video_uuid)
+        where = f"WHERE {' AND '.join(conditions)}"
+        
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT f.id, f.video_uuid, f.timestamp, f.description, f.latitude, f.longitude, f.altitude, f.heading "
+            f"FROM frames f JOIN videos v ON v.uuid = f.video_uuid {where} ORDER BY f.video_uuid, f.timestamp LIMIT ?",
+            params + [limit]
+        )
         rows = cursor.fetchall()
         conn.close()
         return [dict(row) for row in rows]
 
+    def get_frame_timestamps(self, video_uuid: str) -> List[Tuple[int, float]]:
+        """Retrieves (frame_id, timestamp) of every stored keyframe of a video, in time order."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, timestamp FROM frames WHERE video_uuid = ? ORDER BY timestamp", (video_uuid,))
+        rows = cursor.fetchall()
+        conn.close()
+        return [(row[0], row[1]) for row in rows]
+
+    def delete_frames(self, frame_ids: List[int]):
+        """Deletes the given frames."""
+        if not frame_ids:
+            return
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.executemany("DELETE FROM frames WHERE id = ?", [(frame_id,) for frame_id in frame_ids])
+        cursor.executemany("DELETE FROM frame_thumbnails WHERE frame_id = ?", [(frame_id,) for frame_id in frame_ids])
+        cursor.executemany("DELETE FROM frame_labels WHERE frame_id = ?", [(frame_id,) for frame_id in frame_ids])
+        conn.commit()
+        conn.close()
+
+    def remove_keyframes(self, video_uuid: str, frame_ids: List[int]) -> List[Dict[str, Any]]:
+        """
+        Deletes keyframes of a video (re-keyframing) in one transaction together with the rows
+        derived from them: alert incidents and segment summaries whose time span includes a
+        removed frame. Returns the deleted segment summaries (id, start_time, end_time) so the
+        caller can drop them from the vector store and regenerate them.
+        """
+        if not frame_ids:
+            return []
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            placeholders = ",".join("?" * len(frame_ids))
+            cursor.execute(
+                f"SELECT timestamp FROM frames WHERE video_uuid = ? AND id IN ({placeholders})",
+                [video_uuid, *frame_ids]
+            )
+            timestamps = [row[0] for row in cursor.fetchall()]
+            params = [(frame_id,) for frame_id in frame_ids]
+            cursor.executemany("DELETE FROM frames WHERE id = ?", params)
+            cursor.executemany("DELETE FROM frame_thumbnails WHERE frame_id = ?", params)
+            cursor.executemany("DELETE FROM frame_labels WHERE frame_id = ?", params)
+
+            span = "video_uuid = ? AND start_time <= ? AND end_time >= ?"
+            summaries = {}
+            for timestamp in timestamps:
+                cursor.execute(f"DELETE FROM alerts WHERE {span}", (video_uuid, timestamp, timestamp))
+                cursor.execute(f"SELECT id, start_time, end_time FROM summaries WHERE level = 'segment' AND {span}",
+                               (video_uuid, timestamp, timestamp))
+                summaries.update((row["id"], dict(row)) for row in cursor.fetchall())
+            cursor.executemany("DELETE FROM summaries WHERE id = ?", [(summary_id,) for summary_id in summaries])
+            conn.commit()
+        finally:
+            conn.close()
+        return sorted(summaries.values(), key=lambda summary: summary["start_time"])
+
+    def get_keyframes(self, video_uuid: str, start_time: Optional[float] = None,
+                      end_time: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Retrieves a video's keyframes (id, timestamp, description, telemetry) in time order, without images."""
+        conditions, params = ["video_uuid = ?"], [video_uuid]
+        if start_time is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start_time)
+        if end_time is not None:
+            conditions.append("timestamp <= ?")
+            params.append(end_time)
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, timestamp, description, latitude, longitude, altitude, heading FROM frames "
+            f"WHERE {' AND '.join(conditions)} ORDER BY timestamp, id",
+            params
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def iter_frames(self, video_uuid: str, batch_size: int = 256) -> Iterator[Dict[str, Any]]:
+        """Streams every frame row of a video (with image data) in time order."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, timestamp, description, image_data, latitude, longitude, altitude, heading, "
+                "person_count, vehicle_count, suspicious FROM frames WHERE video_uuid = ? ORDER BY timestamp, id",
+                (video_uuid,)
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
+
+    def import_video(self, video: Dict[str, Any], frames: Iterable[Dict[str, Any]], summaries: List[Dict[str, Any]],
+                     alerts: List[Dict[str, Any]]) -> Tuple[List[int], List[int]]:
+        """
+        Bulk-loads an exported video (row, frames, summaries, alert incidents) in one transaction.
+        Returns the new frame IDs and summary IDs, in input order.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT INTO videos (uuid, filename, smart_title, created_at, status) VALUES (?, ?, ?, ?, ?)",
+                (video["uuid"], video["filename"], video["smart_title"], video["created_at"],
+                 video.get("status") or "complete")
+            )
+            frame_ids = []
+            for frame in frames:
+                cursor.execute(
+                    "INSERT INTO frames (video_uuid, timestamp, description, image_data, latitude, longitude, altitude, heading) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (video["uuid"], frame["timestamp"], frame["description"], frame["image_data"], frame.get("latitude"),
+                     frame.get("longitude"), frame.get("altitude"), frame.get("heading"))
+                )
+                frame_ids.append(cursor.lastrowid)
+                if frame.get("thumbnail") is not None:
+                    cursor.execute("INSERT INTO frame_thumbnails (frame_id, thumbnail) VALUES (?, ?)",
+                                   (frame_ids[-1], frame["thumbnail"]))
+                self._insert_analysis(cursor, frame_ids[-1], video["uuid"], frame["timestamp"], frame.get("analysis"))
+            summary_ids = []
+            for summary in summaries:
+                cursor.execute(
+                    "INSERT INTO summaries (video_uuid, level, start_time, end_time, summary) VALUES (?, ?, ?, ?, ?)",
+                    (video["uuid"], summary["level"], summary["start_time"], summary["end_time"], summary["summary"])
+                )
+                summary_ids.append(cursor.lastrowid)
+            cursor.executemany(
+                "INSERT INTO alerts (video_uuid, rule_id, type, severity, message, start_time, end_time, frame_count, "
+                "first_frame, last_frame, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(video["uuid"], a["rule_id"], a["type"], a["severity"], a["message"], a["start_time"], a["end_time"],
+                  a["frame_count"], a["first_frame"], a["last_frame"], a["created_at"]) for a in alerts]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        self.invalidate_library_cache()
+        return frame_ids, summary_ids
+
     def get_frame_image(self, frame_id: int) -> Optional[bytes]:
         """Retrieves the binary image data for a specific frame."""
         conn = sqlite3.connect(self.db_path)
@@ -84,11 +701,472 @@ class SQLiteHandler:
         conn.close()
         return row[0] if row else None
 
+    def get_frame_span(self, video_uuid: str) -> Dict[str, Any]:
+        """Retrieves the number of keyframes of a video and its first and last keyframe timestamps."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*), MIN(timestamp), MAX(timestamp) FROM frames WHERE video_uuid = ?", (video_uuid,))
+        count, start, end = cursor.fetchone()
+        conn.close()
+        return {"count": count, "start": start or 0.0, "end": end or 0.0}
+
+    def count_frames(self, video_uuid: str, start_time: float, end_time: float) -> int:
+        """Counts the keyframes of a video within [start_time, end_time]."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COUNT(*) FROM frames WHERE video_uuid = ? AND timestamp BETWEEN ? AND ?",
+            (video_uuid, start_time, end_time)
+        )
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+
+    def get_frame_labels(self, video_uuid: str) -> Dict[int, Dict[str, List[str]]]:
+        """Retrieves the analysis labels of a video's keyframes: {frame_id: {"activities", "flags"}}."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT frame_id, kind, label FROM frame_labels WHERE video_uuid = ? ORDER BY rowid", (video_uuid,))
+        labels: Dict[int, Dict[str, List[str]]] = {}
+        for frame_id, kind, label in cursor.fetchall():
+            entry = labels.setdefault(frame_id, {"activities": [], "flags": []})
+            entry["activities" if kind == "activity" else "flags"].append(label)
+        conn.close()
+        return labels
+
+    def get_frame_counts(self, video_uuid: str) -> Dict[str, Any]:
+        """
+        Aggregates the structured analysis of a video's keyframes: the number of frames and
+        of analyzed ones, keyframes showing people / vehicles / flagged as suspicious, and the
+        largest person and vehicle counts with the first keyframe reaching them
+        ({"frame_id", "timestamp", "count"}, None when nothing was analyzed).
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COUNT(*), COUNT(person_count), SUM(person_count > 0), SUM(vehicle_count > 0), SUM(suspicious) "
+            "FROM frames WHERE video_uuid = ?",
+            (video_uuid,)
+        )
+        frames, analyzed, person_frames, vehicle_frames, suspicious_frames = cursor.fetchone()
+        counts = {"frames": frames, "analyzed": analyzed, "person_frames": person_frames or 0,
+                  "vehicle_frames": vehicle_frames or 0, "suspicious_frames": suspicious_frames or 0}
+        for key, column in (("max_people", "person_count"), ("max_vehicles", "vehicle_count")):
+            # Served from idx_frames_people / idx_frames_vehicles
+            cursor.execute(
+                f"SELECT id, timestamp, {column} FROM frames WHERE video_uuid = ? AND {column} IS NOT NULL "
+                f"ORDER BY {column} DESC, timestamp LIMIT 1",
+                (video_uuid,)
+            )
+            row = cursor.fetchone()
+            counts[key] = {"frame_id": row[0], "timestamp": row[1], "count": row[2]} if row else None
+        conn.close()
+        return counts
+
+    def first_appearance(self, video_uuid: str, subject: str) -> Optional[Dict[str, Any]]:
+        """
+        Earliest keyframe ({"frame_id", "timestamp"}) showing `subject`: 'person', 'vehicle',
+        'suspicious', or an activity / suspicion label (matched as a substring).
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        conditions = {"person": "person_count > 0", "vehicle": "vehicle_count > 0", "suspicious": "suspicious = 1"}
+        if subject in conditions:
+            cursor.execute(
+                f"SELECT id, timestamp FROM frames WHERE video_uuid = ? AND {conditions[subject]} "
+                "ORDER BY timestamp LIMIT 1",
+                (video_uuid,)
+            )
+        else:
+            # The label is matched literally: % and _ in it are not wildcards
+            pattern = re.sub(r"([\\%_])", r"\\\1", subject.lower())
+            cursor.execute(
+                "SELECT frame_id, timestamp FROM frame_labels WHERE video_uuid = ? "
+                "AND (label = ? OR label LIKE ? ESCAPE '\\') ORDER BY timestamp LIMIT 1",
+                (video_uuid, subject.lower(), f"%{pattern}%")
+            )
+        row = cursor.fetchone()
+        conn.close()
+        return {"frame_id": row[0], "timestamp": row[1]} if row else None
+
+    def get_frame_thumbnails(self, video_uuid: str, start_time: float, end_time: float,
+                             limit: int = 24, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Retrieves a page of keyframes (id, timestamp, description, thumbnail) within
+        [start_time, end_time] in time order; a range scan on idx_frames_video.
+        `thumbnail` is None for frames stored before thumbnails were generated.
+        """
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT f.id, f.timestamp, f.description, t.thumbnail FROM frames f "
+            "LEFT JOIN frame_thumbnails t ON t.frame_id = f.id "
+            "WHERE f.video_uuid = ? AND f.timestamp BETWEEN ? AND ? ORDER BY f.timestamp LIMIT ? OFFSET ?",
+            (video_uuid, start_time, end_time, limit, offset)
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def get_frame_thumbnails_by_ids(self, frame_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Retrieves keyframes (id, timestamp, description, thumbnail) by ID."""
+        if not frame_ids:
+            return {}
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        placeholders = ",".join("?" * len(frame_ids))
+        cursor.execute(
+            f"SELECT f.id, f.timestamp, f.description, t.thumbnail FROM frames f "
+            f"LEFT JOIN frame_thumbnails t ON t.frame_id = f.id WHERE f.id IN ({placeholders})",
+            list(frame_ids)
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        return {row["id"]: dict(row) for row in rows}
+
+    def set_frame_thumbnails(self, thumbnails: Dict[int, bytes]):
+        """Stores thumbnails by frame ID (backfill for frames ingested without one)."""
+        if not thumbnails:
+            return
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.executemany("INSERT OR REPLACE INTO frame_thumbnails (frame_id, thumbnail) VALUES (?, ?)",
+                           list(thumbnails.items()))
+        conn.commit()
+        conn.close()
+
+    def create_chat_session(self, session_id: str, video_uuid: str):
+        """Starts a new conversation about a video."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO chat_sessions (id, video_uuid) VALUES (?, ?)", (session_id, video_uuid))
+        conn.commit()
+        conn.close()
+
+    def get_chat_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Retrieves a conversation with its compacted summary."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM chat_sessions WHERE id = ?", (session_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def get_chat_sessions(self, video_uuid: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Retrieves the most recent conversations about a video with their message counts."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT s.id, s.created_at, "
+            "(SELECT COUNT(*) FROM chat_messages m WHERE m.session_id = s.id) AS message_count, "
+            "(SELECT content FROM chat_messages m WHERE m.session_id = s.id AND m.role = 'user' "
+            "ORDER BY m.id LIMIT 1) AS first_question "
+            "FROM chat_sessions s WHERE s.video_uuid = ? ORDER BY s.created_at DESC, s.rowid DESC LIMIT ?",
+            (video_uuid, limit)
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def add_chat_message(self, session_id: str, role: str, content: str) -> int:
+        """Appends a message to a conversation and returns its ID."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO chat_messages (session_id, role, content) VALUES (?, ?, ?)",
+            (session_id, role, content)
+        )
+        message_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return message_id
+
+    def get_chat_messages(self, session_id: str, limit: int = 20, after_id: int = 0) -> List[Dict[str, Any]]:
+        """Retrieves the latest `limit` messages with an ID above `after_id`, oldest first."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, role, content, created_at FROM chat_messages "
+            "WHERE session_id = ? AND id > ? ORDER BY id DESC LIMIT ?",
+            (session_id, after_id, limit)
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in reversed(rows)]
+
+    def count_chat_messages(self, session_id: str, after_id: int = 0) -> int:
+        """Counts the messages of a conversation with an ID above `after_id`."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM chat_messages WHERE session_id = ? AND id > ?", (session_id, after_id))
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+
+    def get_chat_messages_range(self, session_id: str, after_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Retrieves the oldest `limit` messages with an ID above `after_id` (used for compaction)."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, role, content FROM chat_messages WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (session_id, after_id, limit)
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def update_chat_summary(self, session_id: str, summary: str, summarized_until: int):
+        """Stores the compacted summary of every message up to `summarized_until`."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE chat_sessions SET summary = ?, summarized_until = ? WHERE id = ?",
+            (summary, summarized_until, session_id)
+        )
+        conn.commit()
+        conn.close()
+
+    def add_job(self, job_id: str, kind: str, filename: str):
+        """Records a queued job."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO jobs (id, kind, filename) VALUES (?, ?, ?)", (job_id, kind, filename))
+        conn.commit()
+        conn.close()
+
+    def update_job(self, job_id: str, status: str, video_uuid: Optional[str] = None, error: Optional[str] = None):
+        """Moves a job to 'running', 'complete' or 'failed' (the last two stamp finished_at)."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE jobs SET status = ?, video_uuid = COALESCE(?, video_uuid), error = ?, "
+            "finished_at = CASE WHEN ? IN ('complete', 'failed') THEN CURRENT_TIMESTAMP END WHERE id = ?",
+            (status, video_uuid, error, status, job_id)
+        )
+        conn.commit()
+        conn.close()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Retrieves a job."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def register_collection(self, name: str, model: str):
+        """Registers a vector collection being built for an embedding model."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO vector_collections (name, model) VALUES (?, ?)", (name, model))
+        conn.commit()
+        conn.close()
+
+    def get_collection(self, name: str) -> Optional[Dict[str, Any]]:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM vector_collections WHERE name = ?", (name,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def get_active_collection(self) -> Optional[Dict[str, Any]]:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM vector_collections WHERE status = 'active'")
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def get_collections(self) -> List[Dict[str, Any]]:
+        """Retrieves every registered collection, oldest first."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM vector_collections ORDER BY created_at, rowid")
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def update_collection_progress(self, name: str, last_frame_id: Optional[int] = None,
+                                   last_summary_id: Optional[int] = None):
+        """Records how far a reindex got (frames and summaries are copied in ID order)."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE vector_collections SET last_frame_id = COALESCE(?, last_frame_id), "
+            "last_summary_id = COALESCE(?, last_summary_id) WHERE name = ?",
+            (last_frame_id, last_summary_id, name)
+        )
+        conn.commit()
+        conn.close()
+
+    def activate_collection(self, name: str):
+        """Makes a collection the active one and retires the previous one, in one transaction."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE vector_collections SET status = 'retired' WHERE status = 'active'")
+            cursor.execute(
+                "UPDATE vector_collections SET status = 'active', activated_at = CURRENT_TIMESTAMP WHERE name = ?",
+                (name,)
+            )
+            if cursor.rowcount != 1:
+                raise ValueError(f"Unknown collection {name}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_frames_after(self, after_id: int, limit: int = 512) -> List[Dict[str, Any]]:
+        """
+        Retrieves the next frames by ID (with their video's filename, title and upload time)
+        for re-embedding; frames of deleted videos are skipped.
+        """
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT f.id, f.video_uuid, f.timestamp, f.description, f.latitude, f.longitude, f.altitude, f.heading, "
+            "v.filename, v.smart_title, v.created_at FROM frames f JOIN videos v ON v.uuid = f.video_uuid "
+            "WHERE f.id > ? AND v.deleted_at IS NULL ORDER BY f.id LIMIT ?",
+            (after_id, limit)
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def get_summaries_after(self, after_id: int, limit: int = 512) -> List[Dict[str, Any]]:
+        """Retrieves the next summaries by ID for re-embedding; summaries of deleted videos are skipped."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT s.* FROM summaries s JOIN videos v ON v.uuid = s.video_uuid "
+            "WHERE s.id > ? AND v.deleted_at IS NULL ORDER BY s.id LIMIT ?",
+            (after_id, limit)
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def tombstone_video(self, video_uuid: str):
+        """Marks a video as deleted; it disappears at once and is purged in the background."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("UPDATE videos SET deleted_at = CURRENT_TIMESTAMP WHERE uuid = ?", (video_uuid,))
+        conn.commit()
+        conn.close()
+        self.invalidate_library_cache()
+
+    def get_deleted_video_uuids(self) -> List[str]:
+        """Retrieves the tombstoned videos still waiting to be purged."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT uuid FROM videos WHERE deleted_at IS NOT NULL ORDER BY deleted_at")
+        rows = cursor.fetchall()
+        conn.close()
+        return [row[0] for row in rows]
+
+    def get_frame_ids(self, video_uuid: str, limit: int = 500) -> List[int]:
+        """Retrieves up to `limit` frame IDs of a video (one purge batch)."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM frames WHERE video_uuid = ? LIMIT ?", (video_uuid, limit))
+        rows = cursor.fetchall()
+        conn.close()
+        return [row[0] for row in rows]
+
+    def get_summary_ids(self, video_uuid: str) -> List[int]:
+        """Retrieves the summary IDs of a video."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM summaries WHERE video_uuid = ?", (video_uuid,))
+        rows = cursor.fetchall()
+        conn.close()
+        return [row[0] for row in rows]
+
+    def incremental_vacuum(self, max_pages: Optional[int] = None) -> int:
+        """
+        Returns free pages to the OS and reports how many were freed. A database created
+        before incremental auto-vacuum was enabled is left alone (a full VACUUM would lock it
+        for its whole duration); convert it once with `enable_incremental_vacuum`.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA auto_vacuum")
+        if cursor.fetchone()[0] != 2:
+            conn.close()
+            logging.warning(f"{self.db_path} does not use incremental auto-vacuum; run "
+                            f"`python -m modules.sqlite_handler {self.db_path}` once to convert it")
+            return 0
+        cursor.execute("PRAGMA freelist_count")
+        free_before = cursor.fetchone()[0]
+        # executescript steps the pragma to completion (execute frees a single page)
+        cursor.executescript(f"PRAGMA incremental_vacuum({int(max_pages or 0)});")
+        cursor.execute("PRAGMA freelist_count")
+        free_after = cursor.fetchone()[0]
+        conn.close()
+        return free_before - free_after
+
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        One-time maintenance: converts a database created before incremental auto-vacuum
+        with a full VACUUM, which rewrites the file and blocks every writer until it is done.
+        Returns False when the database already uses incremental auto-vacuum.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("PRAGMA auto_vacuum")
+            if cursor.fetchone()[0] == 2:
+                return False
+            start = time.time()
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+            logging.info(f"Converted {self.db_path} to incremental auto-vacuum in {time.time() - start:.1f}s")
+            return True
+        finally:
+            conn.close()
+
     def delete_video(self, video_uuid: str):
-        """Deletes a video and all its frames."""
+        """Deletes a video and all its frames (the DeletionCollector purges tombstoned videos with this)."""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute("DELETE FROM videos WHERE uuid = ?", (video_uuid,))
+        cursor.execute(
+            "DELETE FROM frame_thumbnails WHERE frame_id IN (SELECT id FROM frames WHERE video_uuid = ?)",
+            (video_uuid,)
+        )
+        cursor.execute("DELETE FROM frame_labels WHERE video_uuid = ?", (video_uuid,))
         cursor.execute("DELETE FROM frames WHERE video_uuid = ?", (video_uuid,))
+        cursor.execute("DELETE FROM summaries WHERE video_uuid = ?", (video_uuid,))
+        cursor.execute("DELETE FROM alerts WHERE video_uuid = ?", (video_uuid,))
+        cursor.execute(
+            "DELETE FROM chat_messages WHERE session_id IN (SELECT id FROM chat_sessions WHERE video_uuid = ?)",
+            (video_uuid,)
+        )
+        cursor.execute("DELETE FROM chat_sessions WHERE video_uuid = ?", (video_uuid,))
         conn.commit()
         conn.close()
+        self.invalidate_library_cache()
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "videos.db"
+    if not SQLiteHandler(db_path).enable_incremental_vacuum():
+        print(f"{db_path} already uses incremental auto-vacuum")
@@ -0,0 +1,141 @@
+import csv
+import json
+import logging
+import numpy as np
+from typing import Dict, List, Optional
+
+class TelemetryTrack:
+    """
+    Drone telemetry (time, GPS, altitude, heading) held as sorted numpy columns.
+    Frame timestamps are joined by binary search + linear interpolation (np.interp),
+    so a whole flight log joins in milliseconds regardless of its length.
+
+    `time_unit` states how the log's time column is expressed: "seconds" from the video
+    start (the default), or an absolute clock in "epoch" seconds or "epoch_ms" milliseconds,
+    which is rebased so the first sample aligns with the video start. Missing fixes (blank
+    or non-numeric cells) are skipped per column, and frames more than `tolerance` seconds
+    outside a column's fixes get no value for it rather than the nearest one.
+    """
+
+    COLUMNS = ("latitude", "longitude", "altitude", "heading")
+    ALIASES = {
+        "time": ("time", "timestamp", "t", "seconds", "time_s"),
+        "latitude": ("latitude", "lat", "gps_lat"),
+        "longitude": ("longitude", "lon", "lng", "gps_lon"),
+        "altitude": ("altitude", "alt", "altitude_m", "height"),
+        "heading": ("heading", "yaw", "bearing"),
+    }
+    TIME_UNITS = {"seconds": 1.0, "epoch": 1.0, "epoch_ms": 1000.0}
+
+    def __init__(self, times, columns: Dict[str, np.ndarray], time_offset: float = 0.0,
+                 time_unit: str = "seconds", tolerance: float = 1.0):
+        if time_unit not in self.TIME_UNITS:
+            raise ValueError(f"Unknown telemetry time unit {time_unit!r}; expected one of {', '.join(self.TIME_UNITS)}")
+        times = np.asarray(times, dtype=np.float64)
+        # Rows without a time cannot be placed on the video clock
+        keep = np.isfinite(times)
+        times = times[keep]
+        order = np.argsort(times, kind="stable")
+        times = times[order] / self.TIME_UNITS[time_unit]
+        if time_unit != "seconds" and times.size:
+            times = times - times[0]
+        elif times.size and times[0] > 1e6:
+            logging.warning("Telemetry times look like an epoch clock; load it with time_unit='epoch'")
+        self.times = times + time_offset
+        self.tolerance = tolerance
+        self.columns: Dict[str, np.ndarray] = {}
+        self.column_times: Dict[str, np.ndarray] = {}
+        for name, values in columns.items():
+            values = np.asarray(values, dtype=np.float64)[keep][order]
+            present = np.isfinite(values)
+            self.columns[name] = values[present]
+            self.column_times[name] = self.times[present]
+        if "heading" in self.columns:
+            # Unwrap so interpolating 359° -> 1° passes through 0°, not 180°
+            self.columns["heading"] = np.rad2deg(np.unwrap(np.deg2rad(self.columns["heading"])))
+
+    def __len__(self) -> int:
+        return int(self.times.size)
+
+    @classmethod
+    def load(cls, path: str, time_offset: float = 0.0, time_unit: str = "seconds") -> "TelemetryTrack":
+        """
+        Loads a CSV file or a JSON file (list of records or dict of column arrays).
+        Blank, null or non-numeric cells are read as missing fixes.
+        """
+        if path.lower().endswith(".json"):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                keys = data[0].keys() if data else []
+                data = {key: [record.get(key) for record in data] for key in keys}
+        else:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                reader = csv.DictReader(f)
+                data = {name: [] for name in reader.fieldnames or []}
+                for row in reader:
+                    for name in data:
+                        data[name].append(row[name])
+
+        lookup = {key.strip().lower(): key for key in data}
+        resolved = {}
+        for column, aliases in cls.ALIASES.items():
+            for alias in aliases:
+                if alias in lookup:
+                    resolved[column] = _numbers(data[lookup[alias]])
+                    break
+        if "time" not in resolved:
+            raise ValueError(f"Telemetry file {path} has no time column")
+
+        times = resolved.pop("time")
+        track = cls(times, resolved, time_offset=time_offset, time_unit=time_unit)
+        logging.info(f"Loaded {len(track)} telemetry samples ({', '.join(track.columns)}) from {path}")
+        return track
+
+    def sample(self, timestamps) -> Dict[str, np.ndarray]:
+        """
+        Interpolates every telemetry column at the given frame timestamps (vectorized).
+        Timestamps outside a column's fixes (beyond `tolerance`) come back as NaN.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        result = {}
+        for name, values in self.columns.items():
+            times = self.column_times[name]
+            if not times.size:
+                result[name] = np.full(timestamps.shape, np.nan)
+                continue
+            sampled = np.interp(timestamps, times, values)
+            outside = (timestamps < times[0] - self.tolerance) | (timestamps > times[-1] + self.tolerance)
+            result[name] = np.where(outside, np.nan, sampled)
+        if "heading" in result:
+            result["heading"] = np.mod(result["heading"], 360.0)
+        return result
+
+    def at(self, timestamp: float) -> Optional[Dict[str, float]]:
+        """Telemetry at a single frame timestamp, or None when the log does not cover it."""
+        telemetry = {name: float(values[0]) for name, values in self.sample([timestamp]).items()
+                     if np.isfinite(values[0])}
+        return telemetry or None
+
+
+def _numbers(values: List) -> np.ndarray:
+    """Column values as float64, with blank, null or non-numeric cells as NaN."""
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+    result = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            result[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return result
+
+
+def in_geofence(telemetry: Optional[Dict[str, float]], geofence: List[float]) -> bool:
+    """True when the telemetry position lies in [min_lat, min_lon, max_lat, max_lon]."""
+    if not telemetry or "latitude" not in telemetry or "longitude" not in telemetry:
+        return False
+    min_lat, min_lon, max_lat, max_lon = geofence
+    return min_lat <= telemetry["latitude"] <= max_lat and min_lon <= telemetry["longitude"] <= max_lon
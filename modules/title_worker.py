@@ -0,0 +1,68 @@
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+from .rate_limiter import RateLimiter
+from .sqlite_handler import SQLiteHandler
+
+class TitleWorker:
+    """
+    Generates and refines smart titles in a background thread.
+    Requests for the same video are coalesced: only the newest pending input is used,
+    and title calls run at low rate-limit priority so ingestion is never held up.
+    """
+
+    PLACEHOLDER_TITLE = "Processing..."
+
+    def __init__(self, ai_handler, sqlite_handler: SQLiteHandler):
+        self.ai_handler = ai_handler
+        self.sqlite_handler = sqlite_handler
+        self._pending: Dict[str, List[str]] = {}
+        self._condition = threading.Condition()
+        self._busy = False
+        self._thread = threading.Thread(target=self._run, name="title-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, video_uuid: str, descriptions: List[str]):
+        """
+        Queues a (re)title of the video from the given descriptions or summaries. Without
+        any (a video with no keyframes) the placeholder is replaced by the fallback title.
+        """
+        with self._condition:
+            self._pending[video_uuid] = list(descriptions)
+            self._condition.notify_all()
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """Blocks until no title work is pending. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._busy, timeout=timeout)
+
+    def _next_job(self) -> Tuple[str, List[str]]:
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending)
+            video_uuid = next(iter(self._pending))
+            self._busy = True
+            return video_uuid, self._pending.pop(video_uuid)
+
+    def _run(self):
+        while True:
+            video_uuid, descriptions = self._next_job()
+            try:
+                fallback = self.ai_handler.FALLBACK_TITLE
+                if descriptions:
+                    title = self.ai_handler.generate_smart_title(descriptions, priority=RateLimiter.LOW)
+                else:
+                    title = fallback
+                if title == fallback:
+                    # A failed refinement must not overwrite an earlier good title
+                    video = self.sqlite_handler.get_videos_by_uuids([video_uuid]).get(video_uuid)
+                    if not video or video["smart_title"] != self.PLACEHOLDER_TITLE:
+                        continue
+                self.sqlite_handler.update_video_title(video_uuid, title)
+                logging.info(f"Smart Title for {video_uuid}: {title}")
+            except Exception as e:
+                logging.error(f"Error updating title for {video_uuid}: {e}")
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
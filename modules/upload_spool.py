@@ -0,0 +1,53 @@
+import os
+import re
+import hashlib
+import logging
+import tempfile
+from typing import BinaryIO, Optional, Dict, Any
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def spool_upload(source: BinaryIO, filename: str, directory: str = "temp_uploads",
+                 expected_size: Optional[int] = None, max_bytes: Optional[int] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Copies an uploaded file-like object to a unique spool file in fixed-size chunks,
+    hashing (SHA-256) and size-checking while streaming, so memory use does not grow
+    with the file. The spool name keeps only a sanitized extension of `filename`, so
+    concurrent uploads of the same name never collide. A partial file is removed on error.
+    Returns {"path", "size", "sha256"}.
+    """
+    if max_bytes is None and os.getenv("MAX_UPLOAD_MB"):
+        max_bytes = int(float(os.getenv("MAX_UPLOAD_MB")) * 1024 * 1024)
+    if max_bytes is not None and expected_size is not None and expected_size > max_bytes:
+        raise ValueError(f"Upload of {expected_size} bytes exceeds the {max_bytes} byte limit")
+
+    os.makedirs(directory, exist_ok=True)
+    extension = re.sub(r"[^A-Za-z0-9]", "", os.path.splitext(filename)[1])[:8]
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=f".{extension}" if extension else "", dir=directory)
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if hasattr(source, "seek"):
+                source.seek(0)
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise ValueError(f"Upload exceeds the {max_bytes} byte limit")
+                digest.update(chunk)
+                f.write(chunk)
+        if expected_size is not None and size != expected_size:
+            raise ValueError(f"Upload truncated: received {size} of {expected_size} bytes")
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    logging.info(f"Spooled upload {filename} ({size} bytes, sha256 {digest.hexdigest()[:12]}) to {path}")
+    return {"path": path, "size": size, "sha256": digest.hexdigest()}
@@ -0,0 +1,257 @@
+import os
+import time
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Optional, Dict, Any
+
+from .sqlite_handler import SQLiteHandler
+
+DEFAULT_COLLECTION = "Video_Embeddings"
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Backends are shared per process so every handler sees the same in-memory indexes
+_stores: Dict[tuple, "VectorStore"] = {}
+_stores_lock = threading.Lock()
+
+
+class EmbeddingModelMismatch(ValueError):
+    """A write embedded with another model than the collection it would be stored in."""
+
+    def __init__(self, model: str, collection: Dict[str, Any]):
+        super().__init__(f"Embedded with {model}, but collection {collection['name']} uses {collection['model']}")
+        self.model = model
+        self.collection = collection
+
+
+def frame_metadata(video_uuid: str, video_filename: str, frame_name: str, smart_name: str, file_path: str = "",
+                   timestamp: float = 0.0, created_at: Optional[float] = None,
+                   telemetry: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Metadata stored with a keyframe entry."""
+    metadata = {
+        "video_uuid": video_uuid,
+        "video_file_name": video_filename,
+        "frame_name": frame_name,
+        "filename_plus_uuid": f"{video_filename}_{video_uuid}",
+        "smart_name": smart_name,
+        "file_path": file_path,
+        "timestamp": float(timestamp),
+        # Upload time (epoch seconds) so library-wide search can filter by date
+        "created_at": float(created_at if created_at is not None else time.time())
+    }
+    # Telemetry columns (latitude, longitude, altitude, heading) for geofence/altitude filters
+    if telemetry:
+        metadata.update({key: float(value) for key, value in telemetry.items() if value is not None})
+    return metadata
+
+
+def active_collection(sqlite_handler: Optional[SQLiteHandler] = None) -> Dict[str, Any]:
+    """
+    Returns the registry row of the collection queries are served from. The first call
+    registers VECTOR_COLLECTION / EMBEDDING_MODEL (defaults: Video_Embeddings,
+    all-MiniLM-L6-v2) as the active collection.
+    """
+    sqlite_handler = sqlite_handler or SQLiteHandler()
+    collection = sqlite_handler.get_active_collection()
+    if collection is None:
+        name = os.getenv("VECTOR_COLLECTION", DEFAULT_COLLECTION)
+        if sqlite_handler.get_collection(name) is None:
+            sqlite_handler.register_collection(name, os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL))
+        sqlite_handler.activate_collection(name)
+        collection = sqlite_handler.get_active_collection()
+    return collection
+
+
+class VectorStore(ABC):
+    """
+    Storage and similarity search for frame and summary embeddings.
+    Entry ids are "<video_uuid>_<frame_id>" for frames and "<video_uuid>_summary_<id>"
+    for summaries. Query results use the Chroma layout: {"ids", "documents",
+    "metadatas", "distances"}, each a list holding one list per query, with
+    squared L2 distances.
+    """
+
+    def embedding_model(self) -> Optional[str]:
+        """Embedding model of the collection writes go to, when known (None for a plain collection)."""
+        return None
+
+    @abstractmethod
+    def add_entry(self, video_uuid: str, video_filename: str, frame_name: str,
+                  smart_name: str, description: str, embedding: List[float], file_path: str = "",
+                  timestamp: float = 0.0, created_at: Optional[float] = None,
+                  telemetry: Optional[Dict[str, float]] = None):
+        """Adds one analyzed keyframe."""
+
+    @abstractmethod
+    def query(self, query_embedding: List[float], video_uuid: str, n_results: int = 5,
+              geofence: Optional[List[float]] = None, min_altitude: Optional[float] = None,
+              max_altitude: Optional[float] = None) -> Dict[str, Any]:
+        """Nearest keyframes of one video, optionally filtered by geofence and altitude."""
+
+    def query_many(self, query_embeddings: List[List[float]], video_uuid: str, n_results: int = 5,
+                   geofence: Optional[List[float]] = None, min_altitude: Optional[float] = None,
+                   max_altitude: Optional[float] = None) -> Dict[str, Any]:
+        """`query` for several embeddings at once: one result list per embedding, in order."""
+        results = [self.query(embedding, video_uuid, n_results=n_results, geofence=geofence,
+                              min_altitude=min_altitude, max_altitude=max_altitude)
+                   for embedding in query_embeddings]
+        return {key: [result[key][0] for result in results] for key in ("ids", "documents", "metadatas", "distances")}
+
+    @abstractmethod
+    def search_library(self, query_embedding: List[float], n_results: int = 100,
+                       created_after: Optional[float] = None, created_before: Optional[float] = None,
+                       geofence: Optional[List[float]] = None, min_altitude: Optional[float] = None,
+                       max_altitude: Optional[float] = None) -> Dict[str, Any]:
+        """Nearest keyframes across all videos."""
+
+    @abstractmethod
+    def add_summary_entry(self, video_uuid: str, summary_id: int, level: str,
+                          start_time: float, end_time: float, summary: str, embedding: List[float]):
+        """Adds one segment or whole-video summary."""
+
+    @abstractmethod
+    def query_summaries(self, query_embedding: List[float], video_uuid: str, level: str = "segment",
+                        n_results: int = 3) -> Dict[str, Any]:
+        """Nearest summaries of one video at one level."""
+
+    @abstractmethod
+    def get_entries(self, video_uuid: str, summaries: bool = False) -> Dict[str, Dict[str, Any]]:
+        """All entries of a video keyed by id: {"embedding", "document", "metadata"}."""
+
+    @abstractmethod
+    def add_entries(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]],
+                    summaries: bool = False, batch_size: int = 1000):
+        """Bulk-adds precomputed entries."""
+
+    @abstractmethod
+    def delete_entries(self, video_uuid: str, frame_names: List[str]):
+        """Deletes individual frame entries of a video."""
+
+    @abstractmethod
+    def delete_summary_entries(self, video_uuid: str, summary_ids: List[int]):
+        """Deletes individual summary entries of a video."""
+
+    @abstractmethod
+    def delete_video(self, video_uuid: str):
+        """Deletes every entry of a video."""
+
+
+class ActiveVectorStore(VectorStore):
+    """
+    Follows the active collection of the registry, so a reindex switch reaches every
+    process within `refresh_interval` seconds. Deletes are mirrored into collections
+    still being built, so a reindex never brings back a deleted video or frame.
+    Writes may be tagged with the model they were embedded with (`model=`); they are
+    routed by a fresh registry read, and one whose model differs from the active
+    collection's (a switch made meanwhile, possibly by another process) raises
+    EmbeddingModelMismatch instead of mixing vector spaces, so the caller re-embeds it.
+    """
+
+    def __init__(self, backend: str, sqlite_handler: Optional[SQLiteHandler] = None, refresh_interval: float = 5.0):
+        self.backend = backend
+        self.sqlite_handler = sqlite_handler or SQLiteHandler()
+        self.refresh_interval = refresh_interval
+        self._collection: Optional[Dict[str, Any]] = None
+        self._building: List[str] = []
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def collection(self) -> Dict[str, Any]:
+        """Registry row of the active collection (re-read at most every `refresh_interval` seconds)."""
+        with self._lock:
+            if self._collection is None or time.time() - self._checked_at >= self.refresh_interval:
+                self._collection = active_collection(self.sqlite_handler)
+                self._building = [c["name"] for c in self.sqlite_handler.get_collections() if c["status"] == "building"]
+                self._checked_at = time.time()
+            return self._collection
+
+    def refresh(self):
+        with self._lock:
+            self._checked_at = 0.0
+
+    def _store(self) -> VectorStore:
+        return create_vector_store(self.backend, collection=self.collection()["name"])
+
+    def _all_stores(self) -> List[VectorStore]:
+        self.collection()
+        return [self._store()] + [create_vector_store(self.backend, collection=name) for name in self._building]
+
+    def embedding_model(self) -> Optional[str]:
+        return active_collection(self.sqlite_handler)["model"]
+
+    def _write_store(self, model: Optional[str]) -> VectorStore:
+        collection = active_collection(self.sqlite_handler)
+        if collection["name"] != self.collection()["name"]:
+            self.refresh()
+        if model is not None and model != collection["model"]:
+            raise EmbeddingModelMismatch(model, collection)
+        return create_vector_store(self.backend, collection=collection["name"])
+
+    def add_entry(self, *args, model: Optional[str] = None, **kwargs):
+        self._write_store(model).add_entry(*args, **kwargs)
+
+    def query(self, *args, **kwargs) -> Dict[str, Any]:
+        return self._store().query(*args, **kwargs)
+
+    def query_many(self, *args, **kwargs) -> Dict[str, Any]:
+        return self._store().query_many(*args, **kwargs)
+
+    def search_library(self, *args, **kwargs) -> Dict[str, Any]:
+        return self._store().search_library(*args, **kwargs)
+
+    def add_summary_entry(self, *args, model: Optional[str] = None, **kwargs):
+        self._write_store(model).add_summary_entry(*args, **kwargs)
+
+    def query_summaries(self, *args, **kwargs) -> Dict[str, Any]:
+        return self._store().query_summaries(*args, **kwargs)
+
+    def get_entries(self, *args, **kwargs) -> Dict[str, Dict[str, Any]]:
+        return self._store().get_entries(*args, **kwargs)
+
+    def add_entries(self, *args, model: Optional[str] = None, **kwargs):
+        self._write_store(model).add_entries(*args, **kwargs)
+
+    def delete_entries(self, video_uuid: str, frame_names: List[str]):
+        for store in self._all_stores():
+            store.delete_entries(video_uuid, frame_names)
+
+    def delete_summary_entries(self, video_uuid: str, summary_ids: List[int]):
+        for store in self._all_stores():
+            store.delete_summary_entries(video_uuid, summary_ids)
+
+    def delete_video(self, video_uuid: str):
+        for store in self._all_stores():
+            store.delete_video(video_uuid)
+
+
+def create_vector_store(backend: Optional[str] = None, collection: Optional[str] = None) -> VectorStore:
+    """
+    Returns the process-wide vector store selected by VECTOR_STORE:
+    'chroma' (default; CHROMADB_HOST/CHROMADB_PORT, local fallback) or 'embedded'
+    (memory-mapped numpy matrices under VECTOR_STORE_PATH, no server).
+    Without `collection` the store follows the active collection of the registry.
+    """
+    backend = (backend or os.getenv("VECTOR_STORE", "chroma")).lower()
+    if backend not in ("chroma", "embedded"):
+        raise ValueError(f"Unknown VECTOR_STORE backend: {backend}")
+    if collection is None:
+        key = (backend, "active")
+    elif backend == "chroma":
+        key = (backend, os.getenv("CHROMADB_HOST", "localhost"), int(os.getenv("CHROMADB_PORT", 8000)), collection)
+    else:
+        # The original collection keeps the root directory; versions live next to it
+        root = os.getenv("VECTOR_STORE_PATH", "vector_store")
+        key = (backend, root if collection == DEFAULT_COLLECTION else f"{root}-{collection}", collection)
+
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            if collection is None:
+                store = ActiveVectorStore(backend)
+            elif backend == "chroma":
+                from .db_handler import DBHandler
+                store = DBHandler(host=key[1], port=key[2], collection_name=collection)
+            else:
+                from .embedded_store import EmbeddedVectorStore
+                store = EmbeddedVectorStore(root=key[1])
+            _stores[key] = store
+        return store
@@ -3,164 +3,632 @@ import uuid
 import logging
 import io
 import json
-from typing import Dict, Any
+import time
+import calendar
+import threading
+import numpy as np
+from typing import Dict, Any, List, Optional, Callable, Tuple
+from sentence_transformers import SentenceTransformer
 
-from .video_processor import VideoProcessor
+from .video_processor import VideoProcessor, LiveStream, MotionFilter
 from .ai_handler import AIHandler
-from .db_handler import DBHandler
+from .vector_store import create_vector_store, DEFAULT_COLLECTION, EmbeddingModelMismatch
+from .reindexer import Reindexer
 from .sqlite_handler import SQLiteHandler
-from .alert_engine import AlertEngine
+from .alert_engine import AlertEngine, AlertDebouncer
 from .dino_handler import DINOHandler
+from .context_builder import ContextBuilder
+from .query_router import QueryRouter
+from .title_worker import TitleWorker
+from .ingestion_session import IngestionSession
+from .telemetry import TelemetryTrack
+from .embedding_archive import EmbeddingArchive, select_keyframes
+from .frame_index import FrameIndex, index_from_archive
+from .deletion_collector import DeletionCollector
+from .library_search import search_library_page
+from .conversation_memory import ConversationMemory
+from .profiler import profiled
+from .query_coordinator import QueryCoordinator
 
 class VideoAnalysisEngine:
     """Orchestrates the video analysis process."""
     
-    def __init__(self):
+    def __init__(self, frame_index: Optional[FrameIndex] = None, deletion_collector: Optional[DeletionCollector] = None):
         self.video_processor = VideoProcessor()
-        self.ai_handler = AIHandler()
-        self.db_handler = DBHandler(
-            host=os.getenv("CHROMADB_HOST", "localhost"),
-            port=int(os.getenv("CHROMADB_PORT", 8000))
-        )
         self.sqlite_handler = SQLiteHandler()
-        self.alert_engine = AlertEngine()
+        # Chroma or the embedded numpy store (VECTOR_STORE), serving the active collection of the registry
+        self.db_handler = create_vector_store()
+        # Query embeddings must come from the model the active collection was built with
+        self.ai_handler = AIHandler(embedding_model=self.db_handler.collection()["model"])
+        self._embedding_lock = threading.Lock()
+        # Concurrent chat queries share one encode call and one vector lookup per few milliseconds
+        self.query_coordinator = QueryCoordinator(self.ai_handler.get_embeddings, self.db_handler)
+        # Semantic rule examples are embedded with the same model used for Chroma
+        self.alert_engine = AlertEngine(embed_fn=self.ai_handler.get_embeddings)
         self.dino_handler = DINOHandler()
+        self.context_builder = ContextBuilder(
+            max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", 900))
+        )
+        self.query_router = QueryRouter()
+        # Number of keyframes summarized together into one segment summary
+        self.summary_segment_size = int(os.getenv("SUMMARY_SEGMENT_FRAMES", 12))
+        # A first title is generated from this many keyframes, then refined per segment
+        self.title_initial_frames = int(os.getenv("TITLE_INITIAL_FRAMES", 3))
+        self.title_worker = TitleWorker(self.ai_handler, self.sqlite_handler)
+        # Motion pre-filter: sample densely, then skip static frames before DINO
+        self.motion_filter_enabled = os.getenv("MOTION_FILTER", "1") != "0"
+        self.nominal_frame_interval = 0.5
+        # A sampled frame becomes a keyframe when its DINO similarity to the last one drops below this
+        self.keyframe_threshold = float(os.getenv("KEYFRAME_SIMILARITY", 0.90))
+        self.embedding_archive = EmbeddingArchive()
+        # DINO embeddings of every keyframe in the library, for visual near-duplicate search
+        self.frame_index = frame_index or FrameIndex()
+        # Purges what a failed ingestion left behind; without one, the next collector pass does
+        self.deletion_collector = deletion_collector
+        self.conversation_memory = ConversationMemory(self.sqlite_handler, self.ai_handler)
+
+    def _sync_embedding_model(self, model=None):
+        """Follows a collection switch (possibly made by another process) with the matching text model."""
+        target = self.db_handler.collection()["model"]
+        if target == self.ai_handler.embedding_model_name:
+            return
+        with self._embedding_lock:
+            if target != self.ai_handler.embedding_model_name:
+                self.ai_handler.set_embedding_model(target, model)
+                # Semantic alert rule examples are re-embedded in the new space
+                self.alert_engine = AlertEngine(embed_fn=self.ai_handler.get_embeddings)
+
+    def embed_texts(self, texts: List[str]) -> Tuple[List[List[float]], str]:
+        """Embeddings of `texts` in the active collection's space, and that model's name."""
+        self._sync_embedding_model()
+        return self.ai_handler.embed_tagged(texts)
+
+    def write_embedded(self, text: str, write: Callable[[List[float], str], None],
+                       embedded: Optional[Tuple[List[float], str]] = None) -> List[float]:
+        """
+        Embeds `text` (unless `embedded`, an (embedding, model) pair, is given) and passes the
+        embedding and its model to `write`. When the active collection switched models
+        meanwhile, the store rejects the write; the text is then re-embedded with the new
+        model and written again. Returns the stored embedding.
+        """
+        if embedded is None:
+            embeddings, model = self.ai_handler.embed_tagged([text])
+            embedded = (embeddings[0], model)
+        try:
+            write(*embedded)
+            return embedded[0]
+        except EmbeddingModelMismatch as e:
+            logging.info(f"Re-embedding a write for the new collection: {e}")
+        embeddings, model = self.embed_texts([text])
+        write(embeddings[0], model)
+        return embeddings[0]
+
+    def reindex(self, model_name: Optional[str] = None, collection: Optional[str] = None,
+                batch_size: int = 512, switch: bool = True, background: bool = False,
+                stop_event: Optional[threading.Event] = None):
+        """
+        Re-embeds every stored description and summary with `model_name` (default:
+        EMBEDDING_MODEL) into a new versioned collection while the active one keeps serving,
+        then (with `switch`) makes it active in one registry transaction and copies what
+        was ingested meanwhile. An unfinished reindex for the same model is resumed.
+        Returns the throughput report, or the running Reindexer with `background=True`.
+        """
+        active = self.db_handler.collection()
+        model_name = model_name or os.getenv("EMBEDDING_MODEL", active["model"])
+        if collection is None:
+            collections = self.sqlite_handler.get_collections()
+            building = [c for c in collections if c["status"] == "building" and c["model"] == model_name]
+            base_name = os.getenv("VECTOR_COLLECTION", DEFAULT_COLLECTION)
+            collection = building[-1]["name"] if building else f"{base_name}_v{len(collections) + 1}"
+        if self.sqlite_handler.get_collection(collection) is None:
+            self.sqlite_handler.register_collection(collection, model_name)
+        elif self.sqlite_handler.get_collection(collection)["model"] != model_name:
+            raise ValueError(f"Collection {collection} was built with another model")
+        self.db_handler.refresh()
+
+        model = self.ai_handler.embedding_model if model_name == self.ai_handler.embedding_model_name \
+            else SentenceTransformer(model_name)
+        target_store = create_vector_store(collection=collection)
+        reindexer = Reindexer(self.sqlite_handler, lambda texts: model.encode(texts, batch_size=64), target_store,
+                              collection, batch_size=batch_size)
+
+        def finish(report: Dict[str, Any]) -> Dict[str, Any]:
+            if not (switch and report["complete"]):
+                return report
+            self.sqlite_handler.activate_collection(collection)
+            self.db_handler.refresh()
+            self._sync_embedding_model(model)
+            # Rows ingested into the previous collection while it was still serving
+            catch_up = reindexer.run(stop_event)
+            report.update(switched=True, frames=report["frames"] + catch_up["frames"],
+                          summaries=report["summaries"] + catch_up["summaries"])
+            return report
+
+        if background:
+            reindexer.start(on_done=finish, stop_event=stop_event)
+            return reindexer
+        return finish(reindexer.run(stop_event))
 
-    def process_video(self, video_path: str):
+    @profiled("process_video")
+    def process_video(self, video_path: str, telemetry_path: Optional[str] = None, telemetry_offset: float = 0.0,
+                      telemetry_time_unit: str = "seconds", decode_workers: Optional[int] = None, video_filename: Optional[str] = None,
+                      sha256: Optional[str] = None):
+        """
+        Analyzes a video file. An optional telemetry log (CSV/JSON with time, GPS, altitude,
+        heading) is joined to every keyframe; `telemetry_offset` shifts it onto the video clock
+        and `telemetry_time_unit` ("seconds", "epoch" or "epoch_ms") says how its times are given.
+        With `decode_workers` > 1 (default: PARALLEL_DECODE_WORKERS) the video is decoded in
+        parallel time ranges; the sampled frames and timestamps are the same as sequentially.
+        `video_filename` (the original upload name) and `sha256` are stored with the video.
+        """
         if not os.path.exists(video_path):
             logging.error(f"Video file not found: {video_path}")
             return
+        self._sync_embedding_model()
+        
+        telemetry = TelemetryTrack.load(telemetry_path, time_offset=telemetry_offset,
+                                        time_unit=telemetry_time_unit) if telemetry_path else None
 
-        video_filename = os.path.basename(video_path)
+        video_filename = video_filename or os.path.basename(video_path)
         video_uuid = str(uuid.uuid4())
+        created_at = time.time()
         logging.info(f"Processing video: {video_filename} (UUID: {video_uuid})")
 
-        # 1. Create Video Entry in SQLite (Title will be updated later)
-        self.sqlite_handler.add_video(video_uuid, video_filename, "Processing...")
+        # 1. Create Video Entry in SQLite (Title is filled in by the background title worker)
+        self.sqlite_handler.add_video(video_uuid, video_filename, TitleWorker.PLACEHOLDER_TITLE, sha256=sha256)
 
         # 2. Stream and Filter Frames (Batch Processing)
         logging.info("Streaming and filtering frames with batch processing...")
+        archive_writer = self.embedding_archive.writer(video_uuid)
+        try:
+            session = IngestionSession(self, video_uuid, video_filename, created_at, telemetry=telemetry,
+                                       motion_filter=self._new_motion_filter(self.nominal_frame_interval),
+                                       archive_writer=archive_writer)
+            # With the motion filter on, candidates are sampled twice as densely and thinned by motion
+            base_interval = self.nominal_frame_interval / 2 if self.motion_filter_enabled else self.nominal_frame_interval
+
+            batch_size = 8
+            frame_batch = []
+
+            if decode_workers is None:
+                decode_workers = int(os.getenv("PARALLEL_DECODE_WORKERS", 0))
+            if decode_workers > 1:
+                frames = self.video_processor.stream_frames_parallel(video_path, workers=decode_workers,
+                                                                      base_interval=base_interval)
+            else:
+                frames = self.video_processor.stream_frames(video_path, base_interval=base_interval)
+
+            # Main Loop
+            for pil_image, timestamp in frames:
+                frame_batch.append((pil_image, timestamp))
+
+                if len(frame_batch) >= batch_size:
+                    session.process_batch(frame_batch)
+                    frame_batch = []
+
+            # Process remaining frames
+            if frame_batch:
+                session.process_batch(frame_batch)
+
+            # 3. Summaries and final title
+            result = session.finish()
+        except Exception:
+            # A failed ingestion must not stay 'processing' in the library: the partial video is
+            # tombstoned (hidden at once) and its frames, vectors and index rows purged
+            logging.exception(f"Ingestion of {video_filename} ({video_uuid}) failed")
+            archive_writer.abort()
+            if self.deletion_collector is not None:
+                self.deletion_collector.delete(video_uuid)
+            else:
+                self.sqlite_handler.tombstone_video(video_uuid)
+            raise
+        self.sqlite_handler.set_video_status(video_uuid, "complete")
+        return result
+
+    def process_live(self, source: str, max_duration: Optional[float] = None,
+                     stop_event: Optional[threading.Event] = None, realtime: bool = False,
+                     sample_interval: float = 0.5, on_stats: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Ingests a live source (RTSP/HTTP URL, device index, or a file replayed in real time)
+        into a "live" video entry that grows as keyframes are analyzed.
+        Frames are sampled on wall-clock time and stale frames are dropped under backpressure,
+        so analysis never lags far behind the stream. Reports end-to-end latency per frame.
+        """
+        # Opened first: an unreachable source must not leave a "live" video or archive behind
+        stream = LiveStream(
+            source,
+            sample_interval=sample_interval / 2 if self.motion_filter_enabled else sample_interval,
+            max_buffer=int(os.getenv("LIVE_MAX_BUFFER", 4)),
+            realtime=realtime,
+            max_duration=max_duration,
+            stop_event=stop_event
+        )
+        video_uuid = str(uuid.uuid4())
+        created_at = time.time()
+        video_filename = f"live:{source}"
+        logging.info(f"Starting live ingestion: {source} (UUID: {video_uuid})")
+        archive_writer = None
+        try:
+            self.sqlite_handler.add_video(video_uuid, video_filename, TitleWorker.PLACEHOLDER_TITLE, status="live")
+            archive_writer = self.embedding_archive.writer(video_uuid)
+            session = IngestionSession(self, video_uuid, video_filename, created_at,
+                                       motion_filter=self._new_motion_filter(sample_interval),
+                                       archive_writer=archive_writer)
+        except Exception:
+            stream.stop()
+            if archive_writer is not None:
+                archive_writer.close()  # Nothing appended: removes the partial file
+            self.sqlite_handler.delete_video(video_uuid)
+            raise
+        latencies = []
+        stats: Dict[str, Any] = {"video_uuid": video_uuid}
+        try:
+            # Take whatever is buffered (up to a small batch) so DINO still batches without adding delay
+            for batch in stream.batches(max_batch=4):
+                session.process_batch([(image, stream_time) for image, stream_time, _ in batch])
+                now = time.time()
+                latencies.extend(now - captured_at for _, _, captured_at in batch)
+                
+                recent = sorted(latencies[-200:])
+                stats.update({
+                    "frames": len(latencies),
+                    "keyframes": len(session.descriptions),
+                    "dropped": stream.dropped,
+                    "latency_last": now - batch[-1][2],
+                    "latency_p50": recent[len(recent) // 2],
+                    "latency_max": recent[-1]
+                })
+                if on_stats:
+                    on_stats(dict(stats))
+        finally:
+            stream.stop()
+            result = session.finish()
+            self.sqlite_handler.set_video_status(video_uuid, "complete")
         
-        current_base_emb = None
-        current_base_time = 0.0
-        
-        descriptions = {}
-        alerts_generated = []
-        frame_count = 0
+        if latencies:
+            logging.info(
+                f"Live ingestion finished: {stats['frames']} frames, {stats['dropped']} dropped, "
+                f"latency p50 {stats['latency_p50']:.2f}s max {stats['latency_max']:.2f}s"
+            )
+        result["stats"] = stats
+        return result
+
+    def rekeyframe(self, video_uuid: str, video_path: str, threshold: Optional[float] = None,
+                   telemetry_path: Optional[str] = None, telemetry_offset: float = 0.0,
+                   telemetry_time_unit: str = "seconds") -> Dict[str, Any]:
+        """
+        Reruns keyframe selection for an ingested video from its archived DINO embeddings.
+        Keyframes that are no longer selected are removed from SQLite and Chroma; only frames
+        that become new keyframes are decoded from `video_path` and described with Groq.
+        Alert incidents are rebuilt from the new keyframe set, and segment summaries that
+        covered a removed keyframe are regenerated; the video summary and title are kept.
+        """
+        start = time.time()
+        archived = self.embedding_archive.load(video_uuid)
+        if archived is None:
+            raise ValueError(f"No embedding archive for video {video_uuid}")
+        timestamps, embeddings = archived
+        threshold = self.keyframe_threshold if threshold is None else threshold
+
+        selected = timestamps[select_keyframes(embeddings, threshold)]
+        selection_seconds = time.time() - start
+        # Sampled timestamps are frame_index / fps, so millisecond rounding identifies a frame
+        selected_keys = {round(float(t), 3) for t in selected}
+        existing = self.sqlite_handler.get_frame_timestamps(video_uuid)
+        existing_keys = {round(t, 3) for _, t in existing}
+
+        removed = [frame_id for frame_id, t in existing if round(t, 3) not in selected_keys]
+        added = [float(t) for t in selected if round(float(t), 3) not in existing_keys]
+        # Frames, and the alerts and segment summaries built from them, go in one transaction
+        stale_summaries = self.sqlite_handler.remove_keyframes(video_uuid, removed)
+        self.db_handler.delete_entries(video_uuid, [str(frame_id) for frame_id in removed])
+        self.db_handler.delete_summary_entries(video_uuid, [summary["id"] for summary in stale_summaries])
+        self.frame_index.delete_frames(video_uuid, removed)
+
+        if added:
+            video = self.sqlite_handler.get_videos_by_uuids([video_uuid]).get(video_uuid, {})
+            telemetry = TelemetryTrack.load(telemetry_path, time_offset=telemetry_offset,
+                                            time_unit=telemetry_time_unit) if telemetry_path else None
+            # SQLite CURRENT_TIMESTAMP is UTC; library date filters use the epoch in Chroma
+            created_at = time.time()
+            if video.get("created_at"):
+                created_at = calendar.timegm(time.strptime(video["created_at"], "%Y-%m-%d %H:%M:%S"))
+            session = IngestionSession(self, video_uuid, video.get("filename", os.path.basename(video_path)),
+                                       created_at, telemetry=telemetry, build_summaries=False, check_alerts=False)
+            rows = {round(float(t), 3): i for i, t in enumerate(timestamps)}
+            for pil_image, timestamp in self.video_processor.read_frames_at(video_path, added):
+                row = rows.get(round(float(timestamp), 3))
+                session.analyze_keyframe(pil_image, timestamp,
+                                         dino_embedding=None if row is None else np.asarray(embeddings[row]))
+        if removed or added:
+            self._rebuild_alerts(video_uuid)
+        for summary in stale_summaries:
+            self._resummarize_segment(video_uuid, summary["start_time"], summary["end_time"])
+
+        report = {
+            "video_uuid": video_uuid,
+            "threshold": threshold,
+            "sampled_frames": int(timestamps.size),
+            "keyframes": len(selected),
+            "added": len(added),
+            "removed": len(removed),
+            "resummarized": len(stale_summaries),
+            "selection_seconds": selection_seconds,
+            "total_seconds": time.time() - start
+        }
+        logging.info(f"Re-keyframed {video_uuid}: {report}")
+        return report
+
+    def _rebuild_alerts(self, video_uuid: str):
+        """Reruns the alert rules over a video's keyframes and replaces its alert incidents."""
+        frames = self.sqlite_handler.get_keyframes(video_uuid)
+        debouncer = AlertDebouncer(None, video_uuid, self.alert_engine)
+        if frames:
+            embeddings = self.ai_handler.get_embeddings([f"[{f['timestamp']:.1f}s]: {f['description']}"
+                                                         for f in frames])
+            telemetry = [{name: f[name] for name in TelemetryTrack.COLUMNS if f[name] is not None} or None
+                         for f in frames]
+            alerts = self.alert_engine.check_batch([(f["description"], f"frame_{f['timestamp']:.2f}") for f in frames],
+                                                   embeddings=embeddings, telemetry=telemetry)
+            for frame, frame_alerts in zip(frames, alerts):
+                for alert in frame_alerts:
+                    debouncer.add(alert, frame["timestamp"])
+        self.sqlite_handler.replace_alerts(video_uuid, debouncer.incidents)
+
+    def _resummarize_segment(self, video_uuid: str, start_time: float, end_time: float):
+        """Summarizes a segment again from the keyframes it now contains."""
+        frames = self.sqlite_handler.get_keyframes(video_uuid, start_time, end_time)
+        if not frames:
+            return
+        summary = self.ai_handler.summarize_descriptions(
+            [f"[{f['timestamp']:.1f}s]: {f['description']}" for f in frames], scope="segment"
+        )
+        if summary:
+            self.store_summary(video_uuid, "segment", frames[0]["timestamp"], frames[-1]["timestamp"], summary)
+
+    def backfill_frame_index(self, video_uuids: Optional[List[str]] = None) -> int:
+        """
+        Adds videos missing from the frame index (ingested before it existed, or imported)
+        from their DINO embedding archives. Returns the number of keyframes indexed.
+        """
+        indexed = 0
+        for video_uuid in video_uuids or [video["uuid"] for video in self.sqlite_handler.get_videos()]:
+            archived = self.embedding_archive.load(video_uuid)
+            if archived is None or self.frame_index.indexed(video_uuid):
+                continue
+            indexed += index_from_archive(self.frame_index, video_uuid,
+                                          self.sqlite_handler.get_frame_timestamps(video_uuid), archived)
+        return indexed
+
+    def _with_frames(self, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Index hits of deleted videos (purge pending) are dropped; the rest get their video and frame text
+        videos = self.sqlite_handler.get_videos_by_uuids(list({hit["video_uuid"] for hit in hits}))
+        frames = self.sqlite_handler.get_frame_thumbnails_by_ids([hit["frame_id"] for hit in hits])
+        results = []
+        for hit in hits:
+            video, frame = videos.get(hit["video_uuid"]), frames.get(hit["frame_id"])
+            if video is None or frame is None:
+                continue
+            results.append({**hit, "filename": video["filename"], "smart_title": video["smart_title"],
+                            "created_at": video["created_at"], "description": frame["description"],
+                            "thumbnail": frame["thumbnail"]})
+        return results
+
+    def find_similar_frames(self, frame_id: int, n_results: int = 10, include_same_video: bool = False,
+                            min_similarity: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Keyframes across the library that look like the given keyframe ("every time we passed
+        this spot"), most similar first, with their video, description and thumbnail.
+        """
+        hits = self.frame_index.query_frame(frame_id, n_results=n_results, include_same_video=include_same_video,
+                                            min_similarity=min_similarity)
+        return self._with_frames(hits)
+
+    def detect_changes(self, video_uuid: str, match_threshold: float = 0.80,
+                       change_threshold: float = 0.92) -> Dict[str, Any]:
+        """
+        Compares a video with its nearest earlier pass over the same place (the earlier video
+        sharing the most look-alike keyframes) and classifies every keyframe as "unchanged",
+        "changed" or "unmatched" (see FrameIndex.change_report). Changed keyframes come with
+        both descriptions, so the report can be read without opening the frames.
+        """
+        videos = self.sqlite_handler.get_videos()  # newest first
+        position = next((i for i, video in enumerate(videos) if video["uuid"] == video_uuid), None)
+        if position is None:
+            raise ValueError(f"Unknown video {video_uuid}")
+        self.backfill_frame_index([video_uuid])
+        report = self.frame_index.change_report(video_uuid, [video["uuid"] for video in videos[position + 1:]],
+                                                match_threshold=match_threshold, change_threshold=change_threshold)
+        changed = [frame for frame in report["frames"] if frame["status"] == "changed"]
+        descriptions = self.sqlite_handler.get_frame_thumbnails_by_ids(
+            [frame["frame_id"] for frame in changed] + [frame["reference_frame_id"] for frame in changed]
+        )
+        for frame in changed:
+            frame["description"] = descriptions.get(frame["frame_id"], {}).get("description")
+            frame["reference_description"] = descriptions.get(frame["reference_frame_id"], {}).get("description")
+        logging.info(f"Change report for {video_uuid} against {report['reference_uuid']}: "
+                     f"{report['changed']} changed, {report['unmatched']} unmatched of {report['keyframes']}")
+        return report
+
+    def _new_motion_filter(self, nominal_interval: float) -> Optional[MotionFilter]:
+        if not self.motion_filter_enabled:
+            return None
+        return MotionFilter(
+            static_threshold=float(os.getenv("MOTION_STATIC_THRESHOLD", 3.0)),
+            high_motion_threshold=float(os.getenv("MOTION_HIGH_THRESHOLD", 12.0)),
+            nominal_interval=nominal_interval
+        )
+
+    def store_summary(self, video_uuid: str, level: str, start_time: float, end_time: float, summary: str):
+        """Persists a summary in SQLite and indexes it in the Chroma summary collection."""
+        summary_id = self.sqlite_handler.add_summary(video_uuid, level, start_time, end_time, summary)
+        self.write_embedded(summary, lambda embedding, model: self.db_handler.add_summary_entry(
+            video_uuid, summary_id, level, start_time, end_time, summary, embedding, model=model))
+
+    def _summary_context(self, video_uuid: str, query_embedding) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Builds a small context from the video summary plus the most relevant segment summaries.
+        Returns the context and the time ranges it was built from.
+        """
+        video_summaries = self.sqlite_handler.get_summaries(video_uuid, level="video")
+        if not video_summaries:
+            return "", []
+        results = self.db_handler.query_summaries(query_embedding, video_uuid, level="segment")
+        return self.context_builder.build_summary_context(video_summaries[0], results)
+
+    SUBJECT_NAMES = {"person": ("person", "people"), "vehicle": ("vehicle", "vehicles")}
+
+    def _aggregate_answer(self, video_uuid: str, query_text: str) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Answers count, maximum and first-appearance questions from the structured frame
+        analysis in SQLite, without retrieval or a Groq call. Returns (answer, sources), or
+        None when the question is not a plain aggregate or SQL has nothing to show for it
+        (the video has no analyzed keyframes, or none with the subject): a miss may just be
+        a detection or labelling gap, so retrieval gets to try.
+        """
+        plan = self.query_router.aggregate(query_text)
+        if plan is None:
+            return None
+        counts = self.sqlite_handler.get_frame_counts(video_uuid)
+        if not counts["analyzed"]:
+            return None
+        op, subject = plan["op"], plan["subject"]
+        analyzed = counts["analyzed"]
+
+        def source(frame):
+            return [{"type": "frame", "frame_id": frame["frame_id"], "timestamp": frame["timestamp"]}]
+
+        if op == "first":
+            frame = self.sqlite_handler.first_appearance(video_uuid, subject)
+            if frame is None:
+                return None
+            if subject == "suspicious":
+                what = "Suspicious activity"
+            elif subject in self.SUBJECT_NAMES:
+                what = f"The first {self.SUBJECT_NAMES[subject][0]}"
+            else:
+                what = f"'{subject}'"
+            return f"{what} first appears at {frame['timestamp']:.1f}s.", source(frame)
+
+        if subject == "suspicious":
+            frame = self.sqlite_handler.first_appearance(video_uuid, "suspicious")
+            if frame is None:
+                return None
+            return (f"{counts['suspicious_frames']} of {analyzed} analyzed keyframes were flagged as suspicious, "
+                    f"the first at {frame['timestamp']:.1f}s."), source(frame)
+
+        singular, plural = self.SUBJECT_NAMES[subject]
+        peak = counts["max_people" if subject == "person" else "max_vehicles"]
+        frames_with = counts["person_frames" if subject == "person" else "vehicle_frames"]
+        if not peak or not peak["count"]:
+            return None
+        noun = singular if peak["count"] == 1 else plural
+        if op == "max":
+            return f"At most {peak['count']} {noun} are visible at once, first at {peak['timestamp']:.1f}s.", source(peak)
+        return (f"Up to {peak['count']} {noun} are visible at once (at {peak['timestamp']:.1f}s); "
+                f"{plural} appear in {frames_with} of {analyzed} analyzed keyframes."), source(peak)
+
+    @profiled("query_video")
+    def query_video(self, video_uuid: str, query_text: str, geofence: Optional[List[float]] = None,
+                    min_altitude: Optional[float] = None, max_altitude: Optional[float] = None,
+                    session_id: Optional[str] = None, return_sources: bool = False):
+        """
+        Answers a question about one video. With a `session_id` the exchange is stored in the
+        chat history and the answer sees the recent turns and the compacted conversation summary.
+        With `return_sources` returns {"answer", "sources"}: the keyframes the answer was built
+        from ({"type": "frame", "frame_id", "timestamp"}) or, for summary answers, the summarized
+        time ranges ({"type": "segment"/"video", "start_time", "end_time"}).
+        """
+        logging.info(f"Querying video {video_uuid} with: {query_text}")
+        history, conversation_summary = [], ""
+        retrieval_text = query_text
+        if session_id:
+            history, conversation_summary = self.conversation_memory.context(session_id)
+            previous_questions = [m["content"] for m in history if m["role"] == "user"]
+            if previous_questions:
+                # Follow-ups ("and after that?") retrieve with the previous question's subject
+                retrieval_text = f"{previous_questions[-1]}\n{query_text}"
+
+        telemetry_filters = {"geofence": geofence, "min_altitude": min_altitude, "max_altitude": max_altitude}
+        has_telemetry_filter = any(value is not None for value in telemetry_filters.values())
+        # Counts and first appearances come straight from the analysis columns
+        aggregate = None if has_telemetry_filter else self._aggregate_answer(video_uuid, query_text)
+        if aggregate is not None:
+            logging.info("Answering from structured frame analysis")
+            answer, sources = aggregate
+        else:
+            answer, sources = self._retrieval_answer(video_uuid, query_text, retrieval_text, telemetry_filters,
+                                                     has_telemetry_filter, history, conversation_summary)
+        if session_id:
+            self.conversation_memory.record(session_id, query_text, answer,
+                                            failed=answer.startswith(self.ai_handler.QUERY_ERROR))
+            self.conversation_memory.compact_async(session_id)
+        if return_sources:
+            return {"answer": answer, "sources": sources}
+        return answer
+
+    def _retrieval_answer(self, video_uuid: str, query_text: str, retrieval_text: str,
+                          telemetry_filters: Dict[str, Any], has_telemetry_filter: bool,
+                          history: List[Dict[str, str]], conversation_summary: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """Answers with Groq from the summaries or the retrieved keyframe descriptions."""
+        self._sync_embedding_model()
+        query_embedding = self.query_coordinator.embed(retrieval_text)
         
-        batch_size = 8
-        frame_batch = []
+        context = None
+        sources = []
+        # Whole-video questions are answered from precomputed summaries when available
+        if not has_telemetry_filter and self.query_router.route(query_text) == "global":
+            context, sources = self._summary_context(video_uuid, query_embedding)
+            if context:
+                logging.info("Answering from video summaries")
         
-        # Helper to process a batch
-        def process_batch(batch):
-            nonlocal current_base_emb, current_base_time, frame_count
-            
-            images = [f[0] for f in batch]
-            timestamps = [f[1] for f in batch]
+        if not context:
+            results = self.query_coordinator.query(query_embedding, video_uuid,
+                                                   n_results=self.context_builder.max_results, **telemetry_filters)
             
-            # Batch DINO Embeddings
-            embeddings = self.dino_handler.get_embeddings_batch(images)
-            if embeddings is None:
-                return
-
-            for i, emb in enumerate(embeddings):
-                timestamp = timestamps[i]
-                pil_image = images[i]
-                
-                # Similarity Check (Sequential logic preserved)
-                if current_base_emb is not None:
-                    similarity = self.dino_handler.compute_similarity(current_base_emb, emb)
-                    if similarity >= 0.90:
-                        frame_count += 1
-                        continue # Skip redundant frame
-
-                # New Keyframe Selected
-                logging.info(f"Selected keyframe at {timestamp:.2f}s")
-                current_base_emb = emb
-                current_base_time = timestamp
-                frame_name = f"frame_{timestamp:.2f}"
-                
-                # AI Analysis
-                desc = self.ai_handler.generate_image_description(pil_image, frame_name)
-                descriptions[frame_name] = desc
-                
-                # Alert Check
-                alert = self.alert_engine.check_rules(desc, frame_name)
-                if alert:
-                    alerts_generated.append(alert)
-                
-                # Save Frame to SQLite (BLOB)
-                img_byte_arr = io.BytesIO()
-                pil_image.save(img_byte_arr, format='JPEG')
-                img_bytes = img_byte_arr.getvalue()
-                
-                frame_id = self.sqlite_handler.add_frame(video_uuid, timestamp, desc, img_bytes)
-                
-                # Store in ChromaDB
-                enriched_desc = f"[{timestamp:.1f}s]: {desc}"
-                embedding = self.ai_handler.get_embedding(enriched_desc)
-                
-                self.db_handler.add_entry(
-                    video_uuid=video_uuid,
-                    video_filename=video_filename,
-                    frame_name=str(frame_id),
-                    smart_name="Processing...", 
-                    description=enriched_desc,
-                    embedding=embedding,
-                    file_path=""
+            # Format context for AI answer (token-budgeted, de-duplicated, in time order)
+            context = ""
+            if results['documents']:
+                context, selected = self.context_builder.build(
+                    results['documents'][0],
+                    results['metadatas'][0],
+                    results['distances'][0]
                 )
-                
-                frame_count += 1
-
-        # Main Loop
-        for pil_image, timestamp in self.video_processor.stream_frames(video_path):
-            frame_batch.append((pil_image, timestamp))
-            
-            if len(frame_batch) >= batch_size:
-                process_batch(frame_batch)
-                frame_batch = []
-        
-        # Process remaining frames
-        if frame_batch:
-            process_batch(frame_batch)
-
-        # 3. Generate Smart Title
-        logging.info("Generating smart title...")
-        smart_title = self.ai_handler.generate_smart_title(descriptions)
-        logging.info(f"Smart Title: {smart_title}")
+                sources = [
+                    {"type": "frame", "frame_id": int(entry["metadata"]["frame_name"]), "timestamp": entry["timestamp"]}
+                    for entry in selected if entry["metadata"] and str(entry["metadata"].get("frame_name", "")).isdigit()
+                ]
         
-        # Update Title in SQLite
-        # We need a method to update, for now re-insert or just rely on the fact we can't easily update with current handler
-        # Let's add an update method to SQLiteHandler or just overwrite the entry if possible.
-        # For simplicity, I will add an update method to SQLiteHandler in next step or just leave it as "Processing..." 
-        # Actually, I should update it. I'll add a quick update query here using raw sqlite for now or update the handler.
-        # Let's update the handler in the next step properly. For now, I will re-implement add_video to be an upsert or update.
-        
-        # Quick fix: Update title directly
-        import sqlite3
-        conn = sqlite3.connect(self.sqlite_handler.db_path)
-        cursor = conn.cursor()
-        cursor.execute("UPDATE videos SET smart_title = ? WHERE uuid = ?", (smart_title, video_uuid))
-        conn.commit()
-        conn.close()
-        
-        logging.info(f"Processing complete. {len(alerts_generated)} alerts generated.")
-        return {
-            "video_uuid": video_uuid, 
-            "smart_title": smart_title, 
-            "alerts": alerts_generated
-        }
+        answer = self.ai_handler.answer_query(query_text, context, history=history,
+                                              conversation_summary=conversation_summary)
+        return answer, sources
 
-    def query_video(self, video_uuid: str, query_text: str):
-        logging.info(f"Querying video {video_uuid} with: {query_text}")
+    def search_library(self, query_text: str, page: int = 0, page_size: int = 5,
+                       created_after: Optional[float] = None, created_before: Optional[float] = None,
+                       hits_per_video: int = 3, max_hits: int = 10000, geofence: Optional[List[float]] = None,
+                       min_altitude: Optional[float] = None, max_altitude: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Semantic search across every video in the library.
+        Runs vector index queries (no per-video loop), widened until the requested page is
+        filled, and groups the hits per video, ordered by each video's best match.
+        `total_videos` is exact only with `total_is_exact`; `truncated` reports that `max_hits`
+        was reached before the page could be completed.
+        """
+        logging.info(f"Library search: {query_text} (page {page})")
+        self._sync_embedding_model()
         query_embedding = self.ai_handler.get_embedding(query_text)
-        results = self.db_handler.query(query_embedding, video_uuid)
-        
-        # Format context for AI answer
-        context = ""
-        if results['documents']:
-            for doc in results['documents'][0]:
-                context += doc + "\n"
-        
-        answer = self.ai_handler.answer_query(query_text, context)
-        return answer
+        result = search_library_page(
+            self.db_handler, query_embedding, page=page, page_size=page_size, hits_per_video=hits_per_video,
+            # Deleted videos keep their vectors until the collector purges them
+            live=lambda uuids: set(self.sqlite_handler.get_videos_by_uuids(uuids)),
+            max_hits=max_hits, created_after=created_after, created_before=created_before,
+            geofence=geofence, min_altitude=min_altitude, max_altitude=max_altitude
+        )
+
+        # Titles come from SQLite, which holds the latest smart title
+        videos = self.sqlite_handler.get_videos_by_uuids([g["video_uuid"] for g in result["results"]])
+        for group in result["results"]:
+            video = videos.get(group["video_uuid"])
+            group["smart_title"] = video["smart_title"] if video else group["video_file_name"]
+            group["created_at"] = video["created_at"] if video else None
+        return result
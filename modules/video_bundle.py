@@ -0,0 +1,246 @@
+import io
+import json
+import time
+import logging
+import zipfile
+import numpy as np
+from typing import Callable, Dict, Any, Optional, List, Tuple
+
+from .sqlite_handler import SQLiteHandler
+from .embedding_archive import EmbeddingArchive
+from .frame_index import FrameIndex, index_from_archive
+from .video_processor import make_thumbnail
+
+BUNDLE_FORMAT_VERSION = 1
+TELEMETRY_COLUMNS = ("latitude", "longitude", "altitude", "heading")
+
+
+def _save_npy(bundle: zipfile.ZipFile, name: str, array: np.ndarray):
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    bundle.writestr(name, buffer.getvalue())
+
+
+def _load_npy(bundle: zipfile.ZipFile, name: str) -> np.ndarray:
+    return np.load(io.BytesIO(bundle.read(name)), allow_pickle=False)
+
+
+class VideoBundle:
+    """
+    Exports an analyzed video as a self-contained zip bundle and imports it elsewhere.
+
+    Layout (columnar, one array per field):
+      manifest.json            video row, counts, embedding dimensions and text model
+      frames.npz               timestamps, telemetry columns (NaN = none), image offsets
+      frames.json              descriptions, structured analyses, Chroma documents and metadata
+      images.bin               concatenated JPEG frames (stored, not recompressed)
+      text_embeddings.npy      (frames, dim) float32 description embeddings
+      summaries.json / summary_embeddings.npy
+      alerts.json
+      dino.f16 / dino_timestamps.npy   optional DINO archive
+
+    Import bulk-loads SQLite in one transaction and Chroma in batches; no model is called
+    unless the bundle's text embeddings come from another model than the target collection's,
+    in which case the texts are re-embedded with `embed_fn` (texts -> (embeddings, model))
+    or, without one, the import is refused. Gallery thumbnails are regenerated from the images.
+    """
+
+    def __init__(self, sqlite_handler: SQLiteHandler, db_handler,
+                 embedding_archive: Optional[EmbeddingArchive] = None, frame_index: Optional[FrameIndex] = None,
+                 embed_fn: Optional[Callable[[List[str]], Tuple[List[List[float]], str]]] = None):
+        self.sqlite_handler = sqlite_handler
+        self.db_handler = db_handler
+        self.embedding_archive = embedding_archive
+        self.frame_index = frame_index
+        self.embed_fn = embed_fn
+
+    def export_bundle(self, video_uuid: str, path, include_dino: bool = False) -> Dict[str, Any]:
+        """Writes the bundle of a video to `path` (file path or binary file object); returns the manifest."""
+        video = self.sqlite_handler.get_videos_by_uuids([video_uuid]).get(video_uuid)
+        if video is None:
+            raise ValueError(f"Unknown video {video_uuid}")
+        start = time.time()
+        entries = self.db_handler.get_entries(video_uuid)
+        summary_entries = self.db_handler.get_entries(video_uuid, summaries=True)
+
+        timestamps, telemetry, offsets = [], {c: [] for c in TELEMETRY_COLUMNS}, [0]
+        texts: Dict[str, List[Any]] = {"descriptions": [], "documents": [], "metadatas": [], "analyses": []}
+        labels = self.sqlite_handler.get_frame_labels(video_uuid)
+        embeddings = []
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+            # JPEGs are already compressed: stream them into a stored entry
+            with bundle.open(zipfile.ZipInfo("images.bin"), "w", force_zip64=True) as images:
+                for frame in self.sqlite_handler.iter_frames(video_uuid):
+                    image_data = frame["image_data"] or b""
+                    images.write(image_data)
+                    offsets.append(offsets[-1] + len(image_data))
+                    timestamps.append(frame["timestamp"])
+                    for column in TELEMETRY_COLUMNS:
+                        telemetry[column].append(np.nan if frame[column] is None else frame[column])
+
+                    entry = entries.get(f"{video_uuid}_{frame['id']}")
+                    texts["descriptions"].append(frame["description"])
+                    texts["analyses"].append({
+                        "person_count": frame["person_count"], "vehicle_count": frame["vehicle_count"],
+                        "suspicious": None if frame["suspicious"] is None else bool(frame["suspicious"]),
+                        **labels.get(frame["id"], {"activities": [], "flags": []})
+                    })
+                    texts["documents"].append(entry["document"] if entry else None)
+                    texts["metadatas"].append(entry["metadata"] if entry else None)
+                    embeddings.append(entry["embedding"] if entry else None)
+
+            dim = next((len(e) for e in embeddings if e is not None), 0)
+            matrix = np.zeros((len(embeddings), dim), dtype=np.float32)
+            for i, embedding in enumerate(embeddings):
+                if embedding is not None:
+                    matrix[i] = embedding
+            buffer = io.BytesIO()
+            np.savez(buffer, timestamp=np.asarray(timestamps, dtype=np.float64),
+                     image_offsets=np.asarray(offsets, dtype=np.int64),
+                     **{c: np.asarray(v, dtype=np.float64) for c, v in telemetry.items()})
+            bundle.writestr("frames.npz", buffer.getvalue())
+            bundle.writestr("frames.json", json.dumps(texts))
+            _save_npy(bundle, "text_embeddings.npy", matrix)
+
+            summaries = self.sqlite_handler.get_summaries(video_uuid)
+            summary_matrix = np.zeros((len(summaries), dim), dtype=np.float32)
+            for i, summary in enumerate(summaries):
+                entry = summary_entries.get(f"{video_uuid}_summary_{summary['id']}")
+                if entry is not None:
+                    summary_matrix[i] = entry["embedding"]
+            bundle.writestr("summaries.json", json.dumps(
+                [{key: s[key] for key in ("level", "start_time", "end_time", "summary")} for s in summaries]
+            ))
+            _save_npy(bundle, "summary_embeddings.npy", summary_matrix)
+
+            alerts = self.sqlite_handler.get_alerts(video_uuid, limit=self.sqlite_handler.count_alerts(video_uuid))
+            bundle.writestr("alerts.json", json.dumps([
+                {key: a[key] for key in ("rule_id", "type", "severity", "message", "start_time", "end_time",
+                                         "frame_count", "first_frame", "last_frame", "created_at")}
+                for a in alerts
+            ]))
+
+            dino_frames = 0
+            archived = self.embedding_archive.load(video_uuid) if include_dino and self.embedding_archive else None
+            if archived is not None:
+                dino_timestamps, dino = archived
+                bundle.writestr("dino.f16", np.ascontiguousarray(dino).tobytes())
+                _save_npy(bundle, "dino_timestamps.npy", dino_timestamps)
+                dino_frames = int(dino_timestamps.size)
+
+            manifest = {
+                "format_version": BUNDLE_FORMAT_VERSION,
+                "video": {key: video[key] for key in ("uuid", "filename", "smart_title", "created_at", "status")},
+                "frames": len(timestamps),
+                "summaries": len(summaries),
+                "alerts": len(alerts),
+                "text_embedding_dim": dim,
+                "text_embedding_model": self.db_handler.embedding_model(),
+                "dino_frames": dino_frames,
+                "exported_at": time.time()
+            }
+            bundle.writestr("manifest.json", json.dumps(manifest, indent=2))
+
+        logging.info(f"Exported video {video_uuid} ({len(timestamps)} frames) in {time.time() - start:.2f}s")
+        return manifest
+
+    def import_bundle(self, path) -> Dict[str, Any]:
+        """Loads a bundle from `path` (file path or binary file object); returns its manifest."""
+        start = time.time()
+        with zipfile.ZipFile(path) as bundle:
+            manifest = json.loads(bundle.read("manifest.json"))
+            if manifest.get("format_version") != BUNDLE_FORMAT_VERSION:
+                raise ValueError(f"Unsupported bundle format {manifest.get('format_version')}")
+            video = manifest["video"]
+            video_uuid = video["uuid"]
+            if self.sqlite_handler.get_videos_by_uuids([video_uuid]) or video_uuid in self.sqlite_handler.get_deleted_video_uuids():
+                raise ValueError(f"Video {video_uuid} already exists")
+
+            columns = np.load(io.BytesIO(bundle.read("frames.npz")), allow_pickle=False)
+            texts = json.loads(bundle.read("frames.json"))
+            embeddings = _load_npy(bundle, "text_embeddings.npy")
+            offsets = columns["image_offsets"]
+            summaries = json.loads(bundle.read("summaries.json"))
+            summary_embeddings = _load_npy(bundle, "summary_embeddings.npy") if summaries else None
+
+            # Chroma ids and frame_name follow the new SQLite frame IDs
+            rows = [i for i, metadata in enumerate(texts["metadatas"]) if metadata is not None]
+            documents = [texts["documents"][i] for i in rows]
+            frame_embeddings = embeddings[rows].tolist()
+            summary_embeddings = summary_embeddings.tolist() if summaries else []
+            model = manifest.get("text_embedding_model")
+            target_model = self.db_handler.embedding_model()
+            if target_model is not None and model != target_model:
+                if self.embed_fn is None:
+                    raise ValueError(f"Bundle embedded with {model or 'an unrecorded model'}, "
+                                     f"the collection uses {target_model}")
+                logging.info(f"Re-embedding bundle texts from {model} for {target_model}")
+                texts_to_embed = documents + [summary["summary"] for summary in summaries]
+                reembedded, model = self.embed_fn(texts_to_embed) if texts_to_embed else ([], target_model)
+                frame_embeddings = [list(e) for e in reembedded[:len(documents)]]
+                summary_embeddings = [list(e) for e in reembedded[len(documents):]]
+            # Stores that track their model refuse the write if it changed in the meantime
+            tag = {"model": model} if target_model is not None else {}
+
+            def frames():
+                with bundle.open("images.bin") as images:
+                    for i, timestamp in enumerate(columns["timestamp"]):
+                        frame = {
+                            "timestamp": float(timestamp),
+                            "description": texts["descriptions"][i],
+                            "image_data": images.read(int(offsets[i + 1] - offsets[i])),
+                            # Bundles exported before structured analysis have none
+                            "analysis": texts["analyses"][i] if "analyses" in texts else None
+                        }
+                        # Thumbnails are derived data: rebuilt here rather than shipped
+                        try:
+                            frame["thumbnail"] = make_thumbnail(frame["image_data"])
+                        except OSError:
+                            frame["thumbnail"] = None
+                        for column in TELEMETRY_COLUMNS:
+                            value = float(columns[column][i])
+                            frame[column] = None if np.isnan(value) else value
+                        yield frame
+
+            alerts = json.loads(bundle.read("alerts.json"))
+            frame_ids, summary_ids = self.sqlite_handler.import_video(video, frames(), summaries, alerts)
+
+            try:
+                metadatas = [dict(texts["metadatas"][i], frame_name=str(frame_ids[i])) for i in rows]
+                self.db_handler.add_entries(
+                    [f"{video_uuid}_{frame_ids[i]}" for i in rows],
+                    frame_embeddings,
+                    documents,
+                    metadatas,
+                    **tag
+                )
+                if summaries:
+                    self.db_handler.add_entries(
+                        [f"{video_uuid}_summary_{summary_id}" for summary_id in summary_ids],
+                        summary_embeddings,
+                        [summary["summary"] for summary in summaries],
+                        [{"video_uuid": video_uuid, "level": s["level"], "start_time": float(s["start_time"]),
+                          "end_time": float(s["end_time"])} for s in summaries],
+                        summaries=True,
+                        **tag
+                    )
+            except Exception:
+                # Leave nothing half-imported behind
+                self.db_handler.delete_entries(video_uuid, [str(frame_id) for frame_id in frame_ids])
+                self.db_handler.delete_summary_entries(video_uuid, summary_ids)
+                self.sqlite_handler.delete_video(video_uuid)
+                raise
+
+            if manifest.get("dino_frames") and self.embedding_archive is not None:
+                dino_timestamps = _load_npy(bundle, "dino_timestamps.npy")
+                dino = np.frombuffer(bundle.read("dino.f16"), dtype=np.float16).reshape(dino_timestamps.size, -1)
+                writer = self.embedding_archive.writer(video_uuid)
+                writer.append(dino, dino_timestamps.tolist())
+                writer.close()
+                if self.frame_index is not None:
+                    # Keyframe vectors for the library frame index are picked from the DINO archive
+                    index_from_archive(self.frame_index, video_uuid,
+                                       list(zip(frame_ids, columns["timestamp"].tolist())), (dino_timestamps, dino))
+
+        logging.info(f"Imported video {video_uuid} ({len(frame_ids)} frames) in {time.time() - start:.2f}s")
+        return manifest
@@ -1,16 +1,123 @@
+import io
+import os
 import cv2
+import time
+import queue
 import logging
-from typing import Generator, Tuple
+import threading
+import multiprocessing
+import numpy as np
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Generator, Tuple, List, Optional, Union
 from PIL import Image
 
+
+# Chunks a decode worker may queue for the parent before it blocks
+DECODE_QUEUE_CHUNKS = 2
+
+# Result queues of the decode workers (one per range slot), installed by _init_decoder
+_decode_queues: List = []
+
+
+class _InaccurateSeek(ValueError):
+    """The capture did not land on the requested frame."""
+
+
+def _init_decoder(queues: List):
+    global _decode_queues
+    _decode_queues = queues
+    for results in queues:
+        # At shutdown, chunks nobody will read must not keep the worker from exiting
+        results.cancel_join_thread()
+
+
+def _seek(cap: cv2.VideoCapture, frame: int) -> bool:
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+    return int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame
+
+
+def _sample(cap: cv2.VideoCapture, start_frame: int, end_frame: Optional[int], interval_frames: int,
+            frame_rate: float) -> Generator[Tuple[np.ndarray, float], None, None]:
+    """Sampled (RGB array, timestamp) frames of a capture positioned at `start_frame`, up to `end_frame`."""
+    frame_index = start_frame
+    while end_frame is None or frame_index < end_frame:
+        # grab() skips colour conversion for frames that are not sampled
+        if not cap.grab():
+            break
+        if frame_index % interval_frames == 0:
+            ret, frame = cap.retrieve()
+            if ret:
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), frame_index / frame_rate
+        frame_index += 1
+
+
+def _decode_range(video_path: str, start_frame: int, end_frame: Optional[int], interval_frames: int,
+                  frame_rate: float, slot: int, chunk_frames: int):
+    """
+    Decodes frames [start_frame, end_frame) of a video in a worker process and streams the
+    sampled ones to the parent through result queue `slot`: lists of at most `chunk_frames`
+    raw RGB arrays, then None (or the exception that stopped it). The queue is bounded, so
+    the worker waits while the parent is behind. Sampling uses the global frame index, so
+    the timestamps match a sequential pass; an inaccurate seek is reported, not worked around.
+    """
+    cv2.setNumThreads(1)  # Parallelism comes from the processes
+    results = _decode_queues[slot]
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_path}")
+        if start_frame > 0 and not _seek(cap, start_frame):
+            raise _InaccurateSeek(f"Seek to frame {start_frame} of {video_path} landed elsewhere")
+        chunk = []
+        for sample in _sample(cap, start_frame, end_frame, interval_frames, frame_rate):
+            chunk.append(sample)
+            if len(chunk) >= chunk_frames:
+                results.put(chunk)
+                chunk = []
+        if chunk:
+            results.put(chunk)
+        results.put(None)
+    except Exception as e:
+        results.put(e)
+    finally:
+        cap.release()
+
+
+def _next_chunk(results, future: Future):
+    """Next item of a worker's result queue; raises if the worker died without reporting."""
+    while True:
+        try:
+            return results.get(timeout=1.0)
+        except queue.Empty:
+            # A worker that returned normally has queued its end marker; one that crashed has not
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+
+def make_thumbnail(image: Union[Image.Image, bytes], max_side: int = 192, quality: int = 70) -> bytes:
+    """Downscales a frame (PIL image or encoded bytes) to a small JPEG preview for galleries."""
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((max_side, max_side))
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
 class VideoProcessor:
     """Handles video file operations and frame extraction."""
     
     def __init__(self):
         pass
 
-    def get_dynamic_frame_interval(self, video_path: str, min_fps: float = 1.0, max_fps: float = 10.0) -> float:
-        """Calculates frame interval based on video duration."""
+    def get_dynamic_frame_interval(self, video_path: str, min_fps: float = 1.0, max_fps: float = 10.0,
+                                   base_interval: float = 0.5) -> float:
+        """
+        Calculates the candidate sampling interval, clamped to [1/max_fps, 1/min_fps].
+        Callers that gate frames with a MotionFilter request a denser `base_interval`
+        and let the filter thin out static stretches.
+        """
         video = cv2.VideoCapture(video_path)
         if not video.isOpened():
             logging.error(f"Could not open video: {video_path}")
@@ -24,17 +131,14 @@ class VideoProcessor:
         if duration_seconds == 0:
             return 1.0
 
-        # Fixed interval for DINO processing (2 FPS)
-        frame_interval = 0.5
+        return max(1.0 / max_fps, min(1.0 / min_fps, base_interval))
 
-        return max(1.0 / max_fps, min(1.0 / min_fps, frame_interval))
-
-    def stream_frames(self, video_path: str) -> Generator[Tuple[Image.Image, float], None, None]:
+    def stream_frames(self, video_path: str, base_interval: float = 0.5) -> Generator[Tuple[Image.Image, float], None, None]:
         """
         Yields frames from the video as PIL Images.
         Returns: Generator yielding (PIL_Image, timestamp_in_seconds)
         """
-        frame_interval_seconds = self.get_dynamic_frame_interval(video_path)
+        frame_interval_seconds = self.get_dynamic_frame_interval(video_path, base_interval=base_interval)
         cap = cv2.VideoCapture(video_path)
         
         if not cap.isOpened():
@@ -48,12 +152,16 @@ class VideoProcessor:
         logging.info(f"Starting frame streaming for {video_path} at {frame_interval_seconds}s interval")
         
         while True:
-            ret, frame = cap.read()
-            if not ret:
+            # grab() advances without retrieving frames that are not sampled
+            if not cap.grab():
                 break
 
             if frame_count % interval_frames == 0:
                 elapsed_time = frame_count / frame_rate
+                ret, frame = cap.retrieve()
+                if not ret:
+                    frame_count += 1
+                    continue
                 
                 # Convert BGR (OpenCV) to RGB (PIL)
                 rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
@@ -64,3 +172,283 @@ class VideoProcessor:
             frame_count += 1
 
         cap.release()
+
+    def read_frames_at(self, video_path: str, timestamps: List[float],
+                       seek_threshold: int = 100) -> Generator[Tuple[Image.Image, float], None, None]:
+        """
+        Yields (PIL_Image, timestamp) for specific sampled timestamps, in time order.
+        Timestamps are mapped back to frame indexes; large gaps are seeked, short ones grabbed.
+        """
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_path}")
+        frame_rate = cap.get(cv2.CAP_PROP_FPS)
+
+        position = 0
+        for timestamp in sorted(timestamps):
+            target = int(round(timestamp * frame_rate))
+            if target - position > seek_threshold:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                position = target
+            while position < target and cap.grab():
+                position += 1
+            ret, frame = cap.read()
+            if not ret:
+                break
+            position += 1
+            yield Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)), timestamp
+
+        cap.release()
+
+    def stream_frames_parallel(self, video_path: str, workers: Optional[int] = None, range_seconds: float = 30.0,
+                               base_interval: float = 0.5,
+                               max_buffer_mb: Optional[float] = None) -> Generator[Tuple[Image.Image, float], None, None]:
+        """
+        Yields the same (PIL_Image, timestamp) samples as `stream_frames`, but decodes the video
+        in time ranges on a pool of processes, each with its own capture seeking to its range.
+        Ranges are yielded back in timestamp order. Workers stream their frames back in small
+        chunks through bounded queues, so decoded frames waiting for the consumer stay within
+        about `max_buffer_mb` (default: PARALLEL_DECODE_BUFFER_MB, 512). When seeking is
+        inaccurate for the file, it is decoded sequentially instead.
+        """
+        frame_interval_seconds = self.get_dynamic_frame_interval(video_path, base_interval=base_interval)
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_path}")
+        frame_rate = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frame_bytes = max(1, int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) * int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) * 3)
+
+        interval_frames = max(1, int(frame_rate * frame_interval_seconds))
+        # Range boundaries fall on sampled frames; the last range reads to the real end of file
+        range_frames = max(interval_frames, int(range_seconds * frame_rate) // interval_frames * interval_frames)
+        starts = list(range(0, max(total_frames, 1), range_frames))
+        ranges = [(start, starts[i + 1] if i + 1 < len(starts) else None) for i, start in enumerate(starts)]
+
+        # Probed once here rather than worked around in every worker
+        accurate = len(ranges) < 2 or _seek(cap, ranges[len(ranges) // 2][0])
+        cap.release()
+        if not accurate:
+            logging.warning(f"Inaccurate seek in {video_path}; decoding sequentially")
+            yield from self.stream_frames(video_path, base_interval=base_interval)
+            return
+
+        workers = workers or os.cpu_count() or 1
+        max_buffer = (max_buffer_mb if max_buffer_mb is not None
+                      else float(os.getenv("PARALLEL_DECODE_BUFFER_MB", 512))) * 2 ** 20
+        # Every range slot holds up to DECODE_QUEUE_CHUNKS queued chunks plus the one being filled
+        slots = max(1, min(workers * 2, len(ranges), int(max_buffer // ((DECODE_QUEUE_CHUNKS + 1) * frame_bytes))))
+        chunk_frames = max(1, int(max_buffer // (slots * (DECODE_QUEUE_CHUNKS + 1) * frame_bytes)))
+        workers = min(workers, slots)
+        logging.info(f"Parallel decoding {video_path}: {len(ranges)} ranges on {workers} processes, "
+                     f"{chunk_frames} frames per chunk")
+
+        # spawn: worker processes must not inherit model threads/locks from the parent
+        context = multiprocessing.get_context("spawn")
+        queues = [context.Queue(maxsize=DECODE_QUEUE_CHUNKS) for _ in range(slots)]
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                   initializer=_init_decoder, initargs=(queues,))
+        # (future, slot) of the submitted ranges not yet read to their end, in range order
+        pending = deque()
+        try:
+            next_range = 0
+            for index, (start, _) in enumerate(ranges):
+                # A slot is reused only once the range before it in that slot has been read to its end
+                while next_range < len(ranges) and next_range < index + slots:
+                    range_start, range_end = ranges[next_range]
+                    pending.append((pool.submit(_decode_range, video_path, range_start, range_end, interval_frames,
+                                                frame_rate, next_range % slots, chunk_frames), next_range % slots))
+                    next_range += 1
+                future, slot = pending[0]
+                while True:
+                    chunk = _next_chunk(queues[slot], future)
+                    if chunk is None:
+                        break
+                    if isinstance(chunk, _InaccurateSeek):
+                        # Seeking went wrong past the probe: finish this and later ranges in one sequential pass
+                        logging.warning(f"{chunk}; decoding the rest sequentially")
+                        yield from self._stream_from(video_path, start, interval_frames, frame_rate)
+                        return
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    for rgb_frame, timestamp in chunk:
+                        yield Image.fromarray(rgb_frame), timestamp
+                pending.popleft()
+        finally:
+            # Stopped early: workers blocked on a full queue are drained so the pool can shut down
+            for future, _ in pending:
+                future.cancel()
+            for future, slot in pending:
+                while not future.done():
+                    try:
+                        queues[slot].get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+            pool.shutdown(wait=True)
+
+    def _stream_from(self, video_path: str, start_frame: int, interval_frames: int,
+                     frame_rate: float) -> Generator[Tuple[Image.Image, float], None, None]:
+        """Sampled frames from `start_frame` to the end, reached by grabbing rather than seeking."""
+        cap = cv2.VideoCapture(video_path)
+        try:
+            for _ in range(start_frame):
+                if not cap.grab():
+                    return
+            for rgb_frame, timestamp in _sample(cap, start_frame, None, interval_frames, frame_rate):
+                yield Image.fromarray(rgb_frame), timestamp
+        finally:
+            cap.release()
+
+
+class MotionFilter:
+    """
+    Cheap motion gate in front of DINO. Each candidate frame is reduced to a small grayscale
+    thumbnail and compared (mean absolute difference, brightness-normalized) with the last
+    kept frame and with the previous candidate:
+    - clearly static frames are skipped (at least one frame is kept every `max_static_gap`),
+    - high motion keeps every candidate (denser sampling),
+    - otherwise frames are kept at the nominal interval.
+    """
+
+    def __init__(self, static_threshold: float = 3.0, high_motion_threshold: float = 12.0,
+                 nominal_interval: float = 0.5, max_static_gap: float = 10.0, size: Tuple[int, int] = (64, 36)):
+        self.static_threshold = static_threshold
+        self.high_motion_threshold = high_motion_threshold
+        self.nominal_interval = nominal_interval
+        self.max_static_gap = max_static_gap
+        self.size = size
+
+        self.seen = 0
+        self.kept = 0
+        self._previous = None
+        self._last_kept = None
+        self._last_kept_time = None
+
+    def _signature(self, image: Image.Image) -> np.ndarray:
+        small = image.convert("L").resize(self.size, Image.BILINEAR, reducing_gap=2.0)
+        signature = np.asarray(small, dtype=np.float32)
+        # Remove global brightness so exposure flicker does not count as motion
+        return signature - signature.mean()
+
+    def accept(self, image: Image.Image, timestamp: float) -> bool:
+        """Returns True if the frame should go on to DINO."""
+        signature = self._signature(image)
+        self.seen += 1
+        previous, self._previous = self._previous, signature
+
+        if self._last_kept is None:
+            keep = True
+        else:
+            change = float(np.mean(np.abs(signature - self._last_kept)))
+            motion = float(np.mean(np.abs(signature - previous)))
+            gap = timestamp - self._last_kept_time
+            if change < self.static_threshold:
+                keep = gap >= self.max_static_gap
+            elif motion >= self.high_motion_threshold:
+                keep = True
+            else:
+                keep = gap >= self.nominal_interval - 1e-6
+
+        if keep:
+            self.kept += 1
+            self._last_kept = signature
+            self._last_kept_time = timestamp
+        return keep
+
+
+class LiveStream:
+    """
+    Reads a live source (RTSP/HTTP URL or device index) on a background thread.
+    Frames are sampled on wall-clock time into a bounded buffer; when the consumer
+    falls behind, the oldest (stale) frames are dropped so latency stays bounded.
+    Local files can be replayed at real-time speed with `realtime=True`.
+    """
+
+    def __init__(self, source: Union[str, int], sample_interval: float = 0.5, max_buffer: int = 4,
+                 realtime: bool = False, max_duration: Optional[float] = None,
+                 stop_event: Optional[threading.Event] = None):
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)  # Device index, e.g. "0" for the first camera
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open live source: {source}")
+
+        self.source = source
+        self.sample_interval = sample_interval
+        self.realtime = realtime
+        self.max_duration = max_duration
+        self.stop_event = stop_event or threading.Event()
+        self.dropped = 0
+
+        # (BGR frame, stream time in seconds, wall-clock capture time)
+        self._buffer = deque(maxlen=max_buffer)
+        self._condition = threading.Condition()
+        self._done = False
+        self._thread = threading.Thread(target=self._read_loop, name="live-reader", daemon=True)
+        self._thread.start()
+
+    def _read_loop(self):
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        start = time.monotonic()
+        last_sample = None
+        frame_index = 0
+        try:
+            while not self.stop_event.is_set():
+                if self.realtime and fps > 0:
+                    # Pace file playback to the recorded frame rate
+                    delay = start + frame_index / fps - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                # grab() keeps the capture current without decoding frames we will not sample
+                if not self.cap.grab():
+                    break
+                frame_index += 1
+
+                stream_time = time.monotonic() - start
+                if self.max_duration is not None and stream_time >= self.max_duration:
+                    break
+                if last_sample is not None and stream_time - last_sample < self.sample_interval:
+                    continue
+
+                ret, frame = self.cap.retrieve()
+                if not ret:
+                    continue
+                last_sample = stream_time
+                with self._condition:
+                    if len(self._buffer) == self._buffer.maxlen:
+                        self.dropped += 1  # deque evicts the oldest frame
+                    self._buffer.append((frame, stream_time, time.time()))
+                    self._condition.notify()
+        finally:
+            self.cap.release()
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    def batches(self, max_batch: int = 4) -> Generator[List[Tuple[Image.Image, float, float]], None, None]:
+        """
+        Yields lists of (PIL_Image, stream_time, capture_time) with whatever is buffered
+        (at least one frame, at most `max_batch`), until the source ends or `stop` is called.
+        """
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._buffer or self._done)
+                    if not self._buffer:
+                        return
+                    items = [self._buffer.popleft() for _ in range(min(max_batch, len(self._buffer)))]
+
+                batch = []
+                for frame, stream_time, captured_at in items:
+                    # Convert BGR (OpenCV) to RGB (PIL) outside the reader thread
+                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    batch.append((Image.fromarray(rgb_frame), stream_time, captured_at))
+                yield batch
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Stops reading and releases the source."""
+        self.stop_event.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
@@ -5,11 +5,21 @@ import time
 import logging
 import sys
 import shutil
+import threading
+from datetime import datetime, time as dt_time
 from PIL import Image
 
 from modules.video_analysis_engine import VideoAnalysisEngine      
+from modules.video_processor import make_thumbnail
 from modules.sqlite_handler import SQLiteHandler
-from modules.db_handler import DBHandler
+from modules.vector_store import create_vector_store
+from modules.embedding_archive import EmbeddingArchive
+from modules.frame_index import FrameIndex
+from modules.deletion_collector import DeletionCollector
+from modules.video_bundle import VideoBundle
+from modules.upload_spool import spool_upload
+from modules.api_client import ApiClient
+from modules.profiler import ProfileStore
 
 # Configure logging
 logging.basicConfig(
@@ -265,24 +275,114 @@ def get_sqlite_handler():
 
 @st.cache_resource
 def get_db_handler():
-    return DBHandler(host=os.getenv("CHROMADB_HOST", "localhost"), port=int(os.getenv("CHROMADB_PORT", 8000)))
+    return create_vector_store()
+
+# One frame index per process: the engine, the collector and the gallery share its in-memory index
+@st.cache_resource
+def get_frame_index():
+    return FrameIndex()
+
+@st.cache_resource
+def get_deletion_collector():
+    return DeletionCollector(get_sqlite_handler(), get_db_handler(), EmbeddingArchive(), frame_index=get_frame_index())
 
 sqlite_handler = get_sqlite_handler()
 db_handler = get_db_handler()
+deletion_collector = get_deletion_collector()
+
+# With VIDEO_API_URL set, ingestion and chat go through the API service instead of a local engine
+@st.cache_resource
+def get_api_client():
+    return ApiClient() if os.getenv("VIDEO_API_URL") else None
+
+api_client = get_api_client()
 
 # Initialize Heavy Engine (Lazy Load)
 @st.cache_resource(show_spinner=False)
 def get_engine():
     print("DEBUG: Initializing VideoAnalysisEngine (Heavy Load)...")
-    return VideoAnalysisEngine()
+    return VideoAnalysisEngine(frame_index=get_frame_index(), deletion_collector=get_deletion_collector())
 
 # Session State
-if 'messages' not in st.session_state:
-    st.session_state.messages = []
+if 'chat_session' not in st.session_state:
+    st.session_state.chat_session = None
+if 'chat_pages' not in st.session_state:
+    st.session_state.chat_pages = 1
+if 'pending_query' not in st.session_state:
+    st.session_state.pending_query = None
 if 'selected_video' not in st.session_state:
     st.session_state.selected_video = None
 if 'selected_video_name' not in st.session_state:
     st.session_state.selected_video_name = ""
+if 'view' not in st.session_state:
+    st.session_state.view = "chat"
+if 'search_page' not in st.session_state:
+    st.session_state.search_page = 0
+if 'alerts_page' not in st.session_state:
+    st.session_state.alerts_page = 0
+if 'library_page' not in st.session_state:
+    st.session_state.library_page = 0
+if 'library_search' not in st.session_state:
+    st.session_state.library_search = ""
+if 'jobs' not in st.session_state:
+    st.session_state.jobs = []
+if 'profile_requests' not in st.session_state:
+    st.session_state.profile_requests = False
+if 'answer_sources' not in st.session_state:
+    st.session_state.answer_sources = []
+if 'gallery_page' not in st.session_state:
+    st.session_state.gallery_page = 0
+if 'gallery_frame' not in st.session_state:
+    st.session_state.gallery_frame = None
+
+def open_video(video_uuid: str, title: str, chat_session=None):
+    """Selects a video and resumes its latest conversation (kept in the URL across refreshes)."""
+    if chat_session is None:
+        sessions = sqlite_handler.get_chat_sessions(video_uuid, limit=1)
+        chat_session = sessions[0]['id'] if sessions else None
+    st.session_state.selected_video = video_uuid
+    st.session_state.selected_video_name = title
+    st.session_state.chat_session = chat_session
+    st.session_state.chat_pages = 1
+    st.session_state.pending_query = None
+    st.session_state.chat_error = None
+    st.session_state.answer_sources = []
+    st.session_state.gallery_page = 0
+    st.session_state.gallery_frame = None
+    st.session_state.view = "chat"
+    st.query_params["video"] = video_uuid
+    if chat_session:
+        st.query_params["chat"] = chat_session
+    elif "chat" in st.query_params:
+        del st.query_params["chat"]
+
+def with_thumbnails(frames):
+    """Fills in thumbnails missing on older frames (generated once from the full image and stored)."""
+    missing = {}
+    for frame in frames:
+        if frame['thumbnail'] is None:
+            image_data = sqlite_handler.get_frame_image(frame['id'])
+            if image_data:
+                frame['thumbnail'] = missing[frame['id']] = make_thumbnail(image_data)
+    sqlite_handler.set_frame_thumbnails(missing)
+    return frames
+
+def show_thumbnails(frames, key_prefix: str, columns: int = 6):
+    """Renders a grid of keyframe thumbnails; clicking one opens the full frame."""
+    cols = st.columns(columns)
+    for idx, frame in enumerate(with_thumbnails(frames)):
+        with cols[idx % columns]:
+            if frame['thumbnail']:
+                st.image(frame['thumbnail'], use_container_width=True)
+            if st.button(f"🔍 {frame['timestamp']:.1f}s", key=f"{key_prefix}_{frame['id']}", use_container_width=True):
+                st.session_state.gallery_frame = frame['id']
+                st.rerun()
+
+# Restore the open conversation after a browser refresh
+if st.session_state.selected_video is None and "video" in st.query_params:
+    restored = sqlite_handler.get_videos_by_uuids([st.query_params["video"]]).get(st.query_params["video"])
+    if restored:
+        open_video(restored['uuid'], restored['smart_title'], st.query_params.get("chat"))
 
 # Sidebar
 with st.sidebar:
@@ -290,8 +390,24 @@ with st.sidebar:
     st.caption("Powered by Groq AI")
     
     # Stats Section
-    videos = sqlite_handler.get_videos()
-    st.metric("Total Videos", len(videos))
+    total_videos = sqlite_handler.count_videos()
+    st.metric("Total Videos", total_videos)
+    
+    if st.button("🔎 Search All Videos", use_container_width=True,
+                 type="primary" if st.session_state.view == "library_search" else "secondary"):
+        st.session_state.view = "library_search"
+        st.rerun()
+    if st.button("🚨 Alerts", use_container_width=True,
+                 type="primary" if st.session_state.view == "alerts" else "secondary"):
+        st.session_state.view = "alerts"
+        st.session_state.alerts_page = 0
+        st.rerun()
+    if st.button("🩺 Diagnostics", use_container_width=True,
+                 type="primary" if st.session_state.view == "diagnostics" else "secondary"):
+        st.session_state.view = "diagnostics"
+        st.rerun()
+    # Profiles the uploads and questions of this session (PROFILING=1 profiles every request)
+    st.toggle("⏱️ Profile my requests", key="profile_requests")
     
     st.divider()
     
@@ -302,8 +418,36 @@ with st.sidebar:
         type=['mp4', 'mov', 'avi', 'mkv', 'webm'],
         help="Upload drone footage for AI analysis"
     )
+    telemetry_file = st.file_uploader(
+        "Drone telemetry (optional)",
+        type=['csv', 'json'],
+        help="Flight log with time, GPS, altitude and heading, joined to each keyframe"
+    )
+    telemetry_time_unit = st.selectbox(
+        "Telemetry clock",
+        ["seconds", "epoch", "epoch_ms"],
+        format_func={"seconds": "Seconds from video start", "epoch": "Epoch seconds",
+                     "epoch_ms": "Epoch milliseconds"}.get,
+        disabled=telemetry_file is None
+    )
     if uploaded_file is not None:
         st.info(f"File: {uploaded_file.name} ({uploaded_file.size / 1024 / 1024:.2f} MB)")
+    if uploaded_file is not None and api_client is not None:
+        if st.button("🚀 Process Video", use_container_width=True, type="primary"):
+            try:
+                with st.spinner("Uploading..."):
+                    submitted = api_client.submit_video(
+                        uploaded_file, uploaded_file.name, telemetry=telemetry_file,
+                        telemetry_filename=telemetry_file.name if telemetry_file is not None else "telemetry.csv",
+                        telemetry_time_unit=telemetry_time_unit,
+                        profile=st.session_state.profile_requests
+                    )
+                st.session_state.jobs.append(submitted["job_id"])
+                if submitted["duplicate_of"]:
+                    st.warning("Same file as an already analyzed video")
+            except Exception as e:
+                st.error(f"Error submitting video: {e}")
+    elif uploaded_file is not None:
         if st.button("🚀 Process Video", use_container_width=True, type="primary"):
             # Load engine only when needed
             with st.spinner("Initializing AI Engine..."):
@@ -312,16 +456,23 @@ with st.sidebar:
             with st.spinner("Processing video... This may take a while."):
                 print(f"DEBUG: Starting processing for {uploaded_file.name}")
                 
-                # Save to temp file
-                temp_dir = "temp_uploads"
-                os.makedirs(temp_dir, exist_ok=True)
-                file_path = os.path.join(temp_dir, uploaded_file.name)
-                
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                
+                # Stream to a unique spool file in chunks (hashed and size-checked on the way)
+                file_path = telemetry_path = None
                 try:
-                    result = engine.process_video(file_path)
+                    spooled = spool_upload(uploaded_file, uploaded_file.name, expected_size=uploaded_file.size)
+                    file_path = spooled["path"]
+                    duplicate = sqlite_handler.find_video_by_hash(spooled["sha256"])
+                    if duplicate:
+                        st.warning(f"Same file as already analyzed video: {duplicate['smart_title']}")
+
+                    if telemetry_file is not None:
+                        telemetry_path = spool_upload(telemetry_file, telemetry_file.name,
+                                                      expected_size=telemetry_file.size)["path"]
+
+                    result = engine.process_video(file_path, telemetry_path=telemetry_path,
+                                                  telemetry_time_unit=telemetry_time_unit,
+                                                  video_filename=uploaded_file.name, sha256=spooled["sha256"],
+                                                  profile=st.session_state.profile_requests or None)
                     st.success("Processing complete!")
                     print(f"DEBUG: Finished processing {uploaded_file.name}")
                     time.sleep(1)
@@ -330,25 +481,141 @@ with st.sidebar:
                     st.error(f"Error processing video: {e}")
                     print(f"DEBUG: Error processing video: {e}")
                 finally:
-                    if os.path.exists(file_path):
+                    if file_path and os.path.exists(file_path):
                         os.remove(file_path)
+                    if telemetry_path and os.path.exists(telemetry_path):
+                        os.remove(telemetry_path)
+
+    # Ingestion jobs submitted to the API service
+    if st.session_state.jobs:
+        for job_id in list(st.session_state.jobs):
+            try:
+                job = api_client.get_job(job_id)
+            except ValueError as e:
+                # The service does not know the job (e.g. its database was reset)
+                st.error(f"Job {job_id[:8]}: {e}")
+                st.session_state.jobs.remove(job_id)
+                continue
+            except Exception as e:
+                st.warning(f"Could not reach the API service for job status: {e}")
+                break
+            if job['status'] in ("queued", "running"):
+                st.caption(f"⏳ {job['filename']}: {job['status']}")
+            elif job['status'] == "complete":
+                st.success(f"{job['filename']} processed")
+                st.session_state.jobs.remove(job_id)
+            else:
+                st.error(f"{job['filename']} failed: {job['error']}")
+                st.session_state.jobs.remove(job_id)
+        if st.session_state.jobs and st.button("🔄 Refresh jobs", use_container_width=True):
+            st.rerun()
+
+    # Import an analyzed video exported from another site (no re-analysis; texts are only
+    # re-embedded when the bundle comes from another text embedding model)
+    with st.expander("📦 Import Bundle"):
+        bundle_file = st.file_uploader("Video bundle", type=['zip'], key="bundle_upload")
+        if bundle_file is not None and st.button("Import", use_container_width=True):
+            try:
+                with st.spinner("Importing..."):
+                    manifest = VideoBundle(sqlite_handler, db_handler, EmbeddingArchive(),
+                                           frame_index=get_frame_index(),
+                                           embed_fn=lambda texts: get_engine().embed_texts(texts)).import_bundle(bundle_file)
+                st.success(f"Imported {manifest['video']['smart_title']} ({manifest['frames']} frames)")
+            except Exception as e:
+                st.error(f"Error importing bundle: {e}")
+
+    # Versioned vector collections: re-embed the stored descriptions with another model, then switch
+    with st.expander("🧬 Embeddings"):
+        for collection in sqlite_handler.get_collections():
+            st.caption(f"{'✅' if collection['status'] == 'active' else '⏳' if collection['status'] == 'building' else '🗄️'} "
+                       f"{collection['name']} · {collection['model']} ({collection['status']})")
+        reindexer = st.session_state.get('reindexer')
+        if reindexer is not None and reindexer.report is None:
+            st.info(f"Reindexing {reindexer.collection}: {reindexer.progress['frames']} frames, "
+                    f"{reindexer.progress['summaries']} summaries")
+            if st.button("🔄 Refresh", key="reindex_refresh", use_container_width=True):
+                st.rerun()
+        else:
+            if reindexer is not None:
+                report = reindexer.report
+                if report.get("error"):
+                    st.error(f"Reindex failed: {report['error']}")
+                else:
+                    st.success(f"{report['frames']} frames, {report['summaries']} summaries in {report['seconds']:.1f}s "
+                               f"({report['entries_per_second']:.0f}/s)")
+            model_name = st.text_input("Embedding model", value=os.getenv("EMBEDDING_MODEL", ""),
+                                       placeholder="sentence-transformers model name")
+            if model_name and st.button("Reindex", use_container_width=True):
+                st.session_state.reindexer = get_engine().reindex(model_name, background=True)
+                st.rerun()
+
+    # Live stream ingestion (runs on a background thread; stats are polled on rerun)
+    with st.expander("📡 Live Stream"):
+        live = st.session_state.get('live_ingestion')
+        if live and live['thread'].is_alive():
+            stats = live['stats']
+            st.caption(f"Streaming {live['source']}")
+            if stats.get('frames'):
+                st.caption(
+                    f"Frames: {stats['frames']} · Keyframes: {stats['keyframes']} · Dropped: {stats['dropped']}  \n"
+                    f"Latency p50 {stats['latency_p50']:.2f}s · max {stats['latency_max']:.2f}s"
+                )
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("🔄 Refresh", use_container_width=True):
+                    st.rerun()
+            with col2:
+                if st.button("⏹️ Stop", use_container_width=True):
+                    live['stop_event'].set()
+                    live['thread'].join(timeout=30)
+                    st.rerun()
+        else:
+            live_source = st.text_input("Source", placeholder="rtsp://camera/stream, http://..., or 0")
+            live_duration = st.number_input("Max duration (s, 0 = until stopped)", min_value=0, value=0, step=60)
+            live_realtime = st.checkbox("Replay a local file in real time", value=False)
+            if st.button("▶️ Start Live Analysis", use_container_width=True, disabled=not live_source):
+                with st.spinner("Initializing AI Engine..."):
+                    engine = get_engine()
+                stop_event = threading.Event()
+                live_stats = {}
+                thread = threading.Thread(
+                    target=engine.process_live,
+                    kwargs={
+                        "source": live_source,
+                        "max_duration": live_duration or None,
+                        "stop_event": stop_event,
+                        "realtime": live_realtime,
+                        "on_stats": live_stats.update
+                    },
+                    daemon=True
+                )
+                thread.start()
+                st.session_state.live_ingestion = {
+                    "source": live_source, "thread": thread, "stop_event": stop_event, "stats": live_stats
+                }
+                st.rerun()
 
     st.divider()
     
     # Video List from SQLite (Fast)
     st.subheader("📚 Video Library")
-    videos = sqlite_handler.get_videos()
-    
-    if not videos:
+    if not total_videos:
         st.info("📭 No videos yet. Upload one to get started!")
     else:
-        # Search/filter
+        # Search/filter (runs in SQLite; only one page of videos is loaded and rendered)
+        library_page_size = 25
         search = st.text_input("🔍 Search videos", placeholder="Search by title...")
-        filtered_videos = [v for v in videos if search.lower() in v['smart_title'].lower()] if search else videos
+        if search != st.session_state.library_search:
+            st.session_state.library_search = search
+            st.session_state.library_page = 0
+        matching = sqlite_handler.count_videos(search) if search else total_videos
+        page_count = max(1, -(-matching // library_page_size))
+        page = min(st.session_state.library_page, page_count - 1)
+        page_videos = sqlite_handler.get_videos_page(search, limit=library_page_size, offset=page * library_page_size)
         
-        st.caption(f"Showing {len(filtered_videos)} of {len(videos)} videos")
+        st.caption(f"Showing {len(page_videos)} of {matching} matching videos ({total_videos} total)")
         
-        for video in filtered_videos:
+        for video in page_videos:
             with st.container():
                 col1, col2 = st.columns([0.85, 0.15])
                 with col1:
@@ -360,30 +627,213 @@ with st.sidebar:
                         use_container_width=True,
                         type=button_type
                     ):
-                        st.session_state.selected_video = video['uuid']
-                        st.session_state.selected_video_name = video['smart_title']
-                        st.session_state.messages = []
+                        open_video(video['uuid'], video['smart_title'])
                         logging.info(f"Selected video: {video['smart_title']}")
                         st.rerun()
                 with col2:
                     if st.button("🗑️", key=f"del_{video['uuid']}", help="Delete video"):
                         logging.info(f"Deleting video: {video['uuid']}")
                         try:
-                            sqlite_handler.delete_video(video['uuid'])
-                            db_handler.delete_video(video['uuid'])
+                            # Hidden immediately; frames, vectors and files are purged in the background
+                            deletion_collector.delete(video['uuid'])
                             
                             if st.session_state.selected_video == video['uuid']:
                                 st.session_state.selected_video = None
-                                st.session_state.messages = []
-                            st.success("Video deleted!")
-                            time.sleep(0.5)
+                                st.session_state.chat_session = None
+                                st.query_params.clear()
                             st.rerun()
                         except Exception as e:
                             st.error(f"Error: {str(e)}")
                             logging.error(f"Delete error: {e}")
+        
+        if page_count > 1:
+            prev_col, page_col, next_col = st.columns([0.3, 0.4, 0.3])
+            with prev_col:
+                if st.button("◀", key="library_prev", disabled=page == 0, use_container_width=True):
+                    st.session_state.library_page = page - 1
+                    st.rerun()
+            with page_col:
+                st.caption(f"Page {page + 1} / {page_count}")
+            with next_col:
+                if st.button("▶", key="library_next", disabled=page >= page_count - 1, use_container_width=True):
+                    st.session_state.library_page = page + 1
+                    st.rerun()
+
+# Library-wide Search
+if st.session_state.view == "library_search":
+    st.markdown("""
+    <div style="background: white; padding: 1.5rem; border-radius: 12px; margin-bottom: 1rem; box-shadow: 0 2px 8px rgba(0,0,0,0.08);">
+        <h1 style="margin: 0; font-size: 1.75rem; color: #1e293b;">🔎 Search All Videos</h1>
+        <p style="margin: 0.5rem 0 0 0; color: #64748b; font-size: 0.875rem;">Semantic search across the whole library, grouped by video</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    with st.form("library_search_form"):
+        search_query = st.text_input("Query", placeholder="e.g. trucks near the gate at night")
+        col1, col2 = st.columns(2)
+        with col1:
+            date_from = st.date_input("Uploaded from", value=None)
+        with col2:
+            date_to = st.date_input("Uploaded until", value=None)
+        submitted = st.form_submit_button("Search", type="primary")
+    
+    if submitted:
+        st.session_state.search_page = 0
+        st.session_state.library_query = (search_query, date_from, date_to)
+    
+    if st.session_state.get('library_query') and st.session_state.library_query[0]:
+        query_text, date_from, date_to = st.session_state.library_query
+        created_after = datetime.combine(date_from, dt_time.min).timestamp() if date_from else None
+        created_before = datetime.combine(date_to, dt_time.max).timestamp() if date_to else None
+        
+        with st.spinner("🔄 Initializing Groq AI Engine..."):
+            engine = get_engine()
+        
+        try:
+            search_results = engine.search_library(
+                query_text,
+                page=st.session_state.search_page,
+                created_after=created_after,
+                created_before=created_before
+            )
+        except Exception as e:
+            search_results = None
+            st.error(f"Search error: {e}")
+            logging.error(f"Library search error: {e}")
+        
+        if search_results is not None:
+            if not search_results["results"]:
+                st.info("No matching frames found.")
+            else:
+                # Past the first pages the scan stops early: the count is then only a lower bound
+                st.caption(f"{search_results['total_videos']}{'' if search_results['total_is_exact'] else '+'} matching videos")
+            
+            for group in search_results["results"]:
+                with st.expander(f"🎬 {group['smart_title']}", expanded=True):
+                    for hit in group["hits"]:
+                        st.markdown(f"- {hit['description']}")
+                    if st.button("💬 Chat with this video", key=f"open_{group['video_uuid']}"):
+                        open_video(group['video_uuid'], group['smart_title'])
+                        st.rerun()
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.session_state.search_page > 0 and st.button("⬅️ Previous", use_container_width=True):
+                    st.session_state.search_page -= 1
+                    st.rerun()
+            with col2:
+                if search_results["has_more"] and st.button("Next ➡️", use_container_width=True):
+                    st.session_state.search_page += 1
+                    st.rerun()
+
+# Saved profiles of ingestion and query requests
+elif st.session_state.view == "diagnostics":
+    st.markdown("""
+    <div style="background: white; padding: 1.5rem; border-radius: 12px; margin-bottom: 1rem; box-shadow: 0 2px 8px rgba(0,0,0,0.08);">
+        <h1 style="margin: 0; font-size: 1.75rem; color: #1e293b;">🩺 Diagnostics</h1>
+        <p style="margin: 0.5rem 0 0 0; color: #64748b; font-size: 0.875rem;">Profiles of slow uploads and questions, newest first</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    profile_store = ProfileStore()
+    profiles = profile_store.list()
+    if not profiles:
+        st.info("No profiles yet. Turn on ⏱️ Profile my requests (or set PROFILING=1) and repeat the slow request.")
+    else:
+        labels = {
+            p['request_id']: f"{p['kind']} · {p['seconds']:.2f}s · "
+                             f"{datetime.fromtimestamp(p['created_at']).strftime('%Y-%m-%d %H:%M:%S')}"
+            for p in profiles
+        }
+        request_id = st.selectbox("Request", list(labels), format_func=labels.get)
+        chosen = next(p for p in profiles if p['request_id'] == request_id)
+        if chosen['details']:
+            st.caption(", ".join(f"{key}={value}" for key, value in chosen['details'].items()))
+        
+        sort = st.radio("Sort by", ["tottime", "cumtime"], horizontal=True,
+                        format_func={"tottime": "Self time", "cumtime": "Inclusive time"}.get)
+        st.dataframe(
+            [{
+                "Function": row['function'],
+                "Calls": row['calls'],
+                "Self (s)": round(row['tottime'], 4),
+                "Inclusive (s)": round(row['cumtime'], 4)
+            } for row in profile_store.hotspots(request_id, sort=sort)],
+            use_container_width=True,
+            hide_index=True
+        )
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("⬇️ Flame graph (folded stacks)", profile_store.folded(request_id),
+                               file_name=f"{request_id}.folded", use_container_width=True,
+                               help="Open in speedscope.app or render with flamegraph.pl")
+        with col2:
+            with open(profile_store.path(request_id), "rb") as f:
+                st.download_button("⬇️ Raw profile (.prof)", f.read(), file_name=f"{request_id}.prof",
+                                   use_container_width=True, help="pstats format, e.g. for snakeviz")
+
+# Alerts across the library
+elif st.session_state.view == "alerts":
+    st.markdown("""
+    <div style="background: white; padding: 1.5rem; border-radius: 12px; margin-bottom: 1rem; box-shadow: 0 2px 8px rgba(0,0,0,0.08);">
+        <h1 style="margin: 0; font-size: 1.75rem; color: #1e293b;">🚨 Alerts</h1>
+        <p style="margin: 0.5rem 0 0 0; color: #64748b; font-size: 0.875rem;">Alert incidents across all videos, newest first</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    alerts_page_size = 50
+    col1, col2 = st.columns(2)
+    with col1:
+        severity = st.selectbox("Severity", ["All", "CRITICAL", "HIGH", "MEDIUM", "LOW"])
+    with col2:
+        only_selected = st.checkbox(
+            "Only the selected video",
+            value=False,
+            disabled=not st.session_state.selected_video
+        )
+    severity_filter = None if severity == "All" else severity
+    video_filter = st.session_state.selected_video if only_selected else None
+    
+    total_alerts = sqlite_handler.count_alerts(video_uuid=video_filter, severity=severity_filter)
+    alert_rows = sqlite_handler.get_alerts(
+        video_uuid=video_filter,
+        severity=severity_filter,
+        limit=alerts_page_size,
+        offset=st.session_state.alerts_page * alerts_page_size
+    )
+    
+    if not alert_rows:
+        st.info("No alerts.")
+    else:
+        st.caption(f"{total_alerts} incidents")
+        st.dataframe(
+            [{
+                "Severity": row['severity'],
+                "Type": row['type'],
+                "Video": row['smart_title'] or row['video_uuid'],
+                "From (s)": round(row['start_time'], 1),
+                "To (s)": round(row['end_time'], 1),
+                "Frames": row['frame_count'],
+                "Message": row['message'],
+                "Raised": row['created_at']
+            } for row in alert_rows],
+            use_container_width=True,
+            hide_index=True
+        )
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.session_state.alerts_page > 0 and st.button("⬅️ Previous", use_container_width=True):
+                st.session_state.alerts_page -= 1
+                st.rerun()
+        with col2:
+            if (st.session_state.alerts_page + 1) * alerts_page_size < total_alerts and st.button("Next ➡️", use_container_width=True):
+                st.session_state.alerts_page += 1
+                st.rerun()
 
 # Main Chat Interface
-if st.session_state.selected_video:
+elif st.session_state.selected_video:
     # Modern Header
     col1, col2 = st.columns([0.85, 0.15])
     with col1:
@@ -394,15 +844,156 @@ if st.session_state.selected_video:
         </div>
         """, unsafe_allow_html=True)
     with col2:
-        if st.button("🔄 Clear", help="Start new conversation", use_container_width=True, type="secondary"):
-            st.session_state.messages = []
+        if st.button("🔄 New", help="Start new conversation", use_container_width=True, type="secondary"):
+            open_video(st.session_state.selected_video, st.session_state.selected_video_name, chat_session="")
+            st.rerun()
+    
+    # Earlier conversations about this video
+    chat_sessions = sqlite_handler.get_chat_sessions(st.session_state.selected_video)
+    if len(chat_sessions) > 1:
+        session_labels = {
+            s['id']: f"{s['created_at']} · {(s['first_question'] or 'New conversation')[:60]} ({s['message_count']} messages)"
+            for s in chat_sessions
+        }
+        current = st.session_state.chat_session or ""
+        session_ids = ([""] if current not in session_labels else []) + list(session_labels)
+        session_labels[""] = "New conversation"
+        chosen = st.selectbox("Conversation", session_ids, format_func=session_labels.get,
+                              index=session_ids.index(current))
+        if chosen != current:
+            open_video(st.session_state.selected_video, st.session_state.selected_video_name, chat_session=chosen)
             st.rerun()
     
+    # Portable bundle of the analysis (frames, descriptions, embeddings) for another site
+    with st.expander("📦 Export Bundle"):
+        include_dino = st.checkbox("Include DINO embeddings", help="Needed to re-keyframe the video after import")
+        if st.button("Prepare bundle", use_container_width=True):
+            bundle_buffer = io.BytesIO()
+            with st.spinner("Exporting..."):
+                VideoBundle(sqlite_handler, db_handler, EmbeddingArchive()).export_bundle(
+                    st.session_state.selected_video, bundle_buffer, include_dino=include_dino
+                )
+            st.download_button("⬇️ Download bundle", bundle_buffer.getvalue(),
+                               file_name=f"{st.session_state.selected_video}.zip", mime="application/zip",
+                               use_container_width=True)
+
+    # Re-run keyframe selection from the archived DINO embeddings (no re-embedding)
+    with st.expander("🎯 Re-keyframe"):
+        threshold = st.slider("Similarity threshold", 0.70, 0.99, 0.90, 0.01,
+                              help="Lower keeps fewer keyframes; only new keyframes are sent to Groq")
+        source_video = st.file_uploader("Source video", type=['mp4', 'avi', 'mov', 'mkv'], key="rekeyframe_video",
+                                        help="Needed to decode the frames that become new keyframes")
+        if source_video is not None and st.button("Re-keyframe", use_container_width=True):
+            engine = get_engine()
+            file_path = None
+            try:
+                file_path = spool_upload(source_video, source_video.name, expected_size=source_video.size)["path"]
+                with st.spinner("Re-selecting keyframes..."):
+                    report = engine.rekeyframe(st.session_state.selected_video, file_path, threshold=threshold)
+                st.success(
+                    f"{report['keyframes']} keyframes from {report['sampled_frames']} sampled frames "
+                    f"(+{report['added']} / -{report['removed']}) in {report['total_seconds']:.1f}s"
+                )
+            except Exception as e:
+                st.error(f"Error: {e}")
+            finally:
+                if file_path and os.path.exists(file_path):
+                    os.remove(file_path)
+
+    # Compare this flight with the nearest earlier pass over the same place
+    with st.expander("🛰️ Change Report"):
+        if st.button("Compare with previous pass", use_container_width=True):
+            with st.spinner("Comparing keyframes..."):
+                report = get_engine().detect_changes(st.session_state.selected_video)
+            if report['reference_uuid'] is None:
+                st.info("No earlier video covers the same place.")
+            else:
+                reference = sqlite_handler.get_videos_by_uuids([report['reference_uuid']]).get(report['reference_uuid'], {})
+                st.success(
+                    f"Compared with {reference.get('smart_title', report['reference_uuid'])}: "
+                    f"{report['changed']} changed, {report['matched'] - report['changed']} unchanged, "
+                    f"{report['unmatched']} not covered of {report['keyframes']} keyframes"
+                )
+                for frame in report['frames']:
+                    if frame['status'] == "changed":
+                        st.markdown(f"**{frame['timestamp']:.1f}s** (was {frame['reference_timestamp']:.1f}s, "
+                                    f"similarity {frame['similarity']:.2f}): {frame['description']}  \n"
+                                    f"_Before:_ {frame['reference_description']}")
+
+    # Keyframe timeline: thumbnails of the chosen time range, one page at a time
+    if st.toggle("🖼️ Timeline", key="show_timeline"):
+        span = sqlite_handler.get_frame_span(st.session_state.selected_video)
+        if not span['count']:
+            st.info("No keyframes stored for this video.")
+        else:
+            gallery_page_size = 24
+            if span['end'] > span['start']:
+                start_time, end_time = st.slider("Time range (s)", float(span['start']), float(span['end']),
+                                                 (float(span['start']), float(span['end'])),
+                                                 on_change=lambda: st.session_state.update(gallery_page=0))
+            else:
+                start_time = end_time = span['start']
+            frames_in_range = sqlite_handler.count_frames(st.session_state.selected_video, start_time, end_time)
+            st.caption(f"{frames_in_range} keyframes")
+            show_thumbnails(sqlite_handler.get_frame_thumbnails(
+                st.session_state.selected_video, start_time, end_time,
+                limit=gallery_page_size, offset=st.session_state.gallery_page * gallery_page_size
+            ), "gallery")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.session_state.gallery_page > 0 and st.button("⬅️ Earlier", use_container_width=True):
+                    st.session_state.gallery_page -= 1
+                    st.rerun()
+            with col2:
+                if (st.session_state.gallery_page + 1) * gallery_page_size < frames_in_range and \
+                        st.button("Later ➡️", use_container_width=True):
+                    st.session_state.gallery_page += 1
+                    st.rerun()
+
+    # The full-resolution frame is only fetched once a thumbnail is clicked
+    if st.session_state.gallery_frame is not None:
+        full_frame = sqlite_handler.get_frame_thumbnails_by_ids([st.session_state.gallery_frame]).get(st.session_state.gallery_frame)
+        image_data = sqlite_handler.get_frame_image(st.session_state.gallery_frame)
+        if full_frame and image_data:
+            st.image(image_data, caption=f"[{full_frame['timestamp']:.1f}s] {full_frame['description']}",
+                     use_container_width=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            show_similar = st.toggle("🛰️ Same spot in other flights", key="show_similar")
+        with col2:
+            if st.button("✖️ Close frame", use_container_width=True):
+                st.session_state.gallery_frame = None
+                st.rerun()
+        if show_similar:
+            try:
+                hits = get_frame_index().query_frame(st.session_state.gallery_frame, n_results=12, min_similarity=0.75)
+            except ValueError:
+                hits = []
+            # Hits of videos deleted in the meantime are skipped
+            videos = sqlite_handler.get_videos_by_uuids(list({hit['video_uuid'] for hit in hits}))
+            hits = [hit for hit in hits if hit['video_uuid'] in videos]
+            if not hits:
+                st.info("No similar keyframes in other videos.")
+            else:
+                st.caption(" · ".join(f"{videos[hit['video_uuid']]['smart_title']} @ {hit['timestamp']:.1f}s "
+                                      f"({hit['similarity']:.2f})" for hit in hits))
+                similar_frames = sqlite_handler.get_frame_thumbnails_by_ids([hit['frame_id'] for hit in hits])
+                show_thumbnails([similar_frames[hit['frame_id']] for hit in hits if hit['frame_id'] in similar_frames],
+                                "similar")
+
     # Chat Container with Modern Design
     chat_container = st.container(height=500)
     
+    # Only the latest pages of the conversation are loaded and rendered
+    chat_page_size = 20
+    chat_session = st.session_state.chat_session
+    messages = sqlite_handler.get_chat_messages(chat_session, limit=st.session_state.chat_pages * chat_page_size) if chat_session else []
+    total_messages = sqlite_handler.count_chat_messages(chat_session) if chat_session else 0
+    if st.session_state.pending_query:
+        messages = messages + [{"role": "user", "content": st.session_state.pending_query}]
+    
     with chat_container:
-        if not st.session_state.messages:
+        if not messages:
             # Welcome message in chat
             st.markdown("""
             <div style="text-align: center; padding: 2rem;">
@@ -424,10 +1015,16 @@ if st.session_state.selected_video:
             for idx, (icon, suggestion) in enumerate(suggestions):
                 with cols[idx % 2]:
                     if st.button(f"{icon} {suggestion}", key=f"sug_{idx}", use_container_width=True):
-                        st.session_state.messages.append({"role": "user", "content": suggestion})
+                        st.session_state.pending_query = suggestion
                         st.rerun()
+        
+        if total_messages > st.session_state.chat_pages * chat_page_size:
+            if st.button(f"⬆️ Load earlier messages ({total_messages - st.session_state.chat_pages * chat_page_size} more)",
+                         use_container_width=True):
+                st.session_state.chat_pages += 1
+                st.rerun()
             
-        for idx, msg in enumerate(st.session_state.messages):
+        for idx, msg in enumerate(messages):
             role_class = "user" if msg["role"] == "user" else "bot"
             avatar_char = "👤" if msg["role"] == "user" else "🤖"
             role_name = "You" if msg["role"] == "user" else "Groq AI"
@@ -445,36 +1042,71 @@ if st.session_state.selected_video:
                 </div>
             </div>
             """, unsafe_allow_html=True)
+        
+        # Keyframes behind the latest answer (summary answers show the first keyframe of each range)
+        if st.session_state.answer_sources and not st.session_state.pending_query and messages:
+            sources = st.session_state.answer_sources
+            frame_ids = [source['frame_id'] for source in sources if source['type'] == "frame"]
+            source_frames = [frame for frame in (sqlite_handler.get_frame_thumbnails_by_ids(frame_ids).get(i) for i in frame_ids) if frame]
+            for source in sources:
+                if source['type'] != "frame":
+                    source_frames += sqlite_handler.get_frame_thumbnails(
+                        st.session_state.selected_video, source['start_time'], source['end_time'], limit=1
+                    )
+            if source_frames:
+                st.caption("Sources")
+                unique_frames = list({frame['id']: frame for frame in source_frames}.values())
+                show_thumbnails(unique_frames[:12], "source")
+
+        if st.session_state.get('last_response_time') and not st.session_state.pending_query and messages:
+            st.caption(f"Response time: {st.session_state.last_response_time:.2f}s")
+        if st.session_state.get('chat_error'):
+            st.error(st.session_state.chat_error)
 
     # Input area (using st.chat_input for better UI)
     if prompt := st.chat_input("💭 Ask anything about this video...", key="chat_input"):
         logging.info(f"User query: {prompt}")
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        st.session_state.pending_query = prompt
         st.rerun()
 
     # Handle response generation after rerun to update UI first
-    if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
-        last_user_msg = st.session_state.messages[-1]["content"]
+    if st.session_state.pending_query:
+        last_user_msg = st.session_state.pending_query
+        st.session_state.chat_error = None
         
-        # Load engine only when needed
-        with st.spinner("🔄 Initializing Groq AI Engine..."):
-            engine = get_engine()
+        # Load engine only when needed (the API service holds it when configured)
+        if api_client is None:
+            with st.spinner("🔄 Initializing Groq AI Engine..."):
+                engine = get_engine()
             
         with st.spinner("🤔 Analyzing with Groq AI..."):
             try:
+                if not st.session_state.chat_session:
+                    st.session_state.chat_session = (
+                        api_client.start_session(st.session_state.selected_video) if api_client is not None
+                        else engine.conversation_memory.start_session(st.session_state.selected_video)
+                    )
+                    st.query_params["chat"] = st.session_state.chat_session
                 start_time = time.time()
-                answer = engine.query_video(st.session_state.selected_video, last_user_msg)
+                # The question and answer are stored in the chat history by the engine
+                if api_client is not None:
+                    result = api_client.query_video(st.session_state.selected_video, last_user_msg,
+                                                    session_id=st.session_state.chat_session,
+                                                    profile=st.session_state.profile_requests)
+                else:
+                    result = engine.query_video(st.session_state.selected_video, last_user_msg,
+                                                session_id=st.session_state.chat_session, return_sources=True,
+                                                profile=st.session_state.profile_requests or None)
+                st.session_state.answer_sources = result["sources"]
                 elapsed = time.time() - start_time
-                
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": f"{answer}\n\n*Response time: {elapsed:.2f}s*"
-                })
+                st.session_state.last_response_time = elapsed
                 logging.info(f"AI response generated in {elapsed:.2f}s")
             except Exception as e:
-                error_msg = f"❌ Error: {str(e)}\n\nPlease try again or rephrase your question."
-                st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                st.session_state.last_response_time = None
+                st.session_state.answer_sources = []
+                st.session_state.chat_error = f"❌ Error: {str(e)}\n\nPlease try again or rephrase your question."
                 logging.error(f"Query error: {e}")
+        st.session_state.pending_query = None
         st.rerun()
 
 else:
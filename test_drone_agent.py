@@ -1,5 +1,39 @@
+import io
+import os
+import time
+import hashlib
+import json
+import tempfile
 import unittest
-from modules.alert_engine import AlertEngine
+import threading
+import numpy as np
+from PIL import Image
+from modules.alert_engine import AlertEngine, AlertDebouncer
+from modules.sqlite_handler import SQLiteHandler
+from modules.telemetry import TelemetryTrack
+from modules.video_processor import VideoProcessor, MotionFilter, LiveStream, make_thumbnail
+from modules.context_builder import ContextBuilder
+from modules.embedding_archive import EmbeddingArchive, select_keyframes
+from modules.ingestion_session import IngestionSession
+from modules.conversation_memory import ConversationMemory
+from modules.deletion_collector import DeletionCollector
+from modules.video_bundle import VideoBundle
+from modules import embedded_store
+from modules.embedded_store import EmbeddedVectorStore
+from modules.upload_spool import spool_upload
+from modules.api_service import create_app
+from modules.api_client import ApiClient
+from modules.reindexer import Reindexer
+from modules.profiler import ProfileStore, profiled
+from modules.vector_store import ActiveVectorStore, EmbeddingModelMismatch, active_collection
+from modules.query_router import QueryRouter
+from modules.query_coordinator import QueryCoordinator
+from modules.frame_analysis import parse_frame_analysis
+from modules import frame_index
+from modules.frame_index import FrameIndex, index_from_archive
+from modules.library_search import search_library_page
+from modules.rate_limiter import RateLimiter
+from modules.title_worker import TitleWorker
 
 class TestDroneSecurityAgent(unittest.TestCase):
     
@@ -10,8 +44,9 @@ class TestDroneSecurityAgent(unittest.TestCase):
         # Test Rule 1: Person in Restricted Zone
         description = "A person is detected in the restricted area."
         
-        alert = self.alert_engine.check_rules(description, "frame1.jpg")
-        self.assertIsNotNone(alert)
+        alerts = self.alert_engine.check_rules(description, "frame1.jpg")
+        self.assertEqual(len(alerts), 1)
+        alert = alerts[0]
         self.assertEqual(alert['severity'], "HIGH")
         self.assertEqual(alert['type'], "Security Breach")
         print(f"Alert Triggered: {alert}")
@@ -20,8 +55,9 @@ class TestDroneSecurityAgent(unittest.TestCase):
         # Test Rule 2: Suspicious Activity
         description = "Suspicious behavior detected in the area."
         
-        alert = self.alert_engine.check_rules(description, "frame2.jpg")
-        self.assertIsNotNone(alert)
+        alerts = self.alert_engine.check_rules(description, "frame2.jpg")
+        self.assertEqual(len(alerts), 1)
+        alert = alerts[0]
         self.assertEqual(alert['severity'], "MEDIUM")
         print(f"Alert Triggered: {alert}")
 
@@ -29,8 +65,9 @@ class TestDroneSecurityAgent(unittest.TestCase):
         # Test Rule 3: Weapon Detection
         description = "Armed individual with weapon detected."
         
-        alert = self.alert_engine.check_rules(description, "frame3.jpg")
-        self.assertIsNotNone(alert)
+        alerts = self.alert_engine.check_rules(description, "frame3.jpg")
+        self.assertEqual(len(alerts), 1)
+        alert = alerts[0]
         self.assertEqual(alert['severity'], "CRITICAL")
         print(f"Alert Triggered: {alert}")
 
@@ -38,9 +75,1502 @@ class TestDroneSecurityAgent(unittest.TestCase):
         # Test normal condition
         description = "A person walking normally in the area."
         
-        alert = self.alert_engine.check_rules(description, "frame4.jpg")
-        self.assertIsNone(alert)
+        alerts = self.alert_engine.check_rules(description, "frame4.jpg")
+        self.assertEqual(alerts, [])
         print("No alert triggered for normal condition.")
 
+    def test_multiple_rules_trigger(self):
+        # A weapon plus an intrusion raises both alerts
+        description = "Armed intruder, intrusion through the north gate."
+        
+        alerts = self.alert_engine.check_rules(description, "frame5.jpg")
+        self.assertEqual({a['type'] for a in alerts}, {"Weapon Detected", "Unauthorized Access"})
+
+    def test_word_boundaries(self):
+        # "personnel" must not match "person"
+        description = "Security personnel patrol the restricted zone."
+        
+        alerts = self.alert_engine.check_rules(description, "frame6.jpg")
+        self.assertEqual(alerts, [])
+
+    def test_batch_matches_single(self):
+        descriptions = [
+            ("A person is detected in the restricted area.", "f1"),
+            ("Quiet parking lot.", "f2"),
+            ("Suspicious behavior near an armed guard.", "f3"),
+        ]
+        batch = self.alert_engine.check_batch(descriptions)
+        single = [self.alert_engine.check_rules(d, f) for d, f in descriptions]
+        self.assertEqual(batch, single)
+
+    def test_alert_buffer_is_bounded(self):
+        engine = AlertEngine(max_alerts=2)
+        for i in range(5):
+            engine.check_rules("Suspicious activity", f"frame{i}")
+        self.assertEqual(len(engine.alerts), 2)
+
+class TestAlertDebouncer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.sqlite_handler = SQLiteHandler(os.path.join(self.tmp_dir.name, "videos.db"))
+        self.sqlite_handler.add_video("vid-1", "patrol.mp4", "Patrol")
+        self.alert_engine = AlertEngine()
+        self.debouncer = AlertDebouncer(self.sqlite_handler, "vid-1", self.alert_engine)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_consecutive_alerts_merge_into_one_incident(self):
+        # Person standing in a restricted zone for 30 seconds, one keyframe every 2 seconds
+        for t in range(0, 31, 2):
+            for alert in self.alert_engine.check_rules("A person stands in the restricted zone.", f"frame_{t}"):
+                self.debouncer.add(alert, float(t))
+        
+        rows = self.sqlite_handler.get_alerts(video_uuid="vid-1")
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['start_time'], rows[0]['end_time'], rows[0]['frame_count']), (0.0, 30.0, 16))
+
+    def test_gap_beyond_window_opens_new_incident(self):
+        for t in (0.0, 5.0, 60.0):
+            for alert in self.alert_engine.check_rules("Suspicious activity near the gate.", f"frame_{t}"):
+                self.debouncer.add(alert, t)
+        
+        self.assertEqual(self.sqlite_handler.count_alerts(video_uuid="vid-1", severity="MEDIUM"), 2)
+
+def bag_of_words_embed(texts):
+    # Deterministic stand-in for the sentence embedding model
+    vocabulary = ["climb", "fence", "rifle", "gun", "fight", "punch", "car", "park"]
+    return [[float(word in text.lower()) for word in vocabulary] for text in texts]
+
+class TestSemanticAlertRules(unittest.TestCase):
+
+    def setUp(self):
+        self.alert_engine = AlertEngine(embed_fn=bag_of_words_embed)
+
+    def test_semantic_rule_triggers_on_paraphrase(self):
+        description = "Someone is climbing over the fence line."
+        embedding = bag_of_words_embed([description])[0]
+        
+        alerts = self.alert_engine.check_rules(description, "frame7.jpg", embedding=embedding)
+        self.assertEqual([a['type'] for a in alerts], ["Perimeter Breach"])
+
+    def test_batch_uses_one_matrix_product(self):
+        descriptions = [("A car parked in the lot.", "f1"), ("A fight with a punch thrown.", "f2")]
+        embeddings = bag_of_words_embed([d for d, _ in descriptions])
+        
+        alerts = self.alert_engine.check_batch(descriptions, embeddings=embeddings)
+        self.assertEqual(alerts[0], [])
+        self.assertEqual([a['type'] for a in alerts[1]], ["Physical Altercation"])
+
+class TestTelemetry(unittest.TestCase):
+
+    def test_load_csv_and_interpolate(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "flight.csv")
+            with open(path, "w") as f:
+                f.write("time,lat,lon,alt,heading\n2,10.2,20.2,60,10\n0,10.0,20.0,40,350\n")
+            track = TelemetryTrack.load(path)
+        
+        telemetry = track.at(1.0)
+        self.assertAlmostEqual(telemetry["latitude"], 10.1)
+        self.assertAlmostEqual(telemetry["altitude"], 50.0)
+        # 350 -> 10 degrees passes through north, not south
+        self.assertAlmostEqual(telemetry["heading"], 0.0)
+
+    def test_large_log_joins_fast(self):
+        times = np.arange(300_000) * 0.01
+        track = TelemetryTrack(times, {"altitude": np.sin(times)})
+        start = time.perf_counter()
+        track.sample(np.linspace(0, times[-1], 10_000))
+        self.assertLess(time.perf_counter() - start, 0.05)
+
+    def test_blank_cells_are_skipped(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "flight.csv")
+            with open(path, "w") as f:
+                f.write("time,lat,lon,alt\n0,10.0,20.0,40\n1,,,\n,10.5,20.5,45\n2,10.2,20.2,\n")
+            track = TelemetryTrack.load(path)
+
+        self.assertEqual(len(track), 3)
+        telemetry = track.at(1.0)
+        self.assertAlmostEqual(telemetry["latitude"], 10.1)
+        # Altitude has no fix after t=0, so t=2 is beyond its span
+        self.assertAlmostEqual(telemetry["altitude"], 40.0)
+        self.assertNotIn("altitude", track.at(2.0))
+
+    def test_outside_log_span_has_no_telemetry(self):
+        track = TelemetryTrack([10.0, 20.0], {"latitude": [1.0, 2.0]}, tolerance=1.0)
+        self.assertIsNone(track.at(5.0))
+        self.assertIsNone(track.at(30.0))
+        self.assertAlmostEqual(track.at(20.5)["latitude"], 2.0)
+
+    def test_epoch_clock_is_explicit(self):
+        epoch = 1_700_000_000.0
+        track = TelemetryTrack([epoch * 1000, epoch * 1000 + 2000], {"altitude": [10.0, 30.0]}, time_unit="epoch_ms")
+        self.assertAlmostEqual(track.at(1.0)["altitude"], 20.0)
+        relative = TelemetryTrack([epoch, epoch + 2], {"altitude": [10.0, 30.0]})
+        self.assertIsNone(relative.at(1.0))
+        with self.assertRaises(ValueError):
+            TelemetryTrack([0.0], {}, time_unit="minutes")
+
+    def test_geofenced_rule_needs_position_inside(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "rules.json")
+            with open(path, "w") as f:
+                json.dump({"rules": [{
+                    "id": "north_gate", "severity": "HIGH", "type": "Gate Activity", "message": "Person at north gate",
+                    "keywords": [["person"]], "geofence": [10.0, 20.0, 10.1, 20.1]
+                }]}, f)
+            engine = AlertEngine(rules_path=path)
+        
+        inside = {"latitude": 10.05, "longitude": 20.05, "altitude": 30.0}
+        outside = {"latitude": 11.0, "longitude": 20.05, "altitude": 30.0}
+        self.assertEqual(len(engine.check_rules("A person walks by.", "f1", telemetry=inside)), 1)
+        self.assertEqual(engine.check_rules("A person walks by.", "f2", telemetry=outside), [])
+
+class TestParallelDecode(unittest.TestCase):
+
+    def setUp(self):
+        import cv2
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "clip.avi")
+        writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*"MJPG"), 20, (64, 48))
+        rng = np.random.default_rng(0)
+        for i in range(200):
+            # Every frame differs, so a seek landing one frame off changes the pixels
+            writer.write(rng.integers(0, 255, (48, 64, 3), dtype=np.uint8))
+        writer.release()
+        self.processor = VideoProcessor()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def assertSameFrames(self, sequential, parallel):
+        self.assertEqual([t for _, t in sequential], [t for _, t in parallel])
+        for (a, _), (b, _) in zip(sequential, parallel):
+            self.assertTrue(np.array_equal(np.asarray(a), np.asarray(b)))
+
+    def test_parallel_matches_sequential_frames(self):
+        sequential = list(self.processor.stream_frames(self.path))
+        self.assertEqual(len(sequential), 20)
+        self.assertSameFrames(sequential, list(self.processor.stream_frames_parallel(self.path, workers=2,
+                                                                                     range_seconds=2.0)))
+
+    def test_small_buffer_streams_single_frames(self):
+        # A budget below one frame per queue slot: one slot, one frame per chunk
+        sequential = list(self.processor.stream_frames(self.path))
+        parallel = list(self.processor.stream_frames_parallel(self.path, workers=4, range_seconds=2.0,
+                                                              max_buffer_mb=0.001))
+        self.assertSameFrames(sequential, parallel)
+
+    def test_stopping_early_shuts_the_workers_down(self):
+        # Chunks of four frames, ten per range: both workers block on their full queues
+        frames = self.processor.stream_frames_parallel(self.path, workers=2, range_seconds=5.0, max_buffer_mb=0.5)
+        first = next(frames)
+        frames.close()
+        self.assertEqual(first[1], 0.0)
+
+class TestLiveStream(unittest.TestCase):
+
+    def setUp(self):
+        import cv2
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "clip.avi")
+        writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*"MJPG"), 20, (64, 48))
+        for i in range(30):
+            writer.write(np.full((48, 64, 3), i * 8, dtype=np.uint8))
+        writer.release()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_replays_local_file_in_real_time(self):
+        stream = LiveStream(self.path, sample_interval=0.2, realtime=True)
+        frames = [frame for batch in stream.batches(max_batch=2) for frame in batch]
+        times = [stream_time for _, stream_time, _ in frames]
+        # 1.5 s of footage sampled every 0.2 s of wall-clock time
+        self.assertTrue(6 <= len(frames) <= 9, times)
+        self.assertTrue(all(b - a >= 0.19 for a, b in zip(times, times[1:])))
+        self.assertEqual(frames[0][0].size, (64, 48))
+
+    def test_slow_consumer_drops_stale_frames(self):
+        stream = LiveStream(self.path, sample_interval=0.0, max_buffer=2)
+        time.sleep(0.5)  # The reader finishes the file while nothing is consumed
+        frames = [frame for batch in stream.batches(max_batch=4) for frame in batch]
+        self.assertEqual(len(frames), 2)
+        self.assertEqual(stream.dropped, 28)
+
+    def test_unopenable_source_raises(self):
+        with self.assertRaises(ValueError):
+            LiveStream(os.path.join(self.tmp_dir.name, "missing.avi"))
+
+class TestMotionFilter(unittest.TestCase):
+
+    @staticmethod
+    def _frame(offset):
+        pixels = np.zeros((72, 128), dtype=np.uint8)
+        pixels[20:50, offset:offset + 30] = 255
+        return Image.fromarray(pixels)
+
+    def test_static_frames_are_skipped(self):
+        motion_filter = MotionFilter(nominal_interval=0.5, max_static_gap=5.0)
+        kept = [t for t in np.arange(0, 4, 0.25) if motion_filter.accept(self._frame(10), t)]
+        self.assertEqual(kept, [0.0])
+        # The static gap forces a periodic keep
+        self.assertTrue(motion_filter.accept(self._frame(10), 5.0))
+
+    def test_high_motion_keeps_every_frame(self):
+        motion_filter = MotionFilter(nominal_interval=0.5)
+        timestamps = np.arange(0, 2, 0.25)
+        kept = [t for i, t in enumerate(timestamps) if motion_filter.accept(self._frame(i * 12), t)]
+        self.assertEqual(len(kept), len(timestamps))
+
+class TestEmbeddingArchive(unittest.TestCase):
+
+    def test_roundtrip_is_memory_mapped_float16(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive = EmbeddingArchive(tmp_dir)
+            writer = archive.writer("video")
+            rng = np.random.default_rng(0)
+            vectors = rng.normal(size=(10, 384)).astype(np.float32)
+            writer.append(vectors[:8], [i * 0.5 for i in range(8)])
+            writer.append(vectors[8:], [4.0, 4.5])
+            writer.close()
+
+            timestamps, embeddings = archive.load("video")
+            self.assertIsInstance(embeddings, np.memmap)
+            self.assertEqual(embeddings.dtype, np.float16)
+            self.assertEqual(embeddings.shape, (10, 384))
+            self.assertEqual(list(timestamps), [i * 0.5 for i in range(10)])
+            np.testing.assert_allclose(embeddings, vectors, atol=1e-2)
+            del embeddings
+            archive.delete("video")
+            self.assertIsNone(archive.load("video"))
+
+    def test_aborted_writer_leaves_nothing(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive = EmbeddingArchive(tmp_dir)
+            writer = archive.writer("video")
+            writer.append(np.ones((2, 8)), [0.0, 0.5])
+            writer.abort()
+            writer.close()
+            self.assertEqual(os.listdir(tmp_dir), [])
+            self.assertIsNone(archive.load("video"))
+
+    def test_select_keyframes_follows_threshold(self):
+        a, b = np.eye(4, dtype=np.float32)[0], np.eye(4, dtype=np.float32)[1]
+        near_a = a + 0.2 * b
+        embeddings = np.vstack([a, near_a, a, b, b, a])
+        self.assertEqual(select_keyframes(embeddings, threshold=0.90), [0, 3, 5])
+        self.assertEqual(select_keyframes(embeddings, threshold=0.99), [0, 1, 2, 3, 5])
+
+    def test_read_frames_at_matches_sampled_timestamps(self):
+        import cv2
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "clip.avi")
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 20, (64, 48))
+            for i in range(200):
+                writer.write(np.full((48, 64, 3), i, dtype=np.uint8))
+            writer.release()
+
+            processor = VideoProcessor()
+            sampled = {t: np.asarray(img) for img, t in processor.stream_frames(path)}
+            wanted = [0.5, 2.0, 9.5]
+            for image, timestamp in processor.read_frames_at(path, wanted, seek_threshold=5):
+                np.testing.assert_array_equal(np.asarray(image), sampled[timestamp])
+
+class TestVideoLibrary(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "videos.db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_existing_videos_are_indexed_and_paged(self):
+        import sqlite3
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE videos (uuid TEXT PRIMARY KEY, filename TEXT, smart_title TEXT, "
+                     "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+        conn.executemany("INSERT INTO videos (uuid, filename, smart_title) VALUES (?, ?, ?)",
+                         [(f"v{i}", "f.mp4", f"Patrol {'harbor' if i % 3 == 0 else 'field'} {i}") for i in range(30)])
+        conn.commit()
+        conn.close()
+
+        handler = SQLiteHandler(self.db_path)
+        self.assertEqual(handler.count_videos(), 30)
+        self.assertEqual(handler.count_videos("harb"), 10)
+        page = handler.get_videos_page("harbor", limit=4, offset=8)
+        self.assertEqual(len(page), 2)
+        self.assertTrue(all("harbor" in video["smart_title"] for video in page))
+
+    def test_writes_invalidate_cache(self):
+        handler = SQLiteHandler(self.db_path)
+        reader = SQLiteHandler(self.db_path)
+        self.assertEqual(reader.count_videos("gate"), 0)
+        handler.add_video("v1", "a.mp4", "North gate intrusion")
+        self.assertEqual(reader.count_videos("gate"), 1)
+        handler.update_video_title("v1", "Parking lot")
+        self.assertEqual(reader.get_videos_page("gate"), [])
+        handler.delete_video("v1")
+        self.assertEqual(reader.count_videos(), 0)
+
+    def test_timeline_thumbnails_by_range(self):
+        handler = SQLiteHandler(self.db_path)
+        handler.add_video("v1", "a.mp4", "Gate")
+        frame = Image.new("RGB", (640, 480), (200, 30, 30))
+        ids = [handler.add_frame("v1", float(t), f"frame {t}", b"full", thumbnail=make_thumbnail(frame))
+               for t in range(20)]
+        handler.add_frame("v1", 20.0, "legacy frame", b"full")
+
+        self.assertEqual(handler.get_frame_span("v1"), {"count": 21, "start": 0.0, "end": 20.0})
+        self.assertEqual(handler.count_frames("v1", 5.0, 9.0), 5)
+        page = handler.get_frame_thumbnails("v1", 5.0, 20.0, limit=4, offset=4)
+        self.assertEqual([f["timestamp"] for f in page], [9.0, 10.0, 11.0, 12.0])
+        self.assertLessEqual(max(Image.open(io.BytesIO(page[0]["thumbnail"])).size), 192)
+        self.assertIsNone(handler.get_frame_thumbnails("v1", 20.0, 20.0)[0]["thumbnail"])
+
+        handler.delete_frames(ids[:2])
+        self.assertEqual(set(handler.get_frame_thumbnails_by_ids(ids[:3])), {ids[2]})
+        handler.delete_video("v1")
+        import sqlite3
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM frame_thumbnails").fetchone()[0], 0)
+        conn.close()
+
+    def test_removed_keyframes_take_their_alerts_and_segments(self):
+        handler = SQLiteHandler(self.db_path)
+        handler.add_video("v1", "a.mp4", "Gate")
+        ids = [handler.add_frame("v1", float(t), f"frame {t}", b"full") for t in range(0, 40, 2)]
+        alert = {"rule_id": "r1", "type": "Breach", "severity": "HIGH", "message": "m", "frame": "frame_4.00"}
+        handler.add_alert("v1", alert, 4.0)
+        handler.extend_alert(handler.get_alerts("v1")[0]["id"], 8.0, "frame_8.00")
+        handler.add_alert("v1", {**alert, "frame": "frame_30.00"}, 30.0)
+        handler.add_summary("v1", "segment", 0.0, 18.0, "first half")
+        handler.add_summary("v1", "segment", 20.0, 38.0, "second half")
+        handler.add_summary("v1", "video", 0.0, 38.0, "whole video")
+
+        stale = handler.remove_keyframes("v1", [ids[3]])  # t=6
+        self.assertEqual([(s["start_time"], s["end_time"]) for s in stale], [(0.0, 18.0)])
+        self.assertEqual([a["start_time"] for a in handler.get_alerts("v1")], [30.0])
+        self.assertEqual([s["summary"] for s in handler.get_summaries("v1")], ["whole video", "second half"])
+        self.assertEqual([f["timestamp"] for f in handler.get_keyframes("v1", 2.0, 8.0)], [2.0, 4.0, 8.0])
+
+        debouncer = AlertDebouncer(None, "v1", AlertEngine())
+        debouncer.add(alert, 4.0)
+        debouncer.add({**alert, "frame": "frame_8.00"}, 8.0)
+        handler.replace_alerts("v1", debouncer.incidents)
+        rows = handler.get_alerts("v1")
+        self.assertEqual([(a["start_time"], a["end_time"], a["frame_count"]) for a in rows], [(4.0, 8.0, 2)])
+
+class FakeSummarizer:
+    """Stands in for AIHandler.summarize_conversation and records what it was sent."""
+
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    def summarize_conversation(self, previous_summary, messages):
+        self.calls.append(len(messages))
+        if self.fail:
+            return ""
+        return (previous_summary + " | " if previous_summary else "") + ",".join(m["content"] for m in messages)
+
+class TestConversationMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.sqlite = SQLiteHandler(os.path.join(self.tmp_dir.name, "videos.db"))
+        self.ai = FakeSummarizer()
+        self.memory = ConversationMemory(self.sqlite, self.ai, recent_messages=4, compact_batch=2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_history_persists_and_compacts_incrementally(self):
+        session_id = self.memory.start_session("video")
+        for i in range(6):
+            self.memory.record(session_id, f"q{i}", f"a{i}")
+            self.memory.compact(session_id)
+
+        history, summary = self.memory.context(session_id)
+        # Each compaction sends only one small batch, never the whole conversation
+        self.assertEqual(self.ai.calls, [2, 2, 2])
+        self.assertEqual(summary, "q0,a0 | q1,a1 | q2,a2")
+        self.assertEqual([m["content"] for m in history], ["q3", "a3", "q4", "a4", "q5", "a5"])
+        self.assertEqual(self.sqlite.count_chat_messages(session_id), 12)
+
+    def test_messages_are_paged_newest_last(self):
+        session_id = self.memory.start_session("video")
+        for i in range(5):
+            self.memory.record(session_id, f"q{i}", f"a{i}")
+        page = self.sqlite.get_chat_messages(session_id, limit=3)
+        self.assertEqual([m["content"] for m in page], ["a3", "q4", "a4"])
+        self.assertEqual(self.sqlite.get_chat_sessions("video")[0]["first_question"], "q0")
+
+    def test_lagging_compaction_catches_up_before_dropping_turns(self):
+        session_id = self.memory.start_session("video")
+        for i in range(8):
+            self.memory.record(session_id, f"q{i}", f"a{i}")
+
+        history, summary = self.memory.context(session_id)
+        self.assertEqual(summary, "q0,a0 | q1,a1 | q2,a2 | q3,a3 | q4,a4")
+        self.assertEqual([m["content"] for m in history], ["q5", "a5", "q6", "a6", "q7", "a7"])
+
+    def test_failed_compaction_keeps_every_uncompacted_turn(self):
+        self.ai.fail = True
+        session_id = self.memory.start_session("video")
+        for i in range(8):
+            self.memory.record(session_id, f"q{i}", f"a{i}")
+
+        history, summary = self.memory.context(session_id)
+        self.assertEqual(summary, "")
+        self.assertEqual(len(history), 16)
+        self.assertEqual(history[0]["content"], "q0")
+
+    def test_failed_answers_are_not_stored(self):
+        session_id = self.memory.start_session("video")
+        self.memory.record(session_id, "q0", "a0")
+        self.memory.record(session_id, "q1", "Error processing your query: timeout", failed=True)
+        history, _ = self.memory.context(session_id)
+        self.assertEqual([m["content"] for m in history], ["q0", "a0"])
+
+class FakeVectorStore:
+    """Records the Chroma ids the collector deletes."""
+
+    def __init__(self):
+        self.deleted = []
+
+    def delete_entries(self, video_uuid, frame_names):
+        self.deleted += [f"{video_uuid}_{name}" for name in frame_names]
+
+    def delete_summary_entries(self, video_uuid, summary_ids):
+        self.deleted += [f"{video_uuid}_summary_{summary_id}" for summary_id in summary_ids]
+
+class TestDeletionCollector(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "videos.db")
+        self.sqlite = SQLiteHandler(self.db_path)
+        self.sqlite.add_video("big", "big.mp4", "Big video")
+        self.sqlite.add_video("keep", "keep.mp4", "Other video")
+        blob = os.urandom(20000)
+        for i in range(120):
+            self.sqlite.add_frame("big", i * 0.5, f"frame {i}", blob)
+        self.sqlite.add_frame("keep", 0.0, "kept frame", blob)
+        self.sqlite.add_summary("big", "video", 0.0, 60.0, "summary")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_tombstone_hides_then_purge_shrinks_database(self):
+        store = FakeVectorStore()
+        collector = DeletionCollector(self.sqlite, store, batch_size=50, interval=60.0)
+        self.assertTrue(collector.wait_idle(5))
+        size_before = os.path.getsize(self.db_path)
+
+        collector.delete("big")
+        self.assertEqual([v["uuid"] for v in self.sqlite.get_videos()], ["keep"])
+        self.assertEqual(self.sqlite.count_videos(), 1)
+
+        self.assertTrue(collector.wait_idle(10))
+        self.assertEqual(self.sqlite.get_deleted_video_uuids(), [])
+        self.assertEqual(self.sqlite.get_frame_ids("big"), [])
+        self.assertEqual(len(self.sqlite.get_frame_ids("keep")), 1)
+        self.assertEqual(len([i for i in store.deleted if "_summary_" not in i]), 120)
+        self.assertLess(os.path.getsize(self.db_path), size_before / 2)
+
+    def test_location_queries_skip_tombstoned_videos(self):
+        self.assertEqual({f["video_uuid"] for f in self.sqlite.get_frames_by_location(limit=500)}, {"big", "keep"})
+        self.sqlite.tombstone_video("big")
+        self.assertEqual({f["video_uuid"] for f in self.sqlite.get_frames_by_location(limit=500)}, {"keep"})
+        self.assertEqual(self.sqlite.get_frames_by_location(video_uuid="big"), [])
+
+    def test_legacy_database_is_only_converted_explicitly(self):
+        import sqlite3
+        legacy_path = os.path.join(self.tmp_dir.name, "legacy.db")
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("CREATE TABLE legacy (id INTEGER)")
+        conn.close()
+        legacy = SQLiteHandler(legacy_path)
+
+        # The background collector never runs a full VACUUM
+        self.assertEqual(legacy.incremental_vacuum(), 0)
+        conn = sqlite3.connect(legacy_path)
+        self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 0)
+        conn.close()
+        self.assertTrue(legacy.enable_incremental_vacuum())
+        self.assertFalse(legacy.enable_incremental_vacuum())
+
+class InMemoryVectorStore(FakeVectorStore):
+    """Keeps Chroma-style entries (frames and summaries) in dicts keyed by id."""
+
+    def __init__(self, model=None):
+        super().__init__()
+        self.model = model
+        self.entries = {False: {}, True: {}}
+
+    def embedding_model(self):
+        return self.model
+
+    def get_entries(self, video_uuid, summaries=False):
+        return {i: e for i, e in self.entries[summaries].items() if e["metadata"]["video_uuid"] == video_uuid}
+
+    def add_entries(self, ids, embeddings, documents, metadatas, summaries=False, model=None):
+        if model != self.model:
+            raise ValueError(f"Embedded with {model}, the store uses {self.model}")
+        for entry_id, embedding, document, metadata in zip(ids, embeddings, documents, metadatas):
+            self.entries[summaries][entry_id] = {"embedding": embedding, "document": document, "metadata": metadata}
+
+class TestVideoBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.source = SQLiteHandler(os.path.join(self.tmp_dir.name, "source.db"))
+        self.target = SQLiteHandler(os.path.join(self.tmp_dir.name, "target.db"))
+        self.source_store, self.target_store = InMemoryVectorStore(), InMemoryVectorStore()
+        self.source_archive = EmbeddingArchive(os.path.join(self.tmp_dir.name, "source_emb"))
+        self.target_archive = EmbeddingArchive(os.path.join(self.tmp_dir.name, "target_emb"))
+
+        self.source.add_video("v1", "flight.mp4", "Harbor patrol", status="complete")
+        for i in range(5):
+            telemetry = {"latitude": 10.0 + i, "longitude": 20.0, "altitude": 50.0, "heading": 90.0} if i % 2 else None
+            analysis = {"person_count": i, "vehicle_count": 0, "suspicious": i == 4, "activities": ["patrolling"],
+                        "flags": ["loitering"] if i == 4 else []} if i else None
+            frame_id = self.source.add_frame("v1", i * 1.5, f"desc {i}", bytes([i]) * (100 + i), telemetry=telemetry,
+                                             analysis=analysis)
+            self.source_store.add_entries([f"v1_{frame_id}"], [[float(i), 1.0, 0.0]], [f"[{i * 1.5:.1f}s]: desc {i}"],
+                                          [{"video_uuid": "v1", "frame_name": str(frame_id), "timestamp": i * 1.5}])
+        summary_id = self.source.add_summary("v1", "video", 0.0, 6.0, "a patrol")
+        self.source_store.add_entries([f"v1_summary_{summary_id}"], [[0.0, 0.0, 1.0]], ["a patrol"],
+                                      [{"video_uuid": "v1", "level": "video"}], summaries=True)
+        self.source.add_alert("v1", {"rule_id": "r", "type": "T", "severity": "HIGH", "message": "m",
+                                     "frame": "frame_1.50"}, 1.5)
+        writer = self.source_archive.writer("v1")
+        writer.append(np.ones((3, 4)), [0.0, 0.5, 1.0])
+        writer.close()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_roundtrip_preserves_analysis(self):
+        path = os.path.join(self.tmp_dir.name, "v1.zip")
+        VideoBundle(self.source, self.source_store, self.source_archive).export_bundle("v1", path, include_dino=True)
+        manifest = VideoBundle(self.target, self.target_store, self.target_archive).import_bundle(path)
+        self.assertEqual(manifest["frames"], 5)
+
+        self.assertEqual(self.target.get_videos()[0]["smart_title"], "Harbor patrol")
+        frames = list(self.target.iter_frames("v1"))
+        self.assertEqual([f["description"] for f in frames], [f"desc {i}" for i in range(5)])
+        self.assertEqual(frames[3]["image_data"], bytes([3]) * 103)
+        self.assertEqual(frames[1]["latitude"], 11.0)
+        self.assertIsNone(frames[0]["latitude"])
+        self.assertEqual([f["person_count"] for f in frames], [None, 1, 2, 3, 4])
+        self.assertEqual(self.target.get_frame_labels("v1")[frames[4]["id"]],
+                         {"activities": ["patrolling"], "flags": ["loitering"]})
+        entries = self.target_store.get_entries("v1")
+        self.assertEqual(sorted(entries), sorted(f"v1_{f['id']}" for f in frames))
+        self.assertEqual(entries[f"v1_{frames[2]['id']}"]["embedding"], [2.0, 1.0, 0.0])
+        self.assertEqual(len(self.target_store.get_entries("v1", summaries=True)), 1)
+        self.assertEqual(self.target.count_alerts("v1"), 1)
+        self.assertEqual(self.target_archive.load("v1")[1].shape, (3, 4))
+
+        with self.assertRaises(ValueError):
+            VideoBundle(self.target, self.target_store).import_bundle(path)
+
+    def test_import_from_another_model_is_reembedded_or_refused(self):
+        self.source_store.model = "old-model"
+        path = os.path.join(self.tmp_dir.name, "v1.zip")
+        manifest = VideoBundle(self.source, self.source_store).export_bundle("v1", path)
+        self.assertEqual(manifest["text_embedding_model"], "old-model")
+
+        self.target_store.model = "new-model"
+        with self.assertRaises(ValueError):
+            VideoBundle(self.target, self.target_store).import_bundle(path)
+        self.assertEqual(self.target.get_videos(), [])
+
+        embedded = []
+        def embed(texts):
+            embedded.extend(texts)
+            return [[7.0, 7.0, 7.0] for _ in texts], "new-model"
+        VideoBundle(self.target, self.target_store, embed_fn=embed).import_bundle(path)
+        self.assertEqual(len(embedded), 6)
+        entries = self.target_store.get_entries("v1")
+        self.assertEqual(len(entries), 5)
+        self.assertTrue(all(e["embedding"] == [7.0, 7.0, 7.0] for e in entries.values()))
+        summary = next(iter(self.target_store.get_entries("v1", summaries=True).values()))
+        self.assertEqual(summary["embedding"], [7.0, 7.0, 7.0])
+
+class TestEmbeddedVectorStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = EmbeddedVectorStore(self.tmp_dir.name)
+        rng = np.random.default_rng(0)
+        self.vectors = {}
+        for video in ("a", "b"):
+            vectors = rng.normal(size=(300, 16)).astype(np.float32)
+            self.vectors[video] = vectors
+            self.store.add_entries(
+                [f"{video}_{i}" for i in range(300)], vectors, [f"{video} frame {i}" for i in range(300)],
+                [{"video_uuid": video, "frame_name": str(i), "altitude": float(i), "created_at": 100.0 if video == "a" else 200.0}
+                 for i in range(300)]
+            )
+        self.query = rng.normal(size=16).astype(np.float32)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def exact(self, video, rows=None):
+        distances = ((self.vectors[video] - self.query) ** 2).sum(axis=1)
+        order = [i for i in np.argsort(distances) if rows is None or i in rows]
+        return [f"{video}_{i}" for i in order], distances
+
+    def test_video_query_is_exact_top_k(self):
+        result = self.store.query(self.query, "a", n_results=5)
+        expected, distances = self.exact("a")
+        self.assertEqual(result["ids"][0], expected[:5])
+        np.testing.assert_allclose(result["distances"][0], np.sort(distances)[:5], rtol=1e-4)
+
+        filtered = self.store.query(self.query, "a", n_results=5, min_altitude=100, max_altitude=149)
+        self.assertEqual(filtered["ids"][0], self.exact("a", rows=set(range(100, 150)))[0][:5])
+
+    def check_library_search_and_deletes(self, store):
+        result = store.search_library(self.query, n_results=10)
+        merged = sorted(self.exact("a")[0][:10] + self.exact("b")[0][:10],
+                        key=lambda entry_id: ((self.vectors[entry_id[0]][int(entry_id[2:])] - self.query) ** 2).sum())
+        self.assertEqual(result["ids"][0], merged[:10])
+
+        newer = store.search_library(self.query, n_results=10, created_after=150.0)
+        self.assertTrue(all(m["video_uuid"] == "b" for m in newer["metadatas"][0]))
+
+        best = self.exact("a")[0][0]
+        store.delete_entries("a", [best[2:]])
+        self.assertNotIn(best, store.query(self.query, "a", n_results=5)["ids"][0])
+        store.delete_video("b")
+        library = store.search_library(self.query, n_results=20)
+        self.assertTrue(all(m["video_uuid"] == "a" for m in library["metadatas"][0]))
+        self.assertNotIn(best, library["ids"][0])
+
+    def test_library_search_and_deletes_exact(self):
+        self.check_library_search_and_deletes(EmbeddedVectorStore(self.tmp_dir.name, use_ann=False))
+
+    @unittest.skipIf(embedded_store.hnswlib is None, "hnswlib is not installed (ann extra)")
+    def test_library_search_and_deletes_ann(self):
+        # ef above the collection size makes the HNSW search exhaustive, so results match exactly
+        self.check_library_search_and_deletes(EmbeddedVectorStore(self.tmp_dir.name, ann_ef=1000, use_ann=True))
+
+    def test_delete_leaves_entries_held_by_queries_intact(self):
+        # A query that fetched the video's entries before a delete keeps scanning them
+        held = self.store._entries("a")
+        self.store.delete_entries("a", [str(i) for i in range(100)])
+        self.assertEqual(held.distances(self.query).shape, (300,))
+        self.assertEqual(len(self.store.get_entries("a")), 200)
+        self.assertEqual(len(self.store.query(self.query, "a", n_results=500)["ids"][0]), 200)
+
+    def check_sees_other_writers(self, use_ann):
+        # Ingest and query nodes share the root, each with its own store instance
+        writer = EmbeddedVectorStore(self.tmp_dir.name, use_ann=False)
+        reader = EmbeddedVectorStore(self.tmp_dir.name, use_ann=use_ann, ann_ef=1000, refresh_interval=0)
+        metadata = {"video_uuid": "v", "frame_name": "1", "timestamp": 1.0, "created_at": 1.0}
+        writer.add_entries(["v_1"], [np.ones(16)], ["first"], [metadata])
+        self.assertEqual(reader.query(np.ones(16), "v")["ids"][0], ["v_1"])
+        reader.search_library(np.ones(16), n_results=1)
+
+        writer.add_entries(["v_2"], [2 * np.ones(16)], ["second"], [dict(metadata, frame_name="2")])
+        self.assertEqual(reader.query(2 * np.ones(16), "v", n_results=1)["ids"][0], ["v_2"])
+        self.assertEqual(reader.search_library(2 * np.ones(16), n_results=1)["ids"][0], ["v_2"])
+        writer.add_entries(["w_1"], [3 * np.ones(16)], ["other video"], [dict(metadata, video_uuid="w")])
+        self.assertEqual(reader.search_library(3 * np.ones(16), n_results=1)["ids"][0], ["w_1"])
+
+        writer.delete_video("w")
+        writer.delete_entries("v", ["2"])
+        self.assertEqual(reader.query(2 * np.ones(16), "v")["ids"][0], ["v_1"])
+        self.assertNotIn("w_1", reader.search_library(3 * np.ones(16), n_results=5)["ids"][0])
+
+    def test_sees_other_writers_exact(self):
+        self.check_sees_other_writers(use_ann=False)
+
+    @unittest.skipIf(embedded_store.hnswlib is None, "hnswlib is not installed (ann extra)")
+    def test_sees_other_writers_ann(self):
+        self.check_sees_other_writers(use_ann=True)
+
+    def test_torn_append_is_ignored(self):
+        directory = os.path.join(self.tmp_dir.name, "a")
+        # A writer stopped halfway through a vector and a row
+        with open(os.path.join(directory, "frames.f32"), "ab") as f:
+            f.write(b"\0" * 10)
+        with open(os.path.join(directory, "frames.jsonl"), "a", encoding="utf-8") as f:
+            f.write('{"id": "a_torn", "docum')
+        entries = EmbeddedVectorStore(self.tmp_dir.name)._entries("a")
+        self.assertEqual(entries.vectors.shape, (300, 16))
+        self.assertNotIn("a_torn", entries.rows)
+        np.testing.assert_allclose(entries.vectors[299], self.vectors["a"][299])
+
+class TestUploadSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.payload = os.urandom(10_000)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_chunked_spool_hashes_and_never_collides(self):
+        first = spool_upload(io.BytesIO(self.payload), "clip.mp4", self.tmp_dir.name, expected_size=len(self.payload), chunk_size=1024)
+        second = spool_upload(io.BytesIO(self.payload), "clip.mp4", self.tmp_dir.name, chunk_size=1024)
+        self.assertNotEqual(first["path"], second["path"])
+        self.assertTrue(first["path"].endswith(".mp4"))
+        self.assertEqual(first["sha256"], hashlib.sha256(self.payload).hexdigest())
+        self.assertEqual(first["size"], len(self.payload))
+        with open(first["path"], "rb") as f:
+            self.assertEqual(f.read(), self.payload)
+
+    def test_truncated_or_oversized_upload_leaves_nothing(self):
+        with self.assertRaises(ValueError):
+            spool_upload(io.BytesIO(self.payload), "clip.mp4", self.tmp_dir.name, expected_size=len(self.payload) + 1)
+        with self.assertRaises(ValueError):
+            spool_upload(io.BytesIO(self.payload), "../../clip.mp4", self.tmp_dir.name, max_bytes=4096, chunk_size=1024)
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+class FakeEngine:
+    """Stands in for VideoAnalysisEngine behind the API service."""
+
+    def __init__(self, sqlite_handler):
+        self.sqlite_handler = sqlite_handler
+        self.conversation_memory = ConversationMemory(sqlite_handler, None)
+        self.processed = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def process_video(self, video_path, telemetry_path=None, telemetry_offset=0.0, telemetry_time_unit="seconds",
+                      video_filename=None, sha256=None, profile=None):
+        self.started.set()
+        self.release.wait(10)
+        with open(video_path, "rb") as f:
+            self.processed.append(f.read())
+        if video_filename == "broken.mp4":
+            raise ValueError("Could not open video")
+        video_uuid = f"v{len(self.processed)}"
+        self.sqlite_handler.add_video(video_uuid, video_filename, "Untitled", sha256=sha256)
+        return {"video_uuid": video_uuid, "smart_title": "Untitled", "alerts": []}
+
+    def query_video(self, video_uuid, query_text, session_id=None, return_sources=False, **filters):
+        self.sqlite_handler.add_chat_message(session_id, "user", query_text)
+        return {"answer": f"{video_uuid}: {query_text}", "sources": [{"type": "frame", "frame_id": 1, "timestamp": 0.5}]}
+
+class TestApiService(unittest.TestCase):
+
+    def setUp(self):
+        from fastapi.testclient import TestClient
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.sqlite = SQLiteHandler(os.path.join(self.tmp_dir.name, "videos.db"))
+        self.engine = FakeEngine(self.sqlite)
+        self.spool_dir = os.path.join(self.tmp_dir.name, "spool")
+        app = create_app(engine_factory=lambda: self.engine, sqlite_handler=self.sqlite, spool_dir=self.spool_dir)
+        self.http = TestClient(app)
+        self.client = ApiClient("http://testserver", session=self.http, timeout=None)
+
+    def tearDown(self):
+        self.http.close()
+        self.tmp_dir.cleanup()
+
+    def test_ingestion_jobs_and_queries(self):
+        submitted = self.client.submit_video(io.BytesIO(b"video bytes"), "gate.mp4")
+        job = self.client.wait_for_job(submitted["job_id"], timeout=10, poll_interval=0.05)
+        self.assertEqual((job["status"], job["video_uuid"]), ("complete", "v1"))
+        self.assertEqual(self.engine.processed, [b"video bytes"])
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+        again = self.client.submit_video(io.BytesIO(b"video bytes"), "gate.mp4")
+        self.assertEqual(again["duplicate_of"], "v1")
+        self.client.wait_for_job(again["job_id"], timeout=10, poll_interval=0.05)
+
+        failed = self.client.submit_video(io.BytesIO(b"junk"), "broken.mp4")
+        job = self.client.wait_for_job(failed["job_id"], timeout=10, poll_interval=0.05)
+        self.assertEqual((job["status"], job["error"]), ("failed", "Could not open video"))
+
+        session_id = self.client.start_session("v1")
+        result = self.client.query_video("v1", "Who is at the gate?", session_id=session_id)
+        self.assertEqual(result["answer"], "v1: Who is at the gate?")
+        self.assertEqual(result["sources"][0]["frame_id"], 1)
+        self.assertEqual(self.sqlite.count_chat_messages(session_id), 1)
+        with self.assertRaises(ValueError):
+            self.client.query_video("missing", "Anything?")
+
+    def test_shutdown_fails_queued_jobs_and_removes_their_uploads(self):
+        from fastapi.testclient import TestClient
+        self.engine.release.clear()
+        app = create_app(engine_factory=lambda: self.engine, sqlite_handler=self.sqlite, spool_dir=self.spool_dir,
+                         ingest_workers=1)
+        with TestClient(app) as http:
+            client = ApiClient("http://testserver", session=http, timeout=None)
+            running = client.submit_video(io.BytesIO(b"first"), "first.mp4")
+            self.assertTrue(self.engine.started.wait(5))
+            queued = client.submit_video(io.BytesIO(b"second"), "second.mp4")
+            self.assertEqual(len(os.listdir(self.spool_dir)), 2)
+        # Leaving the client runs the lifespan shutdown
+        job = self.sqlite.get_job(queued["job_id"])
+        self.assertEqual((job["status"], job["error"]), ("failed", "Service stopped before the job started"))
+        self.assertEqual(len(os.listdir(self.spool_dir)), 1)
+
+        self.engine.release.set()
+        deadline = time.time() + 5
+        while self.sqlite.get_job(running["job_id"])["status"] != "complete" and time.time() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(self.sqlite.get_job(running["job_id"])["status"], "complete")
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_roles_split_routes(self):
+        from fastapi.testclient import TestClient
+        query_node = TestClient(create_app(engine_factory=lambda: self.engine, sqlite_handler=self.sqlite, role="query"))
+        self.assertEqual(query_node.post("/videos", files={"video": ("a.mp4", b"x")}).status_code, 404)
+        self.assertEqual(query_node.get("/health").json()["role"], "query")
+        query_node.close()
+
+class TestReindexer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.previous_path = os.environ.get("VECTOR_STORE_PATH")
+        os.environ["VECTOR_STORE_PATH"] = os.path.join(self.tmp_dir.name, "vectors")
+        self.sqlite = SQLiteHandler(os.path.join(self.tmp_dir.name, "videos.db"))
+        for video in ("a", "b", "gone"):
+            self.sqlite.add_video(video, f"{video}.mp4", f"Video {video}")
+            for t in range(5):
+                self.sqlite.add_frame(video, float(t), f"{video} scene {t}", b"jpg", telemetry={"altitude": 10.0 + t})
+            self.sqlite.add_summary(video, "video", 0.0, 4.0, f"{video} overall")
+        self.sqlite.tombstone_video("gone")
+        self.calls = 0
+
+    def tearDown(self):
+        if self.previous_path is None:
+            os.environ.pop("VECTOR_STORE_PATH", None)
+        else:
+            os.environ["VECTOR_STORE_PATH"] = self.previous_path
+        self.tmp_dir.cleanup()
+
+    def embed(self, texts, fail_after=None):
+        self.calls += 1
+        if fail_after is not None and self.calls > fail_after:
+            raise RuntimeError("interrupted")
+        return [[len(text), text.count("a"), text.count("b"), 1.0] for text in texts]
+
+    def test_resumable_reindex_and_atomic_switch(self):
+        self.assertEqual(active_collection(self.sqlite)["name"], "Video_Embeddings")
+        proxy = ActiveVectorStore("embedded", sqlite_handler=self.sqlite, refresh_interval=0)
+        self.sqlite.register_collection("Video_Embeddings_v2", "fake-model")
+        target = EmbeddedVectorStore(os.path.join(self.tmp_dir.name, "vectors-Video_Embeddings_v2"))
+
+        with self.assertRaises(RuntimeError):
+            Reindexer(self.sqlite, lambda texts: self.embed(texts, fail_after=2), target,
+                      "Video_Embeddings_v2", batch_size=3).run()
+        self.assertEqual(self.sqlite.get_collection("Video_Embeddings_v2")["last_frame_id"], 6)
+        # Deletes reach the collection being built
+        proxy.delete_entries("a", ["1"])
+        self.sqlite.delete_frames([1])
+
+        report = Reindexer(self.sqlite, self.embed, target, "Video_Embeddings_v2", batch_size=3).run()
+        self.assertEqual((report["frames"], report["summaries"]), (4, 2))
+        self.assertEqual(proxy.collection()["name"], "Video_Embeddings")
+        self.assertEqual(proxy.get_entries("a"), {})
+
+        self.sqlite.activate_collection("Video_Embeddings_v2")
+        self.assertEqual([c["status"] for c in self.sqlite.get_collections()], ["retired", "active"])
+        self.assertEqual(proxy.collection()["model"], "fake-model")
+        entries = proxy.get_entries("a")
+        self.assertEqual(sorted(entries), [f"a_{i}" for i in range(2, 6)])
+        self.assertEqual(entries["a_2"]["metadata"]["altitude"], 11.0)
+        self.assertEqual(entries["a_2"]["document"], "[1.0s]: a scene 1")
+        self.assertEqual(len(proxy.get_entries("b")), 5)
+        self.assertEqual(len(proxy.get_entries("a", summaries=True)), 1)
+        self.assertEqual(proxy.get_entries("gone"), {})
+
+    def test_write_embedded_with_the_previous_model_is_rejected(self):
+        # A long refresh interval: the proxy still caches the old collection when the switch lands
+        proxy = ActiveVectorStore("embedded", sqlite_handler=self.sqlite, refresh_interval=3600)
+        old_model = proxy.collection()["model"]
+        self.sqlite.register_collection("Video_Embeddings_v2", "fake-model")
+        self.sqlite.activate_collection("Video_Embeddings_v2")
+        self.assertEqual(proxy.embedding_model(), "fake-model")
+
+        with self.assertRaises(EmbeddingModelMismatch):
+            proxy.add_entry("a", "a.mp4", "9", "", "late frame", [1.0, 0.0, 0.0, 1.0], model=old_model)
+        proxy.add_entry("a", "a.mp4", "9", "", "late frame", [1.0, 0.0, 0.0, 1.0], model="fake-model")
+        self.assertEqual(proxy.collection()["name"], "Video_Embeddings_v2")
+        self.assertEqual(list(proxy.get_entries("a")), ["a_9"])
+
+class TestProfiler(unittest.TestCase):
+
+    class Worker:
+        def inner(self, n):
+            return sum(i * i for i in range(n))
+
+        @profiled("work")
+        def work(self, n, label="x"):
+            return self.inner(n) + self.inner(n // 2)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.previous_dir = os.environ.get("PROFILE_DIR")
+        os.environ["PROFILE_DIR"] = self.tmp_dir.name
+
+    def tearDown(self):
+        if self.previous_dir is None:
+            os.environ.pop("PROFILE_DIR", None)
+        else:
+            os.environ["PROFILE_DIR"] = self.previous_dir
+        self.tmp_dir.cleanup()
+
+    def test_profiles_only_when_asked(self):
+        worker = self.Worker()
+        self.assertEqual(worker.work(1000), worker.inner(1000) + worker.inner(500))
+        store = ProfileStore()
+        self.assertEqual(store.list(), [])
+
+        worker.work(200_000, label="slow", profile=True)
+        profiles = store.list()
+        self.assertEqual(len(profiles), 1)
+        # Text arguments (questions, paths) are only recorded as length and hash
+        label = f"<4 chars, sha256 {hashlib.sha256(b'slow').hexdigest()[:12]}>"
+        self.assertEqual((profiles[0]["kind"], profiles[0]["details"]), ("work", {"label": label, "arg0": 200_000}))
+
+        request_id = profiles[0]["request_id"]
+        inner = next(row for row in store.hotspots(request_id, sort="cumtime") if row["function"].endswith("(inner)"))
+        self.assertEqual(inner["calls"], 2)
+        folded = store.folded(request_id).splitlines()
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in folded))
+        self.assertTrue(any("(work);" in line and "(inner)" in line for line in folded))
+
+class TestQueryCoordinator(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = EmbeddedVectorStore(self.tmp_dir.name)
+        rng = np.random.default_rng(0)
+        for video in ("a", "b"):
+            self.store.add_entries([f"{video}_{i}" for i in range(20)], rng.normal(size=(20, 4)).astype(np.float32),
+                                   [f"{video} frame {i}" for i in range(20)],
+                                   [{"video_uuid": video, "frame_name": str(i), "timestamp": float(i),
+                                     "altitude": float(i)} for i in range(20)])
+        self.encode_calls = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def embed(self, texts):
+        self.encode_calls.append(list(texts))
+        return [[len(text), text.count("a"), text.count("e"), 1.0] for text in texts]
+
+    def test_concurrent_queries_share_one_batch(self):
+        coordinator = QueryCoordinator(self.embed, self.store, window_ms=200)
+        texts = ["a person", "the gate area", "a parked van", "nothing", "east fence", "vehicle at the road"]
+        results = {}
+
+        def ask(i, text):
+            embedding = coordinator.embed(text)
+            results[i] = coordinator.query(embedding, "a" if i % 2 else "b", n_results=3 + i % 3,
+                                           min_altitude=2.0 if i == 5 else None)
+
+        threads = [threading.Thread(target=ask, args=(i, text)) for i, text in enumerate(texts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(self.encode_calls), 1)
+        self.assertEqual(sorted(self.encode_calls[0]), sorted(texts))
+        for i, text in enumerate(texts):
+            direct = self.store.query(self.embed([text])[0], "a" if i % 2 else "b", n_results=3 + i % 3,
+                                      min_altitude=2.0 if i == 5 else None)
+            self.assertEqual(results[i]["ids"], direct["ids"])
+            np.testing.assert_allclose(results[i]["distances"][0], direct["distances"][0], rtol=1e-5)
+        self.assertTrue(all(m["altitude"] >= 2.0 for m in results[5]["metadatas"][0]))
+
+    def test_batch_time_is_credited_to_profiled_callers(self):
+        coordinator = QueryCoordinator(self.embed, self.store, window_ms=50)
+
+        class Asker:
+            @profiled("ask")
+            def ask(self, text):
+                return coordinator.query(coordinator.embed(text), "a", n_results=2)
+
+        with tempfile.TemporaryDirectory() as profile_dir:
+            previous_dir = os.environ.get("PROFILE_DIR")
+            os.environ["PROFILE_DIR"] = profile_dir
+            try:
+                Asker().ask("a person", profile=True)
+            finally:
+                if previous_dir is None:
+                    os.environ.pop("PROFILE_DIR", None)
+                else:
+                    os.environ["PROFILE_DIR"] = previous_dir
+            offloaded = ProfileStore(profile_dir).list()[0]["details"]["offloaded"]
+        self.assertEqual(sorted(offloaded), ["query_coordinator.embed", "query_coordinator.query"])
+        self.assertEqual(offloaded["query_coordinator.embed"]["calls"], 1)
+        self.assertGreater(offloaded["query_coordinator.query"]["waited"], 0.0)
+
+    def test_zero_window_calls_directly(self):
+        coordinator = QueryCoordinator(self.embed, self.store, window_ms=0)
+        embedding = coordinator.embed("a person")
+        self.assertEqual(coordinator.query(embedding, "a", n_results=2), self.store.query(embedding, "a", n_results=2))
+        self.assertIsNone(coordinator._thread)
+
+class TestContextBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.builder = ContextBuilder(max_tokens=60, min_results=2)
+
+    def test_orders_by_time_and_drops_duplicates(self):
+        documents = [
+            "[12.0s]: A red truck parks near the gate.",
+            "[3.0s]: Two people walk along the fence.",
+            "[12.5s]: A red truck parks near the gate.",
+        ]
+        context, selected = self.builder.build(documents, distances=[0.1, 0.2, 0.21])
+        self.assertEqual([e["timestamp"] for e in selected], [3.0, 12.0])
+        self.assertTrue(context.startswith("[3.0s]"))
+
+    def test_respects_token_budget(self):
+        documents = [f"[{i}.0s]: " + "word " * 20 for i in range(10)]
+        context, selected = self.builder.build(documents)
+        self.assertLessEqual(sum(self.builder.count_tokens(e["document"]) + 1 for e in selected), 60)
+        self.assertTrue(selected)
+
+    def test_adaptive_n_results_cuts_at_gap(self):
+        self.assertEqual(self.builder.select_n_results([0.1, 0.12, 0.13, 0.9, 0.95]), 3)
+        self.assertEqual(self.builder.select_n_results([0.1, 0.2, 0.3, 0.4, 0.5]), 5)
+
+class StubSummaryAI:
+    """Stands in for AIHandler during ingestion: canned frame analyses and recorded summarize calls."""
+
+    def __init__(self, store):
+        self.store = store
+        self.summarize_calls = []
+
+    def analyze_image(self, image, frame_name):
+        return {"description": f"scene at {frame_name}", "people_count": 0, "vehicle_count": 1, "labels": ["truck"]}
+
+    def summarize_descriptions(self, texts, scope="segment"):
+        self.summarize_calls.append((scope, list(texts)))
+        return f"{scope} summary of {len(texts)}"
+
+    def embed_tagged(self, texts):
+        vectors = [[1.0, 0.0, 0.0, 0.0] if text.startswith("video") else [0.0, 1.0, float(len(text)), 1.0]
+                   for text in texts]
+        return vectors, self.store.embedding_model()
+
+class StubTitleWorker:
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, video_uuid, texts):
+        self.submitted.append((video_uuid, len(texts)))
+
+class SummaryEngine:
+    """The parts of VideoAnalysisEngine an IngestionSession uses, over a real SQLite and vector store."""
+
+    summary_segment_size = 3
+    title_initial_frames = 3
+
+    def __init__(self, sqlite_handler, db_handler):
+        self.sqlite_handler = sqlite_handler
+        self.db_handler = db_handler
+        self.ai_handler = StubSummaryAI(db_handler)
+        self.title_worker = StubTitleWorker()
+        self.alert_engine = AlertEngine()
+
+    def write_embedded(self, text, write, embedded=None):
+        if embedded is None:
+            embeddings, model = self.ai_handler.embed_tagged([text])
+            embedded = (embeddings[0], model)
+        write(*embedded)
+
+    def store_summary(self, video_uuid, level, start_time, end_time, summary):
+        summary_id = self.sqlite_handler.add_summary(video_uuid, level, start_time, end_time, summary)
+        self.write_embedded(summary, lambda embedding, model: self.db_handler.add_summary_entry(
+            video_uuid, summary_id, level, start_time, end_time, summary, embedding, model=model))
+
+class TestSummaryHierarchy(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.previous_path = os.environ.get("VECTOR_STORE_PATH")
+        os.environ["VECTOR_STORE_PATH"] = os.path.join(self.tmp_dir.name, "vectors")
+        self.sqlite = SQLiteHandler(os.path.join(self.tmp_dir.name, "videos.db"))
+        self.sqlite.add_video("v", "v.mp4", "Processing...")
+        self.store = ActiveVectorStore("embedded", sqlite_handler=self.sqlite, refresh_interval=0)
+        self.engine = SummaryEngine(self.sqlite, self.store)
+
+    def tearDown(self):
+        if self.previous_path is None:
+            os.environ.pop("VECTOR_STORE_PATH", None)
+        else:
+            os.environ["VECTOR_STORE_PATH"] = self.previous_path
+        self.tmp_dir.cleanup()
+
+    def ingest(self, timestamps):
+        session = IngestionSession(self.engine, "v", "v.mp4", time.time(), check_alerts=False)
+        for t in timestamps:
+            session.analyze_keyframe(Image.new("RGB", (32, 32), (int(t) * 10, 0, 0)), float(t))
+        return session.finish()
+
+    def test_segments_and_video_summary_boundaries(self):
+        self.ingest(range(7))
+        self.assertEqual([scope for scope, _ in self.engine.ai_handler.summarize_calls],
+                         ["segment", "segment", "segment", "video"])
+        self.assertEqual([len(texts) for _, texts in self.engine.ai_handler.summarize_calls], [3, 3, 1, 3])
+        self.assertEqual([(s["start_time"], s["end_time"]) for s in self.sqlite.get_summaries("v", level="segment")],
+                         [(0.0, 2.0), (3.0, 5.0), (6.0, 6.0)])
+        video = self.sqlite.get_summaries("v", level="video")
+        self.assertEqual([(s["start_time"], s["end_time"], s["summary"]) for s in video],
+                         [(0.0, 6.0, "video summary of 3")])
+        # The video summary is built from the segment summaries, with their time ranges
+        self.assertTrue(self.engine.ai_handler.summarize_calls[-1][1][0].startswith("[0.0s-2.0s]: segment summary"))
+
+        entries = self.store.get_entries("v", summaries=True)
+        self.assertEqual(sorted((e["metadata"]["level"], e["metadata"]["start_time"], e["metadata"]["end_time"])
+                                for e in entries.values()),
+                         [("segment", 0.0, 2.0), ("segment", 3.0, 5.0), ("segment", 6.0, 6.0), ("video", 0.0, 6.0)])
+
+    def test_single_segment_is_the_video_summary(self):
+        self.ingest(range(2))
+        self.assertEqual([scope for scope, _ in self.engine.ai_handler.summarize_calls], ["segment"])
+        self.assertEqual([(s["start_time"], s["end_time"], s["summary"]) for s in self.sqlite.get_summaries("v", level="video")],
+                         [(0.0, 1.0, "segment summary of 2")])
+
+    def test_global_question_is_answered_from_summaries(self):
+        self.ingest(range(7))
+        question = "Summarize the whole video"
+        router = QueryRouter()
+        self.assertEqual(router.route(question), "global")
+        self.assertIsNone(router.aggregate(question))
+
+        query_embedding = self.engine.ai_handler.embed_tagged([question])[0][0]
+        results = self.store.query_summaries(query_embedding, "v", level="segment")
+        context, sources = ContextBuilder().build_summary_context(self.sqlite.get_summaries("v", level="video")[0],
+                                                                  results)
+        lines = context.split("\n")
+        self.assertEqual(lines[0], "Whole video summary: video summary of 3")
+        self.assertEqual(lines[1:], ["Segment [0.0s-2.0s]: segment summary of 3",
+                                     "Segment [3.0s-5.0s]: segment summary of 3",
+                                     "Segment [6.0s-6.0s]: segment summary of 1"])
+        self.assertEqual([(s["type"], s["start_time"], s["end_time"]) for s in sources],
+                         [("segment", 0.0, 2.0), ("segment", 3.0, 5.0), ("segment", 6.0, 6.0)])
+
+    def test_summary_context_falls_back_to_the_video_range(self):
+        builder = ContextBuilder()
+        context, sources = builder.build_summary_context(
+            {"summary": "quiet yard", "start_time": 0.0, "end_time": 9.0}, {"documents": [], "metadatas": []})
+        self.assertEqual(context, "Whole video summary: quiet yard")
+        self.assertEqual(sources, [{"type": "video", "start_time": 0.0, "end_time": 9.0}])
+
+class TestFrameAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.sqlite = SQLiteHandler(os.path.join(self.tmp_dir.name, "videos.db"))
+        self.sqlite.add_video("v", "v.mp4", "Video")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_validates_json_reply(self):
+        analysis = parse_frame_analysis(
+            '```json\n{"description": "Two men near a van.", "person_count": "2", "vehicle_count": 1.0, '
+            '"activities": ["Walking", "walking ", 3], "suspicious": "no", "suspicion_flags": []}\n```'
+        )
+        self.assertEqual(analysis, {"description": "Two men near a van.", "person_count": 2, "vehicle_count": 1,
+                                    "activities": ["walking"], "suspicious": False, "flags": []})
+        malformed = parse_frame_analysis('{"person_count": -3, "vehicle_count": true, "suspicion_flags": "Loitering"}')
+        self.assertEqual((malformed["person_count"], malformed["vehicle_count"]), (None, None))
+        self.assertEqual((malformed["flags"], malformed["suspicious"]), (["loitering"], True))
+        self.assertEqual(parse_frame_analysis("A quiet street.")["description"], "A quiet street.")
+        self.assertIsNone(parse_frame_analysis("A quiet street.")["person_count"])
+
+    def test_aggregates_from_sql(self):
+        analyses = [
+            {"person_count": 0, "vehicle_count": 1, "activities": ["parking"], "suspicious": False, "flags": []},
+            {"person_count": 3, "vehicle_count": 1, "activities": ["walking"], "suspicious": True, "flags": ["loitering"]},
+            {"person_count": 3, "vehicle_count": 0, "activities": ["walking", "running"], "suspicious": False, "flags": []},
+            None,
+        ]
+        ids = [self.sqlite.add_frame("v", float(t), f"frame {t}", b"jpg", analysis=analysis)
+               for t, analysis in enumerate(analyses)]
+        counts = self.sqlite.get_frame_counts("v")
+        self.assertEqual((counts["frames"], counts["analyzed"]), (4, 3))
+        self.assertEqual((counts["person_frames"], counts["vehicle_frames"], counts["suspicious_frames"]), (2, 2, 1))
+        self.assertEqual(counts["max_people"], {"frame_id": ids[1], "timestamp": 1.0, "count": 3})
+        self.assertEqual(self.sqlite.first_appearance("v", "person"), {"frame_id": ids[1], "timestamp": 1.0})
+        self.assertEqual(self.sqlite.first_appearance("v", "run")["timestamp"], 2.0)
+        self.assertEqual(self.sqlite.first_appearance("v", "suspicious")["frame_id"], ids[1])
+        self.assertIsNone(self.sqlite.first_appearance("v", "digging"))
+        # Wildcards in the subject are matched literally
+        self.assertIsNone(self.sqlite.first_appearance("v", "_alking"))
+        self.assertIsNone(self.sqlite.first_appearance("v", "w%g"))
+        self.assertEqual(self.sqlite.get_frame_labels("v")[ids[1]], {"activities": ["walking"], "flags": ["loitering"]})
+
+        self.sqlite.delete_frames([ids[1]])
+        self.assertEqual(self.sqlite.get_frame_counts("v")["max_people"]["frame_id"], ids[2])
+        self.assertIsNone(self.sqlite.first_appearance("v", "loitering"))
+
+class TestFrameIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index = FrameIndex(self.tmp_dir.name, refresh_interval=0, use_ann=False)
+        rng = np.random.default_rng(1)
+        # Eight places along a patrol route; every flight sees them with a little noise
+        self.places = rng.normal(size=(8, 32)).astype(np.float32)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def flight(self, video_uuid, first_id, places, noise=0.05, seed=0):
+        rng = np.random.default_rng(seed)
+        vectors = self.places[places] + noise * rng.normal(size=(len(places), 32))
+        ids = list(range(first_id, first_id + len(places)))
+        self.index.add(video_uuid, ids, [float(i) for i in range(len(places))], vectors)
+        return ids
+
+    def check_query_by_frame_across_videos(self):
+        monday = self.flight("monday", 1, [0, 1, 2, 3], seed=1)
+        tuesday = self.flight("tuesday", 11, [3, 2, 1, 0], seed=2)
+        hits = self.index.query_frame(monday[1], n_results=2)
+        self.assertEqual(hits[0]["frame_id"], tuesday[2])
+        self.assertEqual(hits[0]["video_uuid"], "tuesday")
+        self.assertGreater(hits[0]["similarity"], 0.95)
+        self.assertTrue(all(hit["video_uuid"] != "monday" for hit in hits))
+
+        # Added after the first query: indexed incrementally, and visible to another instance
+        wednesday = self.flight("wednesday", 21, [1], seed=3)
+        self.assertEqual({hit["frame_id"] for hit in self.index.query_frame(monday[1], n_results=2)},
+                         {tuesday[2], wednesday[0]})
+        other = FrameIndex(self.tmp_dir.name, refresh_interval=0)
+        self.assertEqual(other.query_frame(wednesday[0], n_results=1)[0]["frame_id"], monday[1])
+
+        self.index.delete_frames("tuesday", [tuesday[2]])
+        self.index.delete_video("wednesday")
+        self.assertEqual(self.index.query_frame(monday[1], n_results=1, min_similarity=0.9), [])
+        with self.assertRaises(ValueError):
+            self.index.query_frame(wednesday[0])
+
+    def test_query_by_frame_across_videos_exact(self):
+        self.check_query_by_frame_across_videos()
+
+    @unittest.skipIf(frame_index.hnswlib is None, "hnswlib is not installed (ann extra)")
+    def test_query_by_frame_across_videos_ann(self):
+        # ef above the index size makes the HNSW search exhaustive
+        self.index = FrameIndex(self.tmp_dir.name, refresh_interval=0, ann_ef=1000, use_ann=True)
+        self.check_query_by_frame_across_videos()
+        self.assertIsNotNone(self.index._ann)
+
+    def test_adds_to_a_loaded_index_without_rereading(self):
+        monday = self.flight("monday", 1, [0, 1], seed=1)
+        self.index.query_frame(monday[0], n_results=1)
+        reads = []
+        read = self.index._read
+        self.index._read = lambda video_uuid: reads.append(video_uuid) or read(video_uuid)
+        for i, place in enumerate([2, 3, 1]):
+            self.index.add("monday", [10 + i], [10.0 + i], self.places[place])
+        self.assertEqual(reads, [])
+        self.assertEqual(self.index.query_frame(monday[1], n_results=1, include_same_video=True)[0]["frame_id"], 12)
+
+        # Rows appended by another process are picked up from the files
+        FrameIndex(self.tmp_dir.name, use_ann=False).add("monday", [20], [20.0], self.places[0])
+        self.index.add("monday", [21], [21.0], self.places[5])
+        self.assertEqual(reads, ["monday"])
+        self.assertEqual(self.index.query_frame(monday[0], n_results=1, include_same_video=True)[0]["frame_id"], 20)
+
+    def test_compacts_labels_of_removed_frames(self):
+        self.index.COMPACT_MIN_DEAD = 2
+        monday = self.flight("monday", 1, [0, 1, 2, 3], seed=1)
+        tuesday = self.flight("tuesday", 11, [0, 1, 2, 3], seed=2)
+        self.index.query_frame(monday[0], n_results=1)
+        self.index.delete_frames("monday", monday[:3])
+        self.index.delete_video("tuesday")
+        self.assertEqual(len(self.index._labels), 1)
+        wednesday = self.flight("wednesday", 21, [3], seed=3)
+        hits = self.index.query_frame(monday[3], n_results=3)
+        self.assertEqual([hit["frame_id"] for hit in hits], [wednesday[0]])
+        with self.assertRaises(ValueError):
+            self.index.query_frame(tuesday[0])
+
+    def test_change_report_against_nearest_pass(self):
+        self.flight("old", 1, [0, 1, 2, 3, 4, 5], seed=1)
+        self.flight("other_route", 11, [6, 7], seed=2)
+        new = self.flight("new", 21, [0, 1, 2, 6], seed=3)
+        # The new flight sees place 2 with something different in it
+        changed = 0.8 * self.places[2] + 0.5 * np.linalg.norm(self.places[2]) * np.eye(32, dtype=np.float32)[0]
+        self.index.delete_frames("new", [new[2]])
+        self.index.add("new", [99], [2.0], changed)
+
+        report = self.index.change_report("new", ["other_route", "old"], match_threshold=0.8, change_threshold=0.97)
+        self.assertEqual(report["reference_uuid"], "old")
+        statuses = {frame["frame_id"]: frame["status"] for frame in report["frames"]}
+        self.assertEqual(statuses, {new[0]: "unchanged", new[1]: "unchanged", 99: "changed", new[3]: "unmatched"})
+        self.assertEqual((report["matched"], report["changed"], report["unmatched"]), (3, 1, 1))
+        self.assertEqual(self.index.change_report("new", [])["reference_uuid"], None)
+
+    def test_index_from_archive(self):
+        timestamps = np.array([0.0, 0.5, 1.0, 1.5])
+        embeddings = self.places[:4].astype(np.float16)
+        self.assertEqual(index_from_archive(self.index, "v", [(7, 0.5), (8, 1.5), (9, 9.0)], (timestamps, embeddings)), 2)
+        self.flight("w", 20, [1], seed=4)
+        self.assertEqual(self.index.query_frame(20, n_results=1)[0]["frame_id"], 7)
+
+class TestLibrarySearch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = EmbeddedVectorStore(self.tmp_dir.name)
+        rng = np.random.default_rng(2)
+        # Each video's frames cluster around its own direction, so one video fills many top hits
+        for v in range(30):
+            center = rng.normal(size=8)
+            vectors = (center + 0.01 * rng.normal(size=(20, 8))).astype(np.float32)
+            self.store.add_entries([f"v{v}_{i}" for i in range(20)], vectors, [f"v{v} frame {i}" for i in range(20)],
+                                   [{"video_uuid": f"v{v}", "frame_name": str(i), "timestamp": float(i)}
+                                    for i in range(20)])
+        self.query = rng.normal(size=8).tolist()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_pages_past_the_first_batch(self):
+        everything = search_library_page(self.store, self.query, page_size=100, batch_size=1000)
+        self.assertEqual(everything["total_videos"], 30)
+        self.assertTrue(everything["total_is_exact"])
+        order = [group["video_uuid"] for group in everything["results"]]
+
+        page = search_library_page(self.store, self.query, page=3, page_size=5, batch_size=20,
+                                   live=lambda uuids: set(uuids) - {order[0]})
+        self.assertEqual([group["video_uuid"] for group in page["results"]], order[16:21])
+        self.assertTrue(page["has_more"])
+        self.assertFalse(page["truncated"])
+        # Stopped once the page and one more video were filled: the count is a lower bound
+        first = search_library_page(self.store, self.query, page_size=5, batch_size=200)
+        self.assertFalse(first["truncated"] or first["total_is_exact"])
+        self.assertLess(first["total_videos"], 30)
+        last = search_library_page(self.store, self.query, page=5, page_size=5, batch_size=20)
+        self.assertEqual(len(last["results"]), 5)
+        self.assertFalse(last["has_more"])
+
+    def test_reports_truncation(self):
+        page = search_library_page(self.store, self.query, page=2, page_size=5, batch_size=20, max_hits=80)
+        self.assertTrue(page["truncated"])
+        self.assertLessEqual(page["total_videos"], 10)
+        self.assertFalse(page["total_is_exact"])
+
+class FakeTitleAI:
+    FALLBACK_TITLE = "Untitled Video"
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def generate_smart_title(self, descriptions, priority=RateLimiter.HIGH):
+        self.release.wait(5)
+        self.calls.append((list(descriptions), priority))
+        return self.FALLBACK_TITLE if descriptions == ["fail"] else f"Title: {descriptions[-1]}"
+
+class TestTitleWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.sqlite = SQLiteHandler(os.path.join(self.tmp_dir.name, "videos.db"))
+        self.ai = FakeTitleAI()
+        self.worker = TitleWorker(self.ai, self.sqlite)
+        for video in ("a", "empty"):
+            self.sqlite.add_video(video, f"{video}.mp4", TitleWorker.PLACEHOLDER_TITLE)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def title(self, video_uuid):
+        return self.sqlite.get_videos_by_uuids([video_uuid])[video_uuid]["smart_title"]
+
+    def test_titles_coalesce_and_keep_good_titles(self):
+        self.ai.release.clear()
+        self.worker.submit("a", ["first"])
+        time.sleep(0.1)  # "first" is in progress; the next two coalesce into the newest
+        self.worker.submit("a", ["second"])
+        self.worker.submit("a", ["third"])
+        self.ai.release.set()
+        self.assertTrue(self.worker.wait_idle(5))
+        self.assertEqual([call[0] for call in self.ai.calls], [["first"], ["third"]])
+        self.assertTrue(all(call[1] == RateLimiter.LOW for call in self.ai.calls))
+        self.assertEqual(self.title("a"), "Title: third")
+
+        # A failed refinement does not replace the earlier title
+        self.worker.submit("a", ["fail"])
+        self.assertTrue(self.worker.wait_idle(5))
+        self.assertEqual(self.title("a"), "Title: third")
+
+    def test_video_without_keyframes_gets_fallback_title(self):
+        self.worker.submit("empty", [])
+        self.assertTrue(self.worker.wait_idle(5))
+        self.assertEqual(self.title("empty"), FakeTitleAI.FALLBACK_TITLE)
+        self.assertEqual(self.ai.calls, [])
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_spacing_and_priority(self):
+        limiter = RateLimiter(min_interval=0.2)
+        limiter.acquire()
+        order = []
+
+        def request(name, priority):
+            limiter.acquire(priority)
+            order.append((name, time.time()))
+            limiter.mark()
+
+        low = threading.Thread(target=request, args=("low", RateLimiter.LOW))
+        low.start()
+        time.sleep(0.05)
+        high = threading.Thread(target=request, args=("high", RateLimiter.HIGH))
+        high.start()
+        limiter.mark()
+        low.join(5)
+        high.join(5)
+        self.assertEqual([name for name, _ in order], ["high", "low"])
+        self.assertGreaterEqual(order[1][1] - order[0][1], 0.19)
+
+class TestQueryRouter(unittest.TestCase):
+
+    def test_routes_global_questions_to_summaries(self):
+        router = QueryRouter()
+        self.assertEqual(router.route("How many people are in the video?"), "global")
+        self.assertEqual(router.route("What activities are taking place?"), "global")
+        self.assertEqual(router.route("What is the man at 12s holding?"), "frames")
+
+    def test_recognizes_aggregate_questions(self):
+        router = QueryRouter()
+        self.assertEqual(router.aggregate("How many people are in the video?"), {"op": "count", "subject": "person"})
+        self.assertEqual(router.aggregate("What was the maximum number of vehicles?"), {"op": "max", "subject": "vehicle"})
+        self.assertEqual(router.aggregate("how many people are there"), {"op": "count", "subject": "person"})
+        self.assertEqual(router.aggregate("When did a person first appear?"), {"op": "first", "subject": "person"})
+        self.assertEqual(router.aggregate("When did loitering first occur?"), {"op": "first", "subject": "loitering"})
+        self.assertEqual(router.aggregate("How many suspicious frames are there?"), {"op": "count", "subject": "suspicious"})
+        self.assertIsNone(router.aggregate("What is the man at 12s holding?"))
+
+    def test_leaves_qualified_questions_to_retrieval(self):
+        router = QueryRouter()
+        for question in ("What is the most suspicious thing the man did?",
+                         "What did the woman do most of the time?",
+                         "How many people were wearing helmets?",
+                         "How many cars are red?",
+                         "How many times did the truck stop?",
+                         "When did the truck first appear?",
+                         "What was the maximum number of cars?",
+                         "How many people entered the building after the van left?"):
+            self.assertIsNone(router.aggregate(question), question)
+
 if __name__ == '__main__':
     unittest.main()